@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+"""
+audio_utils.py
+
+Vectorized 16-bit PCM helpers shared by pepper_bridge.py (Python 2.7) and
+scenario_logic.py (Python 3). Everything works on numpy int16 arrays (or
+anything numpy can view as one, e.g. array('h') or raw bytes) without
+per-sample Python loops:
+ - multichannel -> mono mixing
+ - resampling
+ - in-memory WAV handling (mono mixdown, joining, duration from the header)
+ - per-channel levels and voice activity detection
+ - FLAC re-encoding of uploads, Ogg/FLAC decoding (optional soundfile)
+"""
+import io
+import wave
+import struct
+
+import numpy as np
+
+try:
+    # Optional: FLAC encoding of uploads, Ogg decoding (pip install soundfile)
+    import soundfile
+except ImportError:
+    soundfile = None
+
+
+INT16_MAX = 32767
+
+
+def as_int16(buf):
+    """
+    View bytes / array('h') / lists as an int16 numpy array (no copy when possible).
+    """
+    if isinstance(buf, np.ndarray):
+        return buf.astype(np.int16, copy=False)
+    if isinstance(buf, (bytes, bytearray, memoryview)):
+        return np.frombuffer(buf, dtype="<i2")
+    return np.asarray(buf, dtype=np.int16)
+
+
+def mix_to_mono(samples, n_channels):
+    """
+    Average interleaved 'n_channels' samples into one channel.
+    """
+    samples = as_int16(samples)
+    if n_channels == 1:
+        return samples
+    usable = len(samples) - (len(samples) % n_channels)
+    frames = samples[:usable].reshape(-1, n_channels)
+    # Column-wise accumulation is several times faster than sum(axis=1)
+    # on the strided int16 view.
+    acc = frames[:, 0].astype(np.int32)
+    for ch in range(1, n_channels):
+        acc += frames[:, ch]
+    acc //= n_channels
+    return acc.astype(np.int16)
+
+
+def frame_rms_db(samples, rate, frame_ms=10):
+    """
+    RMS level of consecutive 'frame_ms' frames, in dBFS.
+    """
+    samples = as_int16(samples)
+    frame_len = max(1, int(rate * frame_ms / 1000))
+    n_frames = len(samples) // frame_len
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = samples[:n_frames * frame_len].reshape(n_frames, frame_len).astype(np.float32)
+    rms = np.sqrt(np.mean(frames * frames, axis=1)) / INT16_MAX
+    return 20.0 * np.log10(np.maximum(rms, 1e-6))
+
+
+def channel_levels_db(samples, n_channels):
+    """
+    RMS level of every channel of interleaved 'n_channels' samples, in dBFS.
+    """
+    samples = as_int16(samples)
+    usable = len(samples) - (len(samples) % n_channels)
+    if usable == 0:
+        return np.full(n_channels, -120.0, dtype=np.float32)
+    frames = samples[:usable].reshape(-1, n_channels).astype(np.float32)
+    rms = np.sqrt(np.mean(frames * frames, axis=0)) / INT16_MAX
+    return 20.0 * np.log10(np.maximum(rms, 1e-6))
+
+
+def channel_speech_db(samples, n_channels, rate, frame_ms=10, percentile=90):
+    """
+    Speech level of every channel of interleaved 'n_channels' samples: the
+    'percentile'-th of its frame levels (dBFS), i.e. its loud frames.
+    """
+    samples = as_int16(samples)
+    levels = []
+    for ch in range(n_channels):
+        frames = frame_rms_db(samples[ch::n_channels], rate, frame_ms)
+        levels.append(np.percentile(frames, percentile) if len(frames) else -120.0)
+    return np.array(levels, dtype=np.float32)
+
+
+def resample(samples, src_rate, dst_rate):
+    """
+    Resample by linear interpolation. When downsampling, a moving-average
+    low-pass is applied first to limit aliasing.
+    """
+    samples = as_int16(samples)
+    if src_rate == dst_rate or len(samples) == 0:
+        return samples
+    x = samples.astype(np.float32)
+    if dst_rate < src_rate:
+        width = int(np.ceil(src_rate / float(dst_rate)))
+        if width > 1:
+            x = np.convolve(x, np.ones(width, dtype=np.float32) / width, mode="same")
+    n_out = int(round(len(x) * dst_rate / float(src_rate)))
+    src_pos = np.arange(n_out, dtype=np.float64) * (src_rate / float(dst_rate))
+    out = np.interp(src_pos, np.arange(len(x)), x)
+    return np.clip(out, -INT16_MAX - 1, INT16_MAX).astype(np.int16)
+
+
+# ------------------------------------------------------------------------------
+# WAV files
+# ------------------------------------------------------------------------------
+def read_wav_samples(wav_path):
+    """
+    Return (int16 samples, frame rate, channel count) of a 16-bit WAV file
+    (a path or a file object, e.g. io.BytesIO).
+    """
+    w_in = wave.open(wav_path, "rb")
+    try:
+        if w_in.getsampwidth() != 2:
+            raise ValueError("Only 16-bit PCM is supported.")
+        data = w_in.readframes(w_in.getnframes())
+        return np.frombuffer(data, dtype="<i2"), w_in.getframerate(), w_in.getnchannels()
+    finally:
+        w_in.close()
+
+
+# ------------------------------------------------------------------------------
+# Voice activity detection
+# ------------------------------------------------------------------------------
+def frame_zero_crossing_rate(samples, rate, frame_ms=10):
+    """
+    Fraction of sign changes inside consecutive 'frame_ms' frames.
+    """
+    samples = as_int16(samples)
+    frame_len = max(2, int(rate * frame_ms / 1000))
+    n_frames = len(samples) // frame_len
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = samples[:n_frames * frame_len].reshape(n_frames, frame_len)
+    signs = np.signbit(frames)
+    crossings = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1)
+    return crossings.astype(np.float32) / (frame_len - 1)
+
+
+class EnergyVAD(object):
+    """
+    Energy + zero-crossing voice activity detector.
+
+    A frame counts as speech when it is 'margin_db' above the noise floor
+    and its zero-crossing rate is below 'max_zcr' (broadband hiss and fan
+    noise cross zero far more often than voiced speech). A chunk is speech
+    when it holds at least 'min_speech_ms' of such frames.
+
+    The noise floor comes from calibrate() and then tracks the room slowly:
+    every chunk judged silent nudges it towards the chunk's median level.
+    """
+
+    def __init__(self, margin_db=10.0, min_level_db=-55.0, max_zcr=0.35,
+                 min_speech_ms=150, frame_ms=10, adapt_rate=0.1):
+        self.margin_db = margin_db
+        self.min_level_db = min_level_db
+        self.max_zcr = max_zcr
+        self.min_speech_ms = min_speech_ms
+        self.frame_ms = frame_ms
+        self.adapt_rate = adapt_rate
+        self.noise_floor_db = -60.0
+        self.calibrated = False
+
+    def calibrate(self, samples, rate):
+        """
+        Set the noise floor from a capture of the quiet room.
+        """
+        levels = frame_rms_db(samples, rate, self.frame_ms)
+        if len(levels) == 0:
+            return self.noise_floor_db
+        self.noise_floor_db = float(np.percentile(levels, 50))
+        self.calibrated = True
+        return self.noise_floor_db
+
+    def threshold_db(self):
+        return max(self.noise_floor_db + self.margin_db, self.min_level_db)
+
+    def speech_ms(self, samples, rate):
+        levels = frame_rms_db(samples, rate, self.frame_ms)
+        zcr = frame_zero_crossing_rate(samples, rate, self.frame_ms)
+        n = min(len(levels), len(zcr))
+        voiced = (levels[:n] > self.threshold_db()) & (zcr[:n] < self.max_zcr)
+        return int(np.count_nonzero(voiced)) * self.frame_ms, levels
+
+    def is_speech(self, samples, rate):
+        """
+        True if the chunk contains enough speech-like frames to be worth
+        sending to STT. Silent chunks update the noise floor.
+        """
+        voiced_ms, levels = self.speech_ms(samples, rate)
+        if voiced_ms >= self.min_speech_ms:
+            return True
+        self.adapt(levels)
+        return False
+
+    def adapt(self, levels):
+        """
+        Move the noise floor towards the median of 'levels' (dBFS per frame).
+        """
+        if len(levels):
+            chunk_level = float(np.median(levels))
+            self.noise_floor_db += self.adapt_rate * (chunk_level - self.noise_floor_db)
+
+
+def pcm_to_wav_bytes(samples, rate, n_channels=1):
+    """
+    Wrap int16 PCM in a WAV header, in memory.
+    """
+    buf = io.BytesIO()
+    w_out = wave.open(buf, "wb")
+    w_out.setnchannels(n_channels)
+    w_out.setsampwidth(2)
+    w_out.setframerate(rate)
+    w_out.writeframes(as_int16(samples).tobytes())
+    w_out.close()
+    return buf.getvalue()
+
+
+def mix_wav_bytes_to_mono(wav_bytes):
+    """
+    Mix a multichannel 16-bit WAV held in memory down to mono WAV bytes.
+    """
+    samples, rate, n_channels = read_wav_samples(io.BytesIO(wav_bytes))
+    if n_channels == 1:
+        return wav_bytes
+    return pcm_to_wav_bytes(mix_to_mono(samples, n_channels), rate)
+
+
+def concat_wav_bytes(wavs):
+    """
+    Join in-memory WAVs of the same format into one WAV.
+    """
+    if len(wavs) == 1:
+        return wavs[0]
+    params = None
+    frames = []
+    for data in wavs:
+        w_in = wave.open(io.BytesIO(data), "rb")
+        try:
+            wav_params = (w_in.getnchannels(), w_in.getsampwidth(), w_in.getframerate())
+            if params is None:
+                params = wav_params
+            elif wav_params != params:
+                raise ValueError("Cannot join WAVs of different formats.")
+            frames.append(w_in.readframes(w_in.getnframes()))
+        finally:
+            w_in.close()
+
+    buf = io.BytesIO()
+    w_out = wave.open(buf, "wb")
+    w_out.setnchannels(params[0])
+    w_out.setsampwidth(params[1])
+    w_out.setframerate(params[2])
+    w_out.writeframes(b"".join(frames))
+    w_out.close()
+    return buf.getvalue()
+
+
+def wav_header_duration(wav_bytes):
+    """
+    Duration in seconds of PCM WAV bytes, read from the fmt / data chunk
+    headers (the samples are neither parsed nor copied).
+    """
+    if wav_bytes[:4] != b"RIFF" or wav_bytes[8:12] != b"WAVE":
+        raise ValueError("Not a RIFF/WAVE file.")
+    byte_rate = None
+    pos = 12
+    while pos + 8 <= len(wav_bytes):
+        chunk_id = wav_bytes[pos:pos + 4]
+        chunk_size = struct.unpack("<I", wav_bytes[pos + 4:pos + 8])[0]
+        if chunk_id == b"fmt ":
+            byte_rate = struct.unpack("<I", wav_bytes[pos + 16:pos + 20])[0]
+        elif chunk_id == b"data":
+            if not byte_rate:
+                raise ValueError("WAV data chunk before its fmt chunk.")
+            # Streamed WAVs may leave the size unset (0 or 0xFFFFFFFF)
+            available = len(wav_bytes) - pos - 8
+            data_size = chunk_size if 0 < chunk_size <= available else available
+            return data_size / float(byte_rate)
+        pos += 8 + chunk_size + (chunk_size & 1)
+    raise ValueError("WAV file has no data chunk.")
+
+
+def wav_bytes_to_flac(wav_bytes):
+    """
+    Re-encode an in-memory WAV as FLAC (lossless, roughly half the size for
+    speech). Returns None when the optional soundfile package is missing.
+    """
+    if soundfile is None:
+        return None
+    samples, rate = soundfile.read(io.BytesIO(wav_bytes), dtype="int16")
+    buf = io.BytesIO()
+    soundfile.write(buf, samples, rate, format="FLAC", subtype="PCM_16")
+    return buf.getvalue()
+
+
+def audio_format(data):
+    """
+    "wav", "flac" or "ogg" from the magic bytes of an in-memory audio file
+    (None if unknown).
+    """
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        return "wav"
+    if data[:4] == b"fLaC":
+        return "flac"
+    if data[:4] == b"OggS":
+        return "ogg"
+    return None
+
+
+def is_ogg_vorbis(data):
+    """
+    True for Ogg/Vorbis (what ALAudioRecorder writes for "ogg"), as opposed
+    to Ogg/Opus. The first page carries the codec's identification header.
+    """
+    return data[:4] == b"OggS" and b"\x01vorbis" in data[:64]
+
+
+def read_audio_samples(data):
+    """
+    (int16 samples, frame rate, channel count) of an in-memory WAV, or of
+    FLAC / Ogg when the optional soundfile package is installed. Returns None
+    when the audio cannot be decoded here.
+    """
+    if audio_format(data) == "wav":
+        return read_wav_samples(io.BytesIO(data))
+    if soundfile is None:
+        return None
+    samples, rate = soundfile.read(io.BytesIO(data), dtype="int16", always_2d=True)
+    return samples.reshape(-1), rate, samples.shape[1]
+
+
+def compressed_to_wav(data, rate=None):
+    """
+    Decode in-memory FLAC / Ogg audio to mono 16-bit WAV bytes, resampled to
+    'rate' if given. Returns None when the optional soundfile package is
+    missing.
+    """
+    decoded = read_audio_samples(data)
+    if decoded is None:
+        return None
+    samples, src_rate, n_channels = decoded
+    mono = mix_to_mono(samples, n_channels)
+    if rate is not None and rate != src_rate:
+        mono, src_rate = resample(mono, src_rate, rate), rate
+    return pcm_to_wav_bytes(mono, src_rate)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+fake_server.py
+
+scenario_logic.py with Google STT/TTS and OpenAI replaced by the mock
+backends of fakes.py, served exactly like production (werkzeug's
+threaded server). Used by load_test.py;
+also handy for pointing a real bridge at a server that costs nothing.
+
+Usage:
+  python3 benchmark/fake_server.py [--port 5000] [--profile default]
+"""
+import os
+import sys
+import tempfile
+from argparse import ArgumentParser
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import fakes  # noqa: E402
+
+
+def main():
+    parser = ArgumentParser(description="scenario_logic.py with mocked cloud backends")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--profile", default="default", help="latency profile name or JSON file")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    profile = fakes.load_profile(args.profile)
+    os.environ.setdefault("TTS_CACHE_DIR", tempfile.mkdtemp(prefix="naochat_tts_cache_"))
+    robot = fakes.FakeRobot(fakes.Latencies(profile, args.seed), fakes.load_fixtures(None))
+    fakes.install(robot)
+
+    import scenario_logic
+    print("[fake_server] Serving on {}:{} with the '{}' profile".format(args.host, args.port, args.profile))
+    sys.stdout.flush()
+    scenario_logic.run_server(args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
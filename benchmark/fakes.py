@@ -0,0 +1,713 @@
+# -*- coding: utf-8 -*-
+"""
+fakes.py
+
+Local stand-ins for everything the turn loop talks to, so the whole
+pipeline can run on one machine without a robot or cloud credentials:
+ - naoqi: ALBroker / ALModule / ALProxy (audio device, recorder, player,
+   behavior manager and no-op proxies for the rest)
+ - paramiko: an SSH client whose SFTP channels write to the fake robot's disk
+ - google.cloud.texttospeech / speech and openai: mock backends
+
+All of them share one FakeRobot, whose simulated user answers every time
+the robot has finished talking. Each remote call sleeps for a latency drawn
+from the active profile (see PROFILES).
+
+install(robot) must run before pepper_bridge / scenario_logic are
+imported.
+"""
+import io
+import math
+import sys
+import time
+import types
+import wave
+import random
+import threading
+import itertools
+
+import numpy as np
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+
+# ------------------------------------------------------------------------------
+# Latency profiles: stage -> [median_ms, p95_ms] (log-normal)
+# ------------------------------------------------------------------------------
+PROFILES = {
+    "default": {
+        "naoqi_call": [4, 12],
+        "sftp_connect": [180, 450],
+        "sftp_transfer": [25, 90],
+        "stt_batch": [700, 1400],
+        "stt_final": [250, 600],
+        "llm_first_token": [650, 1600],
+        "llm_token": [20, 45],
+        "tts": [350, 900],
+    },
+    "fast": {
+        "naoqi_call": [1, 3],
+        "sftp_connect": [20, 40],
+        "sftp_transfer": [5, 15],
+        "stt_batch": [150, 300],
+        "stt_final": [60, 120],
+        "llm_first_token": [150, 300],
+        "llm_token": [5, 10],
+        "tts": [80, 160],
+    },
+    "slow": {
+        "naoqi_call": [10, 40],
+        "sftp_connect": [400, 1200],
+        "sftp_transfer": [80, 300],
+        "stt_batch": [1200, 3000],
+        "stt_final": [500, 1500],
+        "llm_first_token": [1500, 4000],
+        "llm_token": [35, 90],
+        "tts": [700, 2000],
+    },
+}
+
+# Robot-side transfer rate and seconds of synthesized speech per character
+SFTP_BYTES_PER_SECOND = 4 * 1024 * 1024
+TTS_SECONDS_PER_CHAR = 0.06
+TTS_SAMPLE_RATE = 24000
+MIC_RATE = 16000
+MIC_CHUNK_SECONDS = 0.17
+
+# Mock LLM replies; {n} keeps every reply distinct so the TTS cache does not
+# serve what a real model would have phrased differently
+REPLIES = [
+    u"Harika bir fikir, bu {n}. önerimiz! Kalemi bir bitkiye destek çubuğu olarak da kullanabiliriz. Sence başka ne olabilir?",
+    u"Çok yaratıcı, {n}. fikir de geldi. Ben de onu bir yer imi gibi kullanmayı önerirdim. Başka bir fikrin var mı?",
+    u"Güzel düşünmüşsün, bu da {n}. fikir! Bence bir davul çubuğu da olabilir. Sen ne dersin?",
+]
+TRANSCRIPTS = [
+    u"kalemle saçımı toplayabilirim",
+    u"şişeyi saksı olarak kullanabiliriz",
+    u"bir müzik aleti yapabiliriz",
+    u"kuşlar için yemlik olabilir",
+]
+
+
+def load_profile(name):
+    """
+    A named profile, or a JSON file of stage -> [median_ms, p95_ms]
+    overriding the default profile.
+    """
+    if name in PROFILES:
+        return dict(PROFILES[name])
+    import json
+    with open(name) as f:
+        profile = dict(PROFILES["default"])
+        profile.update(json.load(f))
+        return profile
+
+
+class LatencyModel(object):
+    """
+    Log-normal latency with the given median and 95th percentile (ms).
+    """
+
+    def __init__(self, median_ms, p95_ms, rng):
+        self.median = median_ms / 1000.0
+        self.sigma = math.log(max(p95_ms, median_ms) / float(median_ms)) / 1.645 if median_ms > 0 else 0.0
+        self.rng = rng
+
+    def sample(self):
+        if self.median <= 0:
+            return 0.0
+        return self.median * math.exp(self.sigma * self.rng.gauss(0.0, 1.0))
+
+    def sleep(self, extra=0.0):
+        time.sleep(self.sample() + extra)
+
+
+class Latencies(object):
+    def __init__(self, profile, seed=0):
+        rng = random.Random(seed)
+        self.models = dict((stage, LatencyModel(v[0], v[1], rng)) for stage, v in profile.items())
+
+    def __getattr__(self, stage):
+        try:
+            return self.models[stage]
+        except KeyError:
+            raise AttributeError(stage)
+
+
+# ------------------------------------------------------------------------------
+# Audio fixtures
+# ------------------------------------------------------------------------------
+def wav_bytes(samples, rate, n_channels=1):
+    buf = io.BytesIO()
+    w = wave.open(buf, "wb")
+    w.setnchannels(n_channels)
+    w.setsampwidth(2)
+    w.setframerate(rate)
+    w.writeframes(np.asarray(samples, dtype=np.int16).tobytes())
+    w.close()
+    return buf.getvalue()
+
+
+def ogg_bytes(samples, rate, n_channels=1):
+    """
+    Ogg/Vorbis like ALAudioRecorder's "ogg"; WAV when soundfile is missing.
+    """
+    if soundfile is None:
+        return wav_bytes(samples, rate, n_channels)
+    buf = io.BytesIO()
+    frames = np.asarray(samples, dtype=np.int16).reshape(-1, n_channels)
+    soundfile.write(buf, frames, rate, format="OGG", subtype="VORBIS")
+    return buf.getvalue()
+
+
+def wav_duration(data):
+    w = wave.open(io.BytesIO(data), "rb")
+    try:
+        return w.getnframes() / float(w.getframerate())
+    finally:
+        w.close()
+
+
+def synth_utterance(seconds=1.6, rate=MIC_RATE, seed=0):
+    """
+    Speech-like test signal: a 140 Hz harmonic voice, amplitude-modulated at
+    syllable rate. Loud and low in zero crossings, so the VAD takes it as speech.
+    """
+    rng = np.random.RandomState(seed)
+    t = np.arange(int(seconds * rate)) / float(rate)
+    voice = sum(np.sin(2 * np.pi * 140 * k * t) / k for k in range(1, 6))
+    envelope = 0.55 + 0.45 * np.sin(2 * np.pi * 4.0 * t + rng.uniform(0, np.pi))
+    signal = 0.25 * voice * envelope + 0.003 * rng.randn(len(t))
+    return (np.clip(signal, -1, 1) * 32767).astype(np.int16)
+
+
+def load_fixtures(fixture_dir):
+    """
+    [(int16 mono samples at 16 kHz, transcript)] from the WAV files in
+    'fixture_dir' (transcript from a same-named .txt file when present),
+    or synthesized utterances when no directory is given.
+    """
+    import os
+    from audio_utils import mix_to_mono, read_wav_samples, resample
+
+    if not fixture_dir:
+        return [(synth_utterance(1.2 + 0.3 * i, seed=i), text) for i, text in enumerate(TRANSCRIPTS)]
+
+    fixtures = []
+    for name in sorted(os.listdir(fixture_dir)):
+        if not name.lower().endswith(".wav"):
+            continue
+        samples, rate, channels = read_wav_samples(os.path.join(fixture_dir, name))
+        samples = resample(mix_to_mono(samples, channels), rate, MIC_RATE)
+        text_path = os.path.join(fixture_dir, os.path.splitext(name)[0] + ".txt")
+        text = TRANSCRIPTS[len(fixtures) % len(TRANSCRIPTS)]
+        if os.path.exists(text_path):
+            with io.open(text_path, encoding="utf-8") as f:
+                text = f.read().strip()
+        fixtures.append((samples, text))
+    if not fixtures:
+        raise ValueError("No WAV fixtures in {}".format(fixture_dir))
+    return fixtures
+
+
+# ------------------------------------------------------------------------------
+# Simulated robot + user
+# ------------------------------------------------------------------------------
+class FakeMicrophone(object):
+    """
+    Real-time microphone feed: room noise, and a fixture utterance whenever
+    the simulated user decides to answer. Buffers go to ALAudioDevice
+    subscribers and to an active ALAudioRecorder capture.
+    """
+
+    def __init__(self, robot, fixtures, think_seconds):
+        self.robot = robot
+        self.fixtures = itertools.cycle(fixtures)
+        self.think_seconds = think_seconds
+        self.subscribers = []
+        self.recording = None
+        self._utterance = None
+        self._rng = np.random.RandomState(1)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _next_chunk(self, n):
+        robot = self.robot
+        if self._utterance is None and robot.awaiting_user and \
+                time.time() - robot.speaking_until >= self.think_seconds:
+            samples, text = next(self.fixtures)
+            self._utterance = samples
+            robot.user_spoke(text)
+        noise = (self._rng.randn(n) * 25).astype(np.int16)
+        if self._utterance is None:
+            return noise
+        chunk, self._utterance = self._utterance[:n], self._utterance[n:]
+        if len(self._utterance) == 0:
+            self._utterance = None
+        if len(chunk) < n:
+            chunk = np.concatenate([chunk, noise[len(chunk):]])
+        return chunk
+
+    def _run(self):
+        n = int(MIC_RATE * MIC_CHUNK_SECONDS)
+        next_t = time.time()
+        while not self._stopped.is_set():
+            chunk = self._next_chunk(n)
+            data = chunk.tobytes()
+            for module in list(self.subscribers):
+                try:
+                    module.processRemote(1, n, [int(next_t), 0], data)
+                except Exception as e:
+                    print("[FakeMicrophone] processRemote error:", e)
+            if self.recording is not None:
+                self.recording.append(chunk)
+            next_t += MIC_CHUNK_SECONDS
+            time.sleep(max(0.0, next_t - time.time()))
+
+
+class FakeRobot(object):
+    """
+    Shared state of the simulation: the robot's disk, registered modules,
+    when the robot last talked and what the user last said.
+    """
+
+    def __init__(self, latencies, fixtures, think_seconds=1.0, behaviors=()):
+        self.latencies = latencies
+        self.files = {}
+        self.modules = {}
+        self.installed_behaviors = list(behaviors)
+        self.speaking_until = 0.0
+        self.awaiting_user = False
+        self.last_transcript = TRANSCRIPTS[0]
+        self.utterances = 0
+        self.lock = threading.Lock()
+        self.mic = FakeMicrophone(self, fixtures, think_seconds)
+
+    def robot_spoke(self, seconds):
+        with self.lock:
+            self.speaking_until = max(self.speaking_until, time.time()) + seconds
+            self.awaiting_user = True
+
+    def user_spoke(self, transcript):
+        with self.lock:
+            self.awaiting_user = False
+            self.last_transcript = transcript
+            self.utterances += 1
+
+    def read_file(self, path):
+        with self.lock:
+            if path not in self.files:
+                raise IOError("No such file: {}".format(path))
+            return self.files[path]
+
+    def write_file(self, path, data):
+        with self.lock:
+            self.files[path] = data
+
+
+_robot = None
+
+
+# ------------------------------------------------------------------------------
+# naoqi
+# ------------------------------------------------------------------------------
+class _Tasks(object):
+    """
+    Background tasks behind ALProxy.post.* calls.
+    """
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._tasks = {}
+
+    def start(self, fn, *args):
+        task_id = next(self._ids)
+        cancel = threading.Event()
+        t = threading.Thread(target=fn, args=args + (cancel,))
+        t.daemon = True
+        self._tasks[task_id] = (t, cancel, args)
+        t.start()
+        return task_id
+
+    def wait(self, task_id, timeout_ms):
+        entry = self._tasks.get(task_id)
+        if entry is None:
+            return True
+        entry[0].join(timeout_ms / 1000.0 if timeout_ms > 0 else None)
+        return not entry[0].is_alive()
+
+    def stop(self, task_id=None, match=None):
+        for tid, (t, cancel, args) in list(self._tasks.items()):
+            if tid == task_id or (match is not None and args and args[0] == match):
+                cancel.set()
+
+
+class _Post(object):
+    def __init__(self, proxy):
+        self._proxy = proxy
+
+    def __getattr__(self, name):
+        fn = getattr(self._proxy, "_task_" + name)
+        return lambda *args: self._proxy._tasks.start(fn, *args)
+
+
+class FakeProxy(object):
+    """
+    Generic proxy: every call costs one naoqi round trip and does nothing.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._tasks = _Tasks()
+        self.post = _Post(self)
+
+    def _rpc(self):
+        _robot.latencies.naoqi_call.sleep()
+
+    def __getattr__(self, method):
+        if method.startswith("_"):
+            raise AttributeError(method)
+
+        def call(*args):
+            self._rpc()
+        return call
+
+    def wait(self, task_id, timeout_ms=0):
+        return self._tasks.wait(task_id, timeout_ms)
+
+    def stop(self, task_id):
+        self._rpc()
+        self._tasks.stop(task_id)
+
+
+class FakeAudioPlayer(FakeProxy):
+    def __init__(self, name):
+        FakeProxy.__init__(self, name)
+        self._loaded = {}
+        self._ids = itertools.count(1)
+
+    def _play_seconds(self, seconds, cancel=None):
+        _robot.robot_spoke(seconds)
+        if cancel is None:
+            time.sleep(seconds)
+        else:
+            cancel.wait(seconds)
+
+    def playFile(self, path):
+        self._rpc()
+        self._play_seconds(wav_duration(_robot.read_file(path)))
+
+    def loadFile(self, path):
+        self._rpc()
+        file_id = next(self._ids)
+        self._loaded[file_id] = wav_duration(_robot.read_file(path))
+        return file_id
+
+    def play(self, file_id):
+        self._rpc()
+        self._play_seconds(self._loaded[file_id])
+
+    def _task_play(self, file_id, cancel):
+        self._play_seconds(self._loaded[file_id], cancel)
+
+    def unloadAllFiles(self):
+        self._rpc()
+        self._loaded = {}
+
+
+class FakeBehaviorManager(FakeProxy):
+    behavior_seconds = 3.0
+
+    def getInstalledBehaviors(self):
+        self._rpc()
+        return list(_robot.installed_behaviors)
+
+    def _task_runBehavior(self, name, cancel):
+        cancel.wait(self.behavior_seconds)
+
+    def runBehavior(self, name):
+        self._rpc()
+        self._task_runBehavior(name, threading.Event())
+
+    def stopBehavior(self, name):
+        self._rpc()
+        self._tasks.stop(match=name)
+
+
+class FakeAudioRecorder(FakeProxy):
+    def startMicrophonesRecording(self, path, fmt, rate, channels):
+        self._rpc()
+        self._path, self._fmt, self._channels = path, fmt, sum(channels)
+        _robot.mic.recording = []
+
+    def stopMicrophonesRecording(self):
+        self._rpc()
+        chunks, _robot.mic.recording = _robot.mic.recording, None
+        if chunks is None:
+            raise RuntimeError("ALAudioRecorder: not recording")
+        mono = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int16)
+        interleaved = np.repeat(mono, self._channels)
+        encode = ogg_bytes if self._fmt == "ogg" else wav_bytes
+        _robot.write_file(self._path, encode(interleaved, MIC_RATE, self._channels))
+
+
+class FakeAudioDevice(FakeProxy):
+    def subscribe(self, module_name):
+        self._rpc()
+        _robot.mic.subscribers.append(_robot.modules[module_name])
+
+    def unsubscribe(self, module_name):
+        self._rpc()
+        module = _robot.modules.get(module_name)
+        if module in _robot.mic.subscribers:
+            _robot.mic.subscribers.remove(module)
+
+
+PROXY_CLASSES = {
+    "ALAudioPlayer": FakeAudioPlayer,
+    "ALBehaviorManager": FakeBehaviorManager,
+    "ALAudioRecorder": FakeAudioRecorder,
+    "ALAudioDevice": FakeAudioDevice,
+}
+
+
+def ALProxy(name, *address):
+    return PROXY_CLASSES.get(name, FakeProxy)(name)
+
+
+class ALModule(object):
+    def __init__(self, name):
+        _robot.modules[name] = self
+
+
+class ALBroker(object):
+    def __init__(self, name, ip, port, pip, pport):
+        self.name = name
+
+    def shutdown(self):
+        pass
+
+
+# ------------------------------------------------------------------------------
+# paramiko
+# ------------------------------------------------------------------------------
+class SSHException(Exception):
+    pass
+
+
+class AutoAddPolicy(object):
+    pass
+
+
+class _Stat(object):
+    def __init__(self, size):
+        self.st_size = size
+
+
+class FakeSFTP(object):
+    def _transfer(self, n_bytes):
+        _robot.latencies.sftp_transfer.sleep(n_bytes / float(SFTP_BYTES_PER_SECOND))
+
+    def put(self, local_path, remote_path):
+        with open(local_path, "rb") as f:
+            data = f.read()
+        self._transfer(len(data))
+        _robot.write_file(remote_path, data)
+
+    def putfo(self, fl, remote_path):
+        data = fl.read()
+        self._transfer(len(data))
+        _robot.write_file(remote_path, data)
+        return _Stat(len(data))
+
+    def get(self, remote_path, local_path):
+        data = _robot.read_file(remote_path)
+        self._transfer(len(data))
+        with open(local_path, "wb") as f:
+            f.write(data)
+
+    def getfo(self, remote_path, fl):
+        data = _robot.read_file(remote_path)
+        self._transfer(len(data))
+        fl.write(data)
+        return len(data)
+
+    def stat(self, remote_path):
+        _robot.latencies.naoqi_call.sleep()
+        return _Stat(len(_robot.read_file(remote_path)))
+
+    def close(self):
+        pass
+
+
+class _Transport(object):
+    def __init__(self):
+        self.active = True
+
+    def set_keepalive(self, seconds):
+        pass
+
+    def is_active(self):
+        return self.active
+
+
+class SSHClient(object):
+    def __init__(self):
+        self._transport = None
+
+    def set_missing_host_key_policy(self, policy):
+        pass
+
+    def connect(self, host, username=None, password=None, **kwargs):
+        _robot.latencies.sftp_connect.sleep()
+        self._transport = _Transport()
+
+    def get_transport(self):
+        return self._transport
+
+    def open_sftp(self):
+        return FakeSFTP()
+
+    def close(self):
+        if self._transport is not None:
+            self._transport.active = False
+
+
+# ------------------------------------------------------------------------------
+# Google Cloud TTS / STT and OpenAI
+# ------------------------------------------------------------------------------
+class _NS(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class _AudioEncoding(object):
+    ENCODING_UNSPECIFIED = 0
+    LINEAR16 = 1
+    FLAC = 2
+    OGG_OPUS = 6
+
+
+class RecognitionConfig(_NS):
+    AudioEncoding = _AudioEncoding
+
+
+class TextToSpeechClient(object):
+    def list_voices(self, **kwargs):
+        return []
+
+    def synthesize_speech(self, input, voice, audio_config, **kwargs):
+        _robot.latencies.tts.sleep()
+        n = int(len(input.text) * TTS_SECONDS_PER_CHAR * TTS_SAMPLE_RATE)
+        return _NS(audio_content=wav_bytes(np.zeros(n, dtype=np.int16), TTS_SAMPLE_RATE))
+
+
+def _result(transcript, is_final, stability):
+    return _NS(results=[_NS(is_final=is_final, stability=stability,
+                            alternatives=[_NS(transcript=transcript)])])
+
+
+class SpeechClient(object):
+    def recognize(self, config, audio, **kwargs):
+        _robot.latencies.stt_batch.sleep()
+        return _NS(results=[_NS(alternatives=[_NS(transcript=_robot.last_transcript)])])
+
+    def streaming_recognize(self, config, requests, **kwargs):
+        """
+        Interim hypotheses grow word by word while audio arrives; the final
+        result comes 'stt_final' after the stream ends.
+        """
+        words = _robot.last_transcript.split()
+        n_bytes = 0
+        shown = 0
+        for r in requests:
+            n_bytes += len(r.audio_content)
+            # Roughly one word per 0.4 s of 16 kHz audio
+            heard = min(len(words), int(n_bytes / (MIC_RATE * 2 * 0.4)))
+            if heard > shown:
+                shown = heard
+                yield _result(" ".join(words[:shown]), False, 0.6 + 0.3 * shown / len(words))
+        _robot.latencies.stt_final.sleep()
+        yield _result(_robot.last_transcript, True, 1.0)
+
+
+class _Completions(object):
+    def __init__(self):
+        self._counter = itertools.count(1)
+
+    def create(self, model=None, messages=None, stream=False, **kwargs):
+        n = next(self._counter)
+        reply = REPLIES[n % len(REPLIES)].format(n=n)
+        latencies = _robot.latencies
+        if not stream:
+            latencies.llm_first_token.sleep(sum(latencies.llm_token.sample() for _ in reply.split()))
+            return _NS(choices=[_NS(message=_NS(content=reply))])
+
+        # Like the real API, create() returns once the first token is ready
+        latencies.llm_first_token.sleep()
+
+        def chunks():
+            for i, word in enumerate(reply.split(" ")):
+                if i:
+                    latencies.llm_token.sleep()
+                yield _NS(choices=[_NS(delta=_NS(content=(" " if i else "") + word))])
+        return chunks()
+
+
+class OpenAI(object):
+    def __init__(self, **kwargs):
+        self.chat = _NS(completions=_Completions())
+        self.models = _NS(list=lambda **kw: [])
+
+    def with_options(self, **kwargs):
+        return self
+
+
+# ------------------------------------------------------------------------------
+# Installation
+# ------------------------------------------------------------------------------
+def _module(name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+    return module
+
+
+def install(robot):
+    """
+    Register the fake naoqi, paramiko, google.cloud and openai modules
+    (replacing real ones, so nothing leaves this machine) bound to 'robot'.
+    """
+    global _robot
+    _robot = robot
+
+    _module("naoqi", ALBroker=ALBroker, ALModule=ALModule, ALProxy=ALProxy)
+    _module("paramiko", SSHClient=SSHClient, AutoAddPolicy=AutoAddPolicy, SSHException=SSHException)
+
+    texttospeech = _module(
+        "google.cloud.texttospeech",
+        TextToSpeechClient=TextToSpeechClient, SynthesisInput=_NS, VoiceSelectionParams=_NS,
+        AudioConfig=_NS, SsmlVoiceGender=_NS(NEUTRAL=0), AudioEncoding=_AudioEncoding
+    )
+    speech = _module(
+        "google.cloud.speech",
+        SpeechClient=SpeechClient, RecognitionConfig=RecognitionConfig, RecognitionAudio=_NS,
+        StreamingRecognitionConfig=_NS, StreamingRecognizeRequest=_NS
+    )
+    cloud = _module("google.cloud", texttospeech=texttospeech, speech=speech)
+    cloud.__path__ = []
+    google = _module("google", cloud=cloud)
+    google.__path__ = []
+
+    _module("openai", OpenAI=OpenAI)
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+load_test.py
+
+Multi-robot load generator for scenario_logic.py. Starts fake_server.py
+(the real app with mocked Google/OpenAI backends) in a subprocess, or
+targets --url, and runs N simulated bridges against it at each
+concurrency level. Every client follows the bridge's cadence:
+/startScenario, then turns of "record (RECORD_SECONDS + think time) ->
+upload -> play the reply", with idle prompts and late-reply filler
+requests fetched through /ttsBytes like older bridges did.
+
+Per level it reports throughput, client latency (p50/p95/p99), server
+queueing delay (from X-Request-Start) and mean stage times, error rates,
+and server memory / session growth. Because the mocked backends have a
+fixed latency distribution, stage times that grow with concurrency point
+at contention inside the server (worker threads, executors, locks).
+
+Usage:
+  python3 benchmark/load_test.py [--levels 1,2,4,8,16] [--duration 30]
+      [--profile default] [--stream] [--url http://host:5000]
+"""
+import os
+import sys
+import io
+import re
+import json
+import time
+import uuid
+import random
+import socket
+import threading
+import subprocess
+from argparse import ArgumentParser
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import fakes  # noqa: E402
+from run_benchmark import distribution, git_revision  # noqa: E402
+
+# Cadence of the bridge (pepper_bridge.py)
+RECORD_SECONDS = 3.0
+IDLE_TIMEOUT = 15.0
+FILLER_DELAY = 2.0
+IDLE_LINE = u"Sen düşün, ben beklerim."
+FILLER_LINE = u"Bir saniye"
+STREAM_CHUNK_SECONDS = 0.17
+
+
+def free_port():
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def process_rss_mb(pid):
+    """
+    Resident memory of 'pid' in MB (Linux /proc), or None.
+    """
+    try:
+        with open("/proc/{}/status".format(pid)) as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024.0, 1)
+    except (IOError, OSError):
+        return None
+
+
+def scrape_metrics(base_url):
+    """
+    {stage: (sum_seconds, count)} and the scalar metrics of /metrics.
+    """
+    stages, scalars = {}, {}
+    try:
+        text = requests.get(base_url + "/metrics", timeout=10).text
+    except requests.RequestException:
+        return stages, scalars
+    for line in text.splitlines():
+        m = re.match(r'naochat_stage_seconds_(sum|count)\{stage="([^"]+)"\} ([0-9.e+-]+)$', line)
+        if m:
+            kind, stage, value = m.groups()
+            entry = stages.setdefault(stage, [0.0, 0])
+            entry[0 if kind == "sum" else 1] = float(value)
+            continue
+        m = re.match(r'(naochat_(?:sessions|tts_cache_\w+)) ([0-9.e+-]+)$', line)
+        if m:
+            scalars[m.group(1)] = float(m.group(2))
+    return stages, scalars
+
+
+def stage_means(before, after):
+    """
+    Mean ms per stage over the requests between two scrapes.
+    """
+    means = {}
+    for stage, (total, count) in after.items():
+        prev_total, prev_count = before.get(stage, (0.0, 0))
+        if count > prev_count:
+            means[stage] = {"count": int(count - prev_count),
+                            "mean_ms": round((total - prev_total) * 1000.0 / (count - prev_count), 1)}
+    return means
+
+
+class LevelStats(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.turn_ms = []
+        self.first_audio_ms = []
+        self.errors = {}
+        self.requests = 0
+        self.turns = 0
+        self.idle_prompts = 0
+        self.fillers = 0
+
+    def error(self, kind):
+        with self.lock:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+
+
+class SimulatedBridge(threading.Thread):
+    """
+    One robot: its own session, HTTP connection and turn cadence.
+    """
+
+    def __init__(self, base_url, fixtures, stats, stop_at, stream, idle_probability, seed):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.base_url = base_url
+        self.fixtures = fixtures
+        self.stats = stats
+        self.stop_at = stop_at
+        self.stream = stream
+        self.idle_probability = idle_probability
+        self.rng = random.Random(seed)
+        self.http = requests.Session()
+        self.session_id = None
+
+    def headers(self, turn_id):
+        headers = {"X-Turn-Id": turn_id, "X-Request-Start": "t={:.6f}".format(time.time())}
+        if self.session_id:
+            headers["X-Session-Id"] = self.session_id
+        return headers
+
+    def request(self, method, path, **kwargs):
+        with self.stats.lock:
+            self.stats.requests += 1
+        try:
+            r = self.http.request(method, self.base_url + path, timeout=60, **kwargs)
+        except requests.Timeout:
+            self.stats.error("timeout")
+            return None
+        except requests.RequestException as e:
+            self.stats.error(type(e).__name__)
+            return None
+        if r.status_code != 200:
+            self.stats.error("http_{}".format(r.status_code))
+            return None
+        return r
+
+    def sleep_until(self, seconds):
+        time.sleep(max(0.0, min(seconds, self.stop_at - time.time())))
+
+    def run(self):
+        r = self.request("GET", "/startScenario", headers=self.headers(uuid.uuid4().hex[:12]))
+        if r is not None:
+            self.session_id = r.json().get("session_id")
+        while time.time() < self.stop_at:
+            # The user thinks / talks while the bridge records
+            self.sleep_until(RECORD_SECONDS + self.rng.uniform(0.0, 2.0))
+            if time.time() >= self.stop_at:
+                break
+            if self.rng.random() < self.idle_probability:
+                # Nobody spoke for IDLE_TIMEOUT: the bridge plays an idle line
+                self.sleep_until(IDLE_TIMEOUT)
+                self.request("GET", "/ttsBytes", params={"prompt": IDLE_LINE},
+                             headers=dict(self.headers(uuid.uuid4().hex[:12]), Accept="audio/wav"))
+                with self.stats.lock:
+                    self.stats.idle_prompts += 1
+                continue
+            reply_seconds = self.turn()
+            # Wait while the robot plays the reply
+            self.sleep_until(reply_seconds)
+
+    def turn(self):
+        samples, _ = self.fixtures[self.rng.randrange(len(self.fixtures))]
+        turn_id = uuid.uuid4().hex[:12]
+        filler = threading.Timer(FILLER_DELAY, self.fetch_filler, args=(turn_id,))
+        start_t = time.time()
+        if self.stream:
+            # Live upload paced like the microphone, then NDJSON reply segments
+            def body():
+                step = int(fakes.MIC_RATE * STREAM_CHUNK_SECONDS)
+                for i in range(0, len(samples), step):
+                    yield samples[i:i + step].tobytes()
+                    time.sleep(STREAM_CHUNK_SECONDS)
+            headers = dict(self.headers(turn_id), **{"Content-Type": "audio/l16; rate=16000",
+                                                      "Accept": "application/x-ndjson"})
+            r = self.request("POST", "/listenUserStream", data=body(), headers=headers, stream=True)
+            if r is None:
+                return 0.0
+            speech_end = time.time()
+            filler.start()
+            reply_seconds = 0.0
+            first = True
+            try:
+                for line in r.iter_lines():
+                    msg = json.loads(line) if line else {}
+                    if "wav_base64" in msg:
+                        if first:
+                            filler.cancel()
+                            self.stats.first_audio_ms.append(int((time.time() - speech_end) * 1000))
+                            first = False
+                        reply_seconds += len(msg["wav_base64"]) * 3 / 4.0 / (2 * fakes.TTS_SAMPLE_RATE)
+            except (requests.RequestException, ValueError) as e:
+                self.stats.error(type(e).__name__)
+            finally:
+                r.close()
+        else:
+            filler.start()
+            wav = fakes.wav_bytes(samples, fakes.MIC_RATE)
+            r = self.request("POST", "/listenUser", headers=dict(self.headers(turn_id), Accept="audio/wav"),
+                             files={"file": ("capture.wav", wav, "audio/wav")},
+                             data={"current_instruction": u"Şimdi kalem nesnesi. 3 dakikan var. Ne yapabiliriz?"})
+            filler.cancel()
+            if r is None:
+                return 0.0
+            self.stats.first_audio_ms.append(int((time.time() - start_t) * 1000))
+            reply_seconds = fakes.wav_duration(r.content) if r.content else 0.0
+        with self.stats.lock:
+            self.stats.turns += 1
+            self.stats.turn_ms.append(int((time.time() - start_t) * 1000))
+        return reply_seconds
+
+    def fetch_filler(self, turn_id):
+        with self.stats.lock:
+            self.stats.fillers += 1
+        self.request("GET", "/ttsBytes", params={"prompt": FILLER_LINE},
+                     headers=dict(self.headers(turn_id), Accept="audio/wav"))
+
+
+def run_level(base_url, n_clients, duration, fixtures, stream, idle_probability, server_pid, seed):
+    stats = LevelStats()
+    before, _ = scrape_metrics(base_url)
+    rss_before = process_rss_mb(server_pid) if server_pid else None
+    start_t = time.time()
+    stop_at = start_t + duration
+    clients = [SimulatedBridge(base_url, fixtures, stats, stop_at, stream, idle_probability, seed * 1000 + i)
+               for i in range(n_clients)]
+    for client in clients:
+        client.start()
+        # Robots do not all start in the same millisecond
+        time.sleep(min(0.2, RECORD_SECONDS / max(1, n_clients)))
+    for client in clients:
+        client.join()
+    elapsed = time.time() - start_t
+
+    after, scalars = scrape_metrics(base_url)
+    rss_after = process_rss_mb(server_pid) if server_pid else None
+    means = stage_means(before, after)
+    n_errors = sum(stats.errors.values())
+    return {
+        "clients": n_clients,
+        "seconds": round(elapsed, 1),
+        "turns": stats.turns,
+        "turns_per_second": round(stats.turns / elapsed, 3),
+        "requests": stats.requests,
+        "error_rate": round(n_errors / float(max(1, stats.requests)), 4),
+        "errors": stats.errors,
+        "idle_prompts": stats.idle_prompts,
+        "filler_requests": stats.fillers,
+        "turn_ms": distribution(stats.turn_ms),
+        "first_audio_ms": distribution(stats.first_audio_ms),
+        "queue_ms": means.get("queue", {}).get("mean_ms"),
+        "server_stages": means,
+        "server_rss_mb": {"before": rss_before, "after": rss_after},
+        "sessions": scalars.get("naochat_sessions"),
+    }
+
+
+def start_fake_server(args):
+    port = free_port()
+    cmd = [sys.executable, os.path.join(BENCH_DIR, "fake_server.py"), "--port", str(port),
+           "--profile", args.profile, "--seed", str(args.seed)]
+    log = open(os.devnull, "w") if not args.verbose else None
+    proc = subprocess.Popen(cmd, stdout=log, stderr=log)
+    base_url = "http://127.0.0.1:{}".format(port)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("fake_server.py exited with code {}".format(proc.returncode))
+        try:
+            requests.get(base_url + "/ttsCacheStats", timeout=1)
+            return proc, base_url
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("fake_server.py did not come up")
+
+
+def main():
+    parser = ArgumentParser(description="Multi-robot load generator for scenario_logic.py")
+    parser.add_argument("--levels", default="1,2,4,8,16", help="comma-separated client counts")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds per level")
+    parser.add_argument("--url", help="existing server (real backends!) instead of fake_server.py")
+    parser.add_argument("--profile", default="default", help="mock backend latency profile")
+    parser.add_argument("--stream", action="store_true", help="live uploads to /listenUserStream")
+    parser.add_argument("--idle-probability", type=float, default=0.1,
+                        help="chance that a turn is an idle timeout instead of speech")
+    parser.add_argument("--fixtures", help="directory of WAV utterances")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="result file (default: benchmark/results/load_<time>_<revision>.json)")
+    parser.add_argument("--verbose", action="store_true", help="show the server log")
+    args = parser.parse_args()
+
+    fixtures = fakes.load_fixtures(args.fixtures)
+    levels = [int(n) for n in args.levels.split(",") if n.strip()]
+
+    proc = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        proc, base_url = start_fake_server(args)
+
+    results = []
+    try:
+        for n_clients in levels:
+            print("[load_test] {} client(s) for {:.0f}s...".format(n_clients, args.duration))
+            level = run_level(base_url, n_clients, args.duration, fixtures, args.stream,
+                              args.idle_probability, proc.pid if proc else None, args.seed)
+            results.append(level)
+            print("  {:.2f} turns/s, turn p50 {} / p95 {} ms, first audio p95 {} ms, queue {} ms, "
+                  "errors {:.1%}, server RSS {} MB, sessions {}".format(
+                      level["turns_per_second"], level["turn_ms"].get("p50"), level["turn_ms"].get("p95"),
+                      level["first_audio_ms"].get("p95"), level["queue_ms"], level["error_rate"],
+                      level["server_rss_mb"]["after"], level["sessions"]))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+    # Stage times relative to the lowest level: > 1 means requests wait on each other
+    if results:
+        base = results[0]["server_stages"]
+        for level in results:
+            for stage, entry in level["server_stages"].items():
+                if stage in base and base[stage]["mean_ms"] > 0:
+                    entry["inflation"] = round(entry["mean_ms"] / base[stage]["mean_ms"], 2)
+
+    output = {
+        "meta": {
+            "git_revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime()),
+            "args": vars(args),
+            "profile": fakes.load_profile(args.profile) if not args.url else None,
+        },
+        "levels": results,
+    }
+    out_path = args.out or os.path.join(BENCH_DIR, "results", "load_{}_{}.json".format(
+        time.strftime("%Y%m%d-%H%M%S"), output["meta"]["git_revision"] or "nogit"))
+    if not os.path.isdir(os.path.dirname(os.path.abspath(out_path))):
+        os.makedirs(os.path.dirname(os.path.abspath(out_path)))
+    with io.open(out_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(output, indent=2, ensure_ascii=False))
+    print("[load_test] Results written to", out_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+replay.py
+
+Replays a session archive (SESSION_ARCHIVE_DIR of scenario_logic.py, or
+--archive of pepper_bridge.py) through scenario_logic.py's routes on a local
+port, so a slow real session can be reproduced and profiled offline.
+
+Every archived turn is sent again as it was: the same upload (multipart
+file or chunked raw body, streamed at the pace it was captured), the same
+instruction and endpoint, session by session with a fresh server session
+each. The cloud backends answer either
+ - recorded: with the archived transcript, interim results, reply and reply
+   audio, after the latencies recorded in the turn's server spans (a
+   bridge archive has none, so these answer at once), or
+ - mock: with the stand-ins of fakes.py (latency profile, archived
+   transcript as the STT result).
+--speed scales all waiting (gaps between turns, upload pacing, recorded
+latencies): 1 is the original pace, 4 four times faster, 0 no waiting.
+
+The replayed turns are archived as well; per-stage latencies of the
+original and the replay are printed side by side and written as JSON.
+
+Usage:
+  python3 benchmark/replay.py ARCHIVE_DIR [--backends recorded|mock]
+      [--speed 1] [--profile default] [--session ID] [--out replay.json]
+"""
+import os
+import sys
+import io
+import json
+import time
+import shutil
+import logging
+import tempfile
+from urllib.parse import quote
+from argparse import ArgumentParser
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import fakes  # noqa: E402
+from run_benchmark import distribution, git_revision, start_server  # noqa: E402
+from session_archive import SessionArchive  # noqa: E402
+from audio_utils import wav_header_duration  # noqa: E402
+
+LISTEN_ENDPOINTS = ("/listenUser", "/listenUserStream")
+UPLOAD_CHUNK_BYTES = 4096
+
+
+def stage_ms(record, stage):
+    """
+    Total milliseconds of 'stage' in a record's spans (None if absent).
+    """
+    spans = [s["ms"] for s in record.get("spans", []) if s["stage"] == stage]
+    return sum(spans) if spans else None
+
+
+def stage_summary(records):
+    per_stage = {}
+    for record in records:
+        for span in record.get("spans", []):
+            per_stage.setdefault(span["stage"], []).append(span["ms"])
+    return dict((stage, distribution(v)) for stage, v in sorted(per_stage.items()))
+
+
+def load_turns(archive, session=None):
+    """
+    Replayable turns of 'archive' (with their capture), grouped per session
+    in recorded order: [(session_id, [record, ...])].
+    """
+    sessions = {}
+    for record in archive.records():
+        endpoint = record.get("endpoint")
+        if endpoint not in LISTEN_ENDPOINTS or "capture" not in record.get("blobs", {}):
+            continue
+        if session is not None and record.get("session_id") != session:
+            continue
+        sessions.setdefault(record.get("session_id"), []).append(record)
+    for turns in sessions.values():
+        turns.sort(key=lambda r: r.get("ts", 0))
+    return sorted(sessions.items(), key=lambda item: item[1][0].get("ts", 0))
+
+
+# ------------------------------------------------------------------------------
+# Recorded backends
+# ------------------------------------------------------------------------------
+class RecordedBackends(object):
+    """
+    Google STT / TTS and OpenAI clients that answer with what the archive
+    recorded for the current turn (set with begin()), after its recorded
+    latencies scaled by 1 / speed. Texts the archive has no audio for (e.g.
+    scripted lines) are synthesized by the fakes.py stand-in.
+    """
+
+    def __init__(self, archive, sessions, speed):
+        self.speed = speed
+        self.record = {}
+        self.replies = {}
+        self.audio = {}
+        for _, turns in sessions:
+            for record in turns:
+                if record.get("prompt") and record.get("reply"):
+                    self.replies[record["prompt"]] = record["reply"]
+                for i, sentence in enumerate(record.get("sentences") or []):
+                    wav_data = archive.blob(record, "reply_{}".format(i))
+                    if sentence and wav_data:
+                        self.audio[sentence] = wav_data
+        self._fake_tts = fakes.TextToSpeechClient()
+        self.speech_client = fakes._NS(recognize=self._recognize, streaming_recognize=self._streaming_recognize)
+        self.tts_client = fakes._NS(synthesize_speech=self._synthesize_speech,
+                                    list_voices=self._fake_tts.list_voices)
+        self.openai_client = fakes._NS(chat=fakes._NS(completions=fakes._NS(create=self._create)))
+
+    def begin(self, record):
+        self.record = record
+
+    def _sleep(self, ms):
+        if ms and ms > 0 and self.speed > 0:
+            time.sleep(ms / 1000.0 / self.speed)
+
+    def _elapsed_ms(self, start):
+        """
+        Recorded-time milliseconds since 'start' (infinite with speed 0).
+        """
+        return (time.time() - start) * 1000 * self.speed if self.speed > 0 else float("inf")
+
+    def _wait_until(self, start, ms):
+        if self.speed > 0:
+            self._sleep(ms - self._elapsed_ms(start))
+
+    def _recognize(self, config, audio, **kwargs):
+        self._sleep(stage_ms(self.record, "stt"))
+        return fakes._NS(results=[fakes._NS(alternatives=[fakes._NS(transcript=self.record.get("transcript") or "")])])
+
+    def _streaming_recognize(self, config, requests, **kwargs):
+        """
+        Recorded interim results at their recorded offsets (while the upload
+        is still arriving), then the final transcript when the recorded STT
+        span ends.
+        """
+        record = self.record
+        start = time.time()
+        pending = [i for i in record.get("interim", []) if not i[3]]
+        for _ in requests:
+            while pending and pending[0][0] <= self._elapsed_ms(start):
+                _, transcript, stability, _ = pending.pop(0)
+                yield fakes._result(transcript, False, stability)
+        for at_ms, transcript, stability, _ in pending:
+            self._wait_until(start, at_ms)
+            yield fakes._result(transcript, False, stability)
+        self._wait_until(start, stage_ms(record, "stt") or 0)
+        yield fakes._result(record.get("transcript") or "", True, 1.0)
+
+    def _synthesize_speech(self, input, voice=None, audio_config=None, **kwargs):
+        wav_data = self.audio.get(input.text)
+        if wav_data is None:
+            return self._fake_tts.synthesize_speech(input=input, voice=voice, audio_config=audio_config)
+        tts_spans = [s["ms"] for s in self.record.get("spans", []) if s["stage"] == "tts"]
+        self._sleep(sum(tts_spans) / len(tts_spans) if tts_spans else 0)
+        return fakes._NS(audio_content=wav_data)
+
+    def _reply_for(self, prompt):
+        # Speculative calls (interim transcripts) get the current turn's reply
+        return self.replies.get(prompt) or self.record.get("reply") or ""
+
+    def _create(self, model=None, messages=None, stream=False, **kwargs):
+        reply = self._reply_for(messages[-1]["content"] if messages else "")
+        llm_ms = stage_ms(self.record, "llm") or 0
+        if not stream:
+            self._sleep(llm_ms)
+            return fakes._NS(choices=[fakes._NS(message=fakes._NS(content=reply))])
+
+        first_ms = stage_ms(self.record, "llm_first_sentence") or 0
+        self._sleep(first_ms)
+        words = reply.split(" ")
+        per_word_ms = max(0, llm_ms - first_ms) / max(1, len(words))
+
+        def chunks():
+            for i, word in enumerate(words):
+                if i:
+                    self._sleep(per_word_ms)
+                yield fakes._NS(choices=[fakes._NS(delta=fakes._NS(content=(" " if i else "") + word))])
+        return chunks()
+
+
+# ------------------------------------------------------------------------------
+# Replaying a turn
+# ------------------------------------------------------------------------------
+def paced_body(data, seconds, speed):
+    """
+    Yield 'data' in chunks spread over 'seconds' / speed, like a live upload.
+    """
+    n_chunks = max(1, (len(data) + UPLOAD_CHUNK_BYTES - 1) // UPLOAD_CHUNK_BYTES)
+    interval = seconds / speed / n_chunks if speed > 0 and seconds else 0
+    start = time.time()
+    for i in range(n_chunks):
+        yield data[i * UPLOAD_CHUNK_BYTES:(i + 1) * UPLOAD_CHUNK_BYTES]
+        if interval:
+            time.sleep(max(0.0, start + (i + 1) * interval - time.time()))
+
+
+def upload_seconds(record, capture):
+    """
+    How long the original upload took to arrive (recorded by the server, or
+    the length of the captured audio).
+    """
+    if record.get("upload_ms") is not None:
+        return record["upload_ms"] / 1000.0
+    try:
+        return wav_header_duration(capture)
+    except Exception:
+        return 0.0
+
+
+def replay_turn(base_url, archive, record, session_id, speed):
+    """
+    Send one archived turn again; returns client-side timings and texts.
+    """
+    capture = archive.blob(record, "capture")
+    instruction = record.get("instruction") or ""
+    headers = {"X-Session-Id": session_id, "X-Turn-Id": record.get("turn_id", "")}
+    if record.get("upload") == "multipart":
+        kwargs = {
+            "files": {"file": (record.get("filename") or "capture.wav", capture, record.get("content_type") or "audio/wav")},
+            "data": {"current_instruction": instruction},
+        }
+    else:
+        headers["Content-Type"] = record.get("content_type") or "audio/wav"
+        headers["X-Current-Instruction"] = quote(instruction)
+        kwargs = {"data": paced_body(capture, upload_seconds(record, capture), speed)}
+
+    endpoint = record["endpoint"]
+    start = time.time()
+    first_audio_ms = None
+    recognized_text = reply = None
+    r = requests.post(base_url + endpoint, headers=headers, stream=True, timeout=120, **kwargs)
+    if endpoint == "/listenUserStream" and r.status_code == 200:
+        for line in r.iter_lines():
+            if not line:
+                continue
+            msg = json.loads(line)
+            if "index" in msg and first_audio_ms is None:
+                first_audio_ms = round((time.time() - start) * 1000, 1)
+            recognized_text = msg.get("recognized_text", recognized_text)
+            reply = msg.get("chatgpt_response", reply)
+    else:
+        body = r.json() if r.headers.get("Content-Type", "").startswith("application/json") else {}
+        recognized_text, reply = body.get("recognized_text"), body.get("chatgpt_response")
+    total_ms = round((time.time() - start) * 1000, 1)
+    r.close()
+    return {
+        "turn_id": record.get("turn_id"),
+        "session_id": record.get("session_id"),
+        "endpoint": endpoint,
+        "status": r.status_code,
+        "transcript": record.get("transcript"),
+        "replay_transcript": recognized_text,
+        "reply": record.get("reply"),
+        "replay_reply": reply,
+        "original_total_ms": record.get("total_ms"),
+        "replay_total_ms": total_ms,
+        "replay_first_audio_ms": first_audio_ms if first_audio_ms is not None else total_ms,
+    }
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("archive", help="session archive directory")
+    parser.add_argument("--backends", choices=["recorded", "mock"], default="recorded")
+    parser.add_argument("--speed", type=float, default=1.0, help="pace factor (1 = original, 0 = no waiting)")
+    parser.add_argument("--profile", default="default", help="latency profile of the mock backends")
+    parser.add_argument("--session", help="only replay this session id")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="result file (default: benchmark/results/replay_<time>_<revision>.json)")
+    parser.add_argument("--verbose", action="store_true", help="show the server log")
+    args = parser.parse_args()
+
+    archive = SessionArchive(args.archive)
+    sessions = load_turns(archive, args.session)
+    if not sessions:
+        print("[replay] No replayable turns in", args.archive)
+        return
+
+    work_dir = tempfile.mkdtemp(prefix="naochat_replay_")
+    os.environ["TTS_CACHE_DIR"] = os.path.join(work_dir, "tts_cache")
+    os.environ["SESSION_ARCHIVE_DIR"] = os.path.join(work_dir, "archive")
+    robot = fakes.FakeRobot(fakes.Latencies(fakes.load_profile(args.profile), args.seed), fakes.load_fixtures(None))
+    fakes.install(robot)
+
+    import scenario_logic
+    backends = None
+    if args.backends == "recorded":
+        backends = RecordedBackends(archive, sessions, args.speed)
+        scenario_logic.speech_client.set(backends.speech_client)
+        scenario_logic.tts_client.set(backends.tts_client)
+        scenario_logic.llm_client.set(backends.openai_client)
+
+    server = start_server(scenario_logic.app)
+    base_url = "http://127.0.0.1:{}".format(server.server_port)
+    n_turns = sum(len(turns) for _, turns in sessions)
+    print("[replay] {} turn(s) of {} session(s), {} backends, speed {}...".format(
+        n_turns, len(sessions), args.backends, args.speed))
+    log = sys.stdout
+    if not args.verbose:
+        sys.stdout = io.StringIO()
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    results = []
+    start_t = time.time()
+    try:
+        for original_session, turns in sessions:
+            session_id = requests.get(base_url + "/startScenario", timeout=10).json()["session_id"]
+            session_start, first_ts = time.time(), turns[0].get("ts", 0)
+            for record in turns:
+                if args.speed > 0:
+                    # Keep the original gaps between turns (user speaking, robot talking)
+                    time.sleep(max(0.0, session_start + (record.get("ts", 0) - first_ts) / args.speed - time.time()))
+                robot.last_transcript = record.get("transcript") or ""
+                if backends is not None:
+                    backends.begin(record)
+                results.append(replay_turn(base_url, archive, record, session_id, args.speed))
+        # Let the replayed turns reach the archive
+        scenario_logic.archive_executor.submit(lambda: None).result()
+    finally:
+        wall_seconds = time.time() - start_t
+        sys.stdout = log
+        server.shutdown()
+
+    originals = [record for _, turns in sessions for record in turns]
+    replayed = list(SessionArchive(os.environ["SESSION_ARCHIVE_DIR"]).records())
+    result = {
+        "meta": {
+            "git_revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime()),
+            "args": vars(args),
+            "wall_seconds": round(wall_seconds, 1),
+        },
+        "original": {"stages_ms": stage_summary(originals),
+                     "turn_ms": distribution([r["total_ms"] for r in originals if "total_ms" in r])},
+        "replay": {"stages_ms": stage_summary(replayed),
+                   "turn_ms": distribution([r["replay_total_ms"] for r in results]),
+                   "first_audio_ms": distribution([r["replay_first_audio_ms"] for r in results]),
+                   "errors": sum(1 for r in results if r["status"] != 200),
+                   "transcript_mismatches": sum(1 for r in results
+                                                if r["replay_transcript"] != r["transcript"])},
+        "turns": results,
+    }
+
+    out_path = args.out or os.path.join(BENCH_DIR, "results", "replay_{}_{}.json".format(
+        time.strftime("%Y%m%d-%H%M%S"), result["meta"]["git_revision"] or "nogit"))
+    if not os.path.isdir(os.path.dirname(os.path.abspath(out_path))):
+        os.makedirs(os.path.dirname(os.path.abspath(out_path)))
+    with open(out_path, "w") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    print("[replay] {} turns in {:.0f}s, {} error(s), {} transcript mismatch(es)".format(
+        len(results), wall_seconds, result["replay"]["errors"], result["replay"]["transcript_mismatches"]))
+    print("  {:<26} {:>18} {:>18}".format("stage (p50 / p95 ms)", "original", "replay"))
+    stages = sorted(set(result["original"]["stages_ms"]) | set(result["replay"]["stages_ms"]))
+    for stage in stages:
+        cells = []
+        for side in ("original", "replay"):
+            dist = result[side]["stages_ms"].get(stage)
+            cells.append("{} / {}".format(dist["p50"], dist["p95"]) if dist else "-")
+        print("  {:<26} {:>18} {:>18}".format(stage, *cells))
+    print("[replay] Results written to", out_path)
+
+
+if __name__ == "__main__":
+    main()
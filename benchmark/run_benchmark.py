@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+run_benchmark.py
+
+Offline end-to-end latency benchmark. Runs scenario_logic.py's Flask app on
+a local port and pepper_bridge.main()'s full scenario against it, with the
+robot, SFTP, Google STT/TTS and OpenAI replaced by the stand-ins in
+fakes.py (latencies drawn from a profile). A simulated user answers with
+WAV fixtures every time the robot stops talking.
+
+Reports time-to-first-audio, per-stage breakdown (bridge trace and server
+metrics) and throughput, and writes everything as JSON so runs can be
+compared between commits.
+
+Usage:
+  python3 benchmark/run_benchmark.py [--profile default|fast|slow|profile.json]
+      [--capture stream|file] [--capture-profile NAME] [--no-stream] [--fixtures DIR]
+      [--objects N] [--object-seconds S] [--out results.json]
+      [--compare previous.json] [--archive DIR]
+"""
+import os
+import sys
+import io
+import re
+import json
+import time
+import logging
+import shutil
+import tempfile
+import platform
+import threading
+import subprocess
+from argparse import ArgumentParser
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import fakes  # noqa: E402  (must be installed before the app modules are imported)
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def distribution(values):
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 1),
+        "p50": percentile(values, 0.5),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": max(values),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def start_server(app):
+    """
+    Serve the Flask app on a free local port from a background thread.
+    Werkzeug's threaded server passes chunked uploads through as they
+    arrive, so streaming recognition overlaps with the user's speech.
+    """
+    from werkzeug.serving import make_server
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def summarize_trace(trace_path):
+    turns = []
+    if os.path.exists(trace_path):
+        with open(trace_path) as f:
+            turns = [json.loads(line) for line in f if line.strip()]
+
+    first_audio = []
+    stage_totals = {}
+    counts = {}
+    for turn in turns:
+        for name, n in turn.get("counts", {}).items():
+            counts.setdefault(name, []).append(n)
+        per_stage = {}
+        for span in turn["spans"]:
+            per_stage[span["stage"]] = per_stage.get(span["stage"], 0) + span["ms"]
+        if "first_audio" in per_stage:
+            first_audio.append(per_stage["first_audio"])
+        for stage, ms in per_stage.items():
+            stage_totals.setdefault(stage, []).append(ms)
+
+    return turns, {
+        "time_to_first_audio_ms": distribution(first_audio),
+        "turn_ms": distribution([t["total_ms"] for t in turns]),
+        "stages_ms_per_turn": dict((stage, distribution(v)) for stage, v in sorted(stage_totals.items())),
+        "counts_per_turn": dict((name, distribution(v)) for name, v in sorted(counts.items())),
+    }
+
+
+def compare(current, previous_path):
+    """
+    Print p50/p95 differences against an earlier result file.
+    """
+    with open(previous_path) as f:
+        previous = json.load(f)
+    print("\nCompared with {} ({}):".format(previous_path, previous["meta"].get("git_revision")))
+
+    def row(label, new, old):
+        if not new or not old or new.get("count", 0) == 0 or old.get("count", 0) == 0:
+            return
+        print("  {:<34} p50 {:>7} -> {:>7} ms   p95 {:>7} -> {:>7} ms".format(
+            label, old["p50"], new["p50"], old["p95"], new["p95"]))
+
+    row("time_to_first_audio", current["bridge"]["time_to_first_audio_ms"], previous["bridge"]["time_to_first_audio_ms"])
+    row("turn", current["bridge"]["turn_ms"], previous["bridge"]["turn_ms"])
+    for stage, dist in sorted(current["bridge"]["stages_ms_per_turn"].items()):
+        row("bridge." + stage, dist, previous["bridge"]["stages_ms_per_turn"].get(stage))
+    for stage, dist in sorted(current["server"]["stages_ms"].items()):
+        row("server." + stage, dist, previous["server"]["stages_ms"].get(stage))
+    print("  turns/min {} -> {}".format(previous["throughput"]["turns_per_minute"],
+                                        current["throughput"]["turns_per_minute"]))
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--profile", default="default",
+                        help="latency profile: {} or a JSON file of stage -> [median_ms, p95_ms]".format(
+                            "/".join(sorted(fakes.PROFILES))))
+    parser.add_argument("--capture", choices=["stream", "file"], default="stream")
+    parser.add_argument("--capture-profile", default=None, help="bridge capture profile (see CaptureProfile)")
+    parser.add_argument("--no-stream", dest="stream_replies", action="store_false", default=True)
+    parser.add_argument("--fixtures", help="directory of WAV utterances (+ optional .txt transcripts)")
+    parser.add_argument("--objects", type=int, default=2, help="number of scenario objects to run")
+    parser.add_argument("--object-seconds", type=float, default=30.0, help="conversation time per object")
+    parser.add_argument("--think-seconds", type=float, default=1.0, help="user pause after the robot stops")
+    parser.add_argument("--filler-delay", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="result file (default: benchmark/results/<time>_<revision>.json)")
+    parser.add_argument("--compare", help="earlier result file to diff against")
+    parser.add_argument("--archive", help="record the session to DIR/server and DIR/bridge (see replay.py)")
+    parser.add_argument("--verbose", action="store_true", help="show the bridge/server log")
+    args = parser.parse_args()
+
+    profile = fakes.load_profile(args.profile)
+    work_dir = tempfile.mkdtemp(prefix="naochat_bench_")
+    os.environ["TTS_CACHE_DIR"] = os.path.join(work_dir, "tts_cache")
+    if args.archive:
+        os.environ["SESSION_ARCHIVE_DIR"] = os.path.join(args.archive, "server")
+
+    robot = fakes.FakeRobot(fakes.Latencies(profile, args.seed), fakes.load_fixtures(args.fixtures),
+                            think_seconds=args.think_seconds)
+    fakes.install(robot)
+
+    import scenario_logic
+    import pepper_bridge
+
+    # Every behavior the bridge refers to counts as installed on the fake robot
+    with io.open(pepper_bridge.__file__, encoding="utf-8") as f:
+        robot.installed_behaviors = sorted(set(re.findall(r'"(animations/[^"]+)"', f.read())))
+
+    server = start_server(scenario_logic.app)
+    scenario_logic.warm_up_clients()
+    local_dir = os.path.join(work_dir, "bridge")
+    os.makedirs(local_dir)
+    pepper_bridge.SCENARIO_SERVER_HOST = "127.0.0.1"
+    pepper_bridge.SCENARIO_SERVER_PORT = server.server_port
+    pepper_bridge.LOCAL_TEMP_DIR = local_dir
+    pepper_bridge.PEPPER_TEMP_DIR = "/home/nao/bench"
+    pepper_bridge.OBJECTS = pepper_bridge.OBJECTS[:args.objects]
+    pepper_bridge.OBJECT_SECONDS = args.object_seconds
+    trace_path = os.path.join(local_dir, pepper_bridge.TURN_TRACE_FILE)
+    pepper_bridge.turn_trace = pepper_bridge.TurnTrace(trace_path)
+    pepper_bridge.behavior_index = pepper_bridge.BehaviorIndex(os.path.join(local_dir, "behavior_durations.json"))
+
+    argv = ["pepper_bridge.py", "--pip", "127.0.0.1", "--capture", args.capture]
+    if not args.stream_replies:
+        argv.append("--no-stream")
+    if args.filler_delay is not None:
+        argv += ["--filler-delay", str(args.filler_delay)]
+    if args.capture_profile:
+        argv += ["--capture-profile", args.capture_profile]
+    if args.archive:
+        argv += ["--archive", os.path.join(args.archive, "bridge")]
+    sys.argv = argv
+
+    robot.mic.start()
+    print("[run_benchmark] Running {} object(s) x {:.0f}s, profile '{}', capture={}, stream={}...".format(
+        len(pepper_bridge.OBJECTS), args.object_seconds, args.profile, args.capture, args.stream_replies))
+    log = sys.stdout
+    if not args.verbose:
+        sys.stdout = io.StringIO()
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    start_t = time.time()
+    try:
+        pepper_bridge.main()
+    except SystemExit:
+        pass
+    finally:
+        wall_seconds = time.time() - start_t
+        sys.stdout = log
+        robot.mic.stop()
+        server.shutdown()
+
+    turns, bridge_summary = summarize_trace(trace_path)
+    server_stages = dict(
+        (stage, dict(count=v["count"], p50=round(v["p50"] * 1000, 1), p95=round(v["p95"] * 1000, 1),
+                     p99=round(v["p99"] * 1000, 1), mean=round(v["sum"] * 1000 / max(1, v["count"]), 1)))
+        for stage, v in sorted(scenario_logic.metrics.snapshot().items())
+    )
+    conversation_seconds = len(pepper_bridge.OBJECTS) * args.object_seconds
+    result = {
+        "meta": {
+            "git_revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime()),
+            "python": platform.python_version(),
+            "args": vars(args),
+            "profile": profile,
+        },
+        "bridge": bridge_summary,
+        "server": {"stages_ms": server_stages, "tts_cache": scenario_logic.tts_cache.stats()},
+        "throughput": {
+            "turns": len(turns),
+            "user_utterances": robot.utterances,
+            "wall_seconds": round(wall_seconds, 1),
+            "turns_per_minute": round(60.0 * len(turns) / conversation_seconds, 2) if conversation_seconds else None,
+        },
+        "turns": turns,
+    }
+
+    out_path = args.out or os.path.join(
+        BENCH_DIR, "results", "{}_{}.json".format(time.strftime("%Y%m%d-%H%M%S"), result["meta"]["git_revision"] or "nogit"))
+    if not os.path.isdir(os.path.dirname(os.path.abspath(out_path))):
+        os.makedirs(os.path.dirname(os.path.abspath(out_path)))
+    with open(out_path, "w") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    ttfa = bridge_summary["time_to_first_audio_ms"]
+    print("[run_benchmark] {} turns in {:.0f}s ({} turns/min)".format(
+        len(turns), wall_seconds, result["throughput"]["turns_per_minute"]))
+    if ttfa["count"]:
+        print("[run_benchmark] time to first audio: p50 {} ms, p95 {} ms, max {} ms".format(
+            ttfa["p50"], ttfa["p95"], ttfa["max"]))
+    for stage, dist in bridge_summary["stages_ms_per_turn"].items():
+        print("  bridge {:<18} p50 {:>6} ms  p95 {:>6} ms".format(stage, dist["p50"], dist["p95"]))
+    for stage, dist in server_stages.items():
+        print("  server {:<18} p50 {:>6} ms  p95 {:>6} ms".format(stage, dist["p50"], dist["p95"]))
+    print("[run_benchmark] Results written to", out_path)
+
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+chat_history.py
+
+Bounded conversation memory for chatgpt_respond.
+
+ChatHistory keeps both user and assistant turns. The most recent turns are
+sent verbatim as long as they fit in 'max_tokens'; older turns are folded
+into a short running summary (written by an LLM call supplied by the
+caller), so the prompt stays roughly the same size for a whole session
+instead of growing with every turn.
+"""
+
+import time
+import threading
+
+try:
+    # Optional: exact token counts (pip install tiktoken)
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:
+    _ENCODING = None
+
+# Per-message overhead of the chat format, in tokens
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def count_tokens(text):
+    """
+    Token count of 'text' (tiktoken when available, otherwise an estimate
+    of ~3 characters per token, which is conservative for Turkish).
+    """
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return len(text) // 3 + 1
+
+
+def message_tokens(message):
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+class ChatHistory:
+    """
+    Recent-turn window under a token budget plus a running summary of
+    everything older.
+
+    After a turn is added, needs_fold() tells the caller to run fold() (in
+    the background): the oldest turns are summarized until the window is
+    back under 'target_ratio' of the budget. Turns added while a fold is in
+    flight are kept; only the summarized ones are removed.
+
+    While summarization keeps failing, folds back off exponentially (from
+    'retry_delay' up to 'max_retry_delay' seconds), and once the window
+    exceeds 'hard_limit_ratio' times the budget its oldest turns are
+    dropped unsummarized, so the prompt cannot grow without bound.
+    'clock' returns the seconds the backoff is measured in.
+    """
+
+    def __init__(self, max_tokens=1500, target_ratio=0.6, summary_prefix="Önceki konuşmanın özeti: ",
+                 retry_delay=5.0, max_retry_delay=300.0, hard_limit_ratio=2.0, clock=time.monotonic):
+        self.max_tokens = max_tokens
+        self.target_ratio = target_ratio
+        self.summary_prefix = summary_prefix
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.hard_limit_ratio = hard_limit_ratio
+        self.clock = clock
+        self.summary = ""
+        self._turns = []
+        self._tokens = 0
+        self._folding = False
+        self._failures = 0
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, role, content):
+        message = {"role": role, "content": content}
+        with self._lock:
+            self._turns.append(message)
+            self._tokens += message_tokens(message)
+            # Not while a fold is in flight: it removes the turns it read by count
+            if not self._folding and self._tokens > self.max_tokens * self.hard_limit_ratio:
+                self._drop_oldest_locked()
+
+    def _drop_oldest_locked(self):
+        """
+        Drop the oldest user/assistant pairs (keeping the last two turns)
+        until the window fits the budget again.
+        """
+        n_drop = 0
+        remaining = self._tokens
+        while n_drop < len(self._turns) - 2 and remaining > self.max_tokens:
+            remaining -= message_tokens(self._turns[n_drop]) + message_tokens(self._turns[n_drop + 1])
+            n_drop += 2
+        if n_drop:
+            del self._turns[:n_drop]
+            self._tokens = sum(message_tokens(m) for m in self._turns)
+            print(f"[ChatHistory] Over the hard limit: dropped {n_drop} turns without summarizing.")
+
+    def messages(self):
+        """
+        Messages to send before the new user prompt: the summary (as a
+        system message) followed by the recent turns.
+        """
+        with self._lock:
+            messages = list(self._turns)
+            if self.summary:
+                messages.insert(0, {"role": "system", "content": self.summary_prefix + self.summary})
+            return messages
+
+    def token_count(self):
+        with self._lock:
+            summary_tokens = count_tokens(self.summary) if self.summary else 0
+            return self._tokens + summary_tokens
+
+    def __len__(self):
+        with self._lock:
+            return len(self._turns)
+
+    def needs_fold(self):
+        with self._lock:
+            return not self._folding and self._tokens > self.max_tokens and self.clock() >= self._retry_at
+
+    def fold(self, summarize):
+        """
+        Fold the oldest turns into the summary.
+
+        Parameters:
+            summarize (callable): summarize(previous_summary, turns) -> str.
+                Runs without holding the history lock, so new turns can be
+                added meanwhile.
+        """
+        with self._lock:
+            if self._folding or self._tokens <= self.max_tokens or self.clock() < self._retry_at:
+                return
+            self._folding = True
+            target = self.max_tokens * self.target_ratio
+            remaining = self._tokens
+            n_fold = 0
+            # Fold whole user/assistant pairs, but always keep the last two turns
+            while n_fold < len(self._turns) - 2 and remaining > target:
+                remaining -= message_tokens(self._turns[n_fold])
+                n_fold += 1
+            if n_fold % 2:
+                n_fold += 1
+            old_turns = self._turns[:n_fold]
+            previous_summary = self.summary
+
+        try:
+            new_summary = summarize(previous_summary, old_turns) if old_turns else previous_summary
+        except Exception as e:
+            print("[ChatHistory] Summarization failed:", e)
+            new_summary = None
+
+        with self._lock:
+            if new_summary is not None:
+                self.summary = new_summary
+                del self._turns[:len(old_turns)]
+                self._tokens = sum(message_tokens(m) for m in self._turns)
+                self._failures = 0
+                self._retry_at = 0.0
+            else:
+                self._failures += 1
+                delay = min(self.max_retry_delay, self.retry_delay * 2 ** (self._failures - 1))
+                self._retry_at = self.clock() + delay
+            self._folding = False
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+latency_metrics.py
+
+Per-stage latency instrumentation for scenario_logic.py.
+
+ - StageMetrics keeps, for every stage (stt, llm, tts, encode, ...), a
+   Prometheus histogram plus a window of recent samples for p50/p95/p99,
+   and plain counters.
+ - TurnSpans collects the spans of one request, tagged with the turn id the
+   bridge sends in X-Turn-Id, and logs them as one compact JSON line.
+ - render_prometheus() produces the text exposition format for /metrics.
+"""
+
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 21.0, 30.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class LatencyHistogram:
+    """
+    Cumulative-bucket histogram plus a bounded window of recent samples
+    (used for quantiles, so they follow the current behavior of the system).
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=2048):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.recent.append(seconds)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+
+    def quantile(self, q):
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in sorted(labels.items())) + "}"
+
+
+class StageMetrics:
+    """
+    Thread-safe registry of stage histograms and counters.
+    """
+
+    def __init__(self, prefix="naochat"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._histograms = {}  # stage -> LatencyHistogram
+        self._counters = {}    # (name, frozenset(labels)) -> value
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, frozenset(labels.items()))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def quantiles(self, stage):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                return {}
+            return {q: histogram.quantile(q) for q in QUANTILES}
+
+    def snapshot(self):
+        """
+        {stage: {count, sum, p50, p95, p99}} in seconds, e.g. for benchmark reports.
+        """
+        with self._lock:
+            return {
+                stage: dict(count=h.count, sum=h.total,
+                            **{f"p{int(q * 100)}": h.quantile(q) for q in QUANTILES})
+                for stage, h in self._histograms.items()
+            }
+
+    def render_prometheus(self):
+        p = self.prefix
+        lines = [
+            f"# HELP {p}_stage_seconds Latency of each pipeline stage.",
+            f"# TYPE {p}_stage_seconds histogram",
+        ]
+        with self._lock:
+            for stage, h in sorted(self._histograms.items()):
+                for bound, n in zip(h.buckets, h.bucket_counts):
+                    lines.append(f'{p}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {n}')
+                lines.append(f'{p}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {h.count}')
+                lines.append(f'{p}_stage_seconds_sum{{stage="{stage}"}} {h.total:.6f}')
+                lines.append(f'{p}_stage_seconds_count{{stage="{stage}"}} {h.count}')
+
+            lines.append(f"# HELP {p}_stage_latency_seconds Recent-window latency quantiles of each stage.")
+            lines.append(f"# TYPE {p}_stage_latency_seconds summary")
+            for stage, h in sorted(self._histograms.items()):
+                for q in QUANTILES:
+                    lines.append(f'{p}_stage_latency_seconds{{stage="{stage}",quantile="{q}"}} {h.quantile(q):.6f}')
+                lines.append(f'{p}_stage_latency_seconds_sum{{stage="{stage}"}} {h.total:.6f}')
+                lines.append(f'{p}_stage_latency_seconds_count{{stage="{stage}"}} {h.count}')
+
+            names = sorted({name for name, _ in self._counters})
+            for name in names:
+                lines.append(f"# TYPE {p}_{name} counter")
+                for (counter_name, labels), value in sorted(self._counters.items(), key=lambda kv: sorted(kv[0][1])):
+                    if counter_name == name:
+                        lines.append(f"{p}_{name}{_labels(dict(labels))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class TurnSpans:
+    """
+    Spans of one request. Every span is also observed in 'metrics'.
+    """
+
+    def __init__(self, metrics, turn_id, endpoint):
+        self.metrics = metrics
+        self.turn_id = turn_id
+        self.endpoint = endpoint
+        # Whole-request latency is kept per endpoint, e.g. "request_listenUser"
+        self.request_stage = "request_" + endpoint.strip("/").replace("/", "_")
+        self.start = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds, offset=None):
+        self.metrics.observe(stage, seconds)
+        with self._lock:
+            self.spans.append({
+                "stage": stage,
+                "at_ms": round(((offset if offset is not None else time.time() - seconds) - self.start) * 1000, 1),
+                "ms": round(seconds * 1000, 1)
+            })
+
+    @contextmanager
+    def span(self, stage):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(stage, time.time() - start, offset=start)
+
+    def entry(self, **fields):
+        """
+        The turn so far as a dict: {turn_id, endpoint, total_ms, spans, **fields}.
+        """
+        with self._lock:
+            return dict(turn_id=self.turn_id, endpoint=self.endpoint,
+                        total_ms=round((time.time() - self.start) * 1000, 1),
+                        spans=list(self.spans), **fields)
+
+    def log(self, **fields):
+        """
+        Print the turn as one JSON line, e.g. for grepping next to the bridge trace.
+        """
+        print("[turn] " + json.dumps(self.entry(**fields), ensure_ascii=False))
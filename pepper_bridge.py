@@ -5,34 +5,85 @@ pepper_bridge.py
 
 Python 2.7 code:
  - Connects to Pepper via naoqi
- - Records audio from Pepper's mic using ALAudioRecorder (4 mics)
- - Then sums the 4 channels into a single mono WAV
- - Sends that WAV to scenario_logic.py (/listenUser) for STT + optional ChatGPT + TTS
- - Receives base64 WAV, decodes, scps to Pepper, plays
- - Monitors user inactivity (10s) -> "Sen düşün ben beklerim"
- - If STT/LLM/TTS >5s, insert filler phrase
+ - Streams audio from Pepper's mic (ALAudioDevice subscriber), cuts it into
+   utterances on trailing silence and uploads each utterance while the user is
+   still talking, for streaming recognition (default, --capture stream), or
+ - Records audio from Pepper's mic using ALAudioRecorder (4 mics, --capture file)
+   and mixes the 4 channels into a single mono WAV (audio_utils.py)
+ - Sends that audio (FLAC when soundfile is installed) to scenario_logic.py
+   (/listenUser) for STT + optional ChatGPT + TTS
+ - Streams the reply sentence by sentence (/listenUserStream) and plays sentence
+   one while later sentences are still being generated
+ - Or receives the reply as a raw WAV body (base64 JSON from older servers),
+   scps to Pepper (over one persistent SFTP session), plays
+ - Runs speaking gestures on a background scheduler while the reply plays
+ - Pre-synthesizes all scripted lines at startup (one /ttsBatch request) and
+   pre-loads them on Pepper
+ - Drops silent captures locally with an energy/zero-crossing VAD
+ - Monitors user inactivity (15s of VAD silence) -> "Sen düşün ben beklerim"
+ - Sends each request from a worker thread; if no reply audio is back after
+   --filler-delay seconds, plays a pre-loaded filler phrase + thinking gesture
+   while the request continues
+ - Keeps the per-turn audio in memory (capture -> upload, reply -> SFTP putfo);
+   files are only written with --keep-audio (debugging / archival)
+ - Talks to the server over one pooled keep-alive HTTP session (per-endpoint
+   timeouts, /ttsBytes retried with backoff)
+ - Times every stage of a turn (capture, upload, SFTP, playback, gestures...)
+   and appends one JSON line per turn to LOCAL_TEMP_DIR/turn_trace.jsonl; the
+   turn id is sent in X-Turn-Id so the server's spans can be joined with it
+ - With --archive DIR, also appends every turn (captured audio, transcript,
+   reply text and audio, trace) to a session archive for benchmark/replay.py
+ - Waits for the server's /ready probe (backend clients warmed up) before it
+   starts the session, while its own start-up (naoqi, SFTP) runs meanwhile,
+   and logs how long every start-up phase took
  - 3 min for each object
 """
+import time
+# Start of the process, for the start-up timings
+PROCESS_START = time.time()
+
 import random
 import sys
 import os
-import time
 import base64
-import wave
+import hashlib
+import io
+import json
 import struct
 import paramiko
+import socket
+import threading
+import collections
+import itertools
+import contextlib
+import uuid
+try:
+    import Queue
+except ImportError:
+    # Python 3 (e.g. when driven by benchmark/run_benchmark.py)
+    import queue as Queue
 import subprocess
 from optparse import OptionParser
+try:
+    from urllib import quote, unquote
+except ImportError:
+    from urllib.parse import quote, unquote
+import numpy as np
 from naoqi import ALBroker, ALModule, ALProxy
+from audio_utils import (EnergyVAD, audio_format, channel_levels_db, channel_speech_db, mix_to_mono,
+                         mix_wav_bytes_to_mono, pcm_to_wav_bytes, read_audio_samples, read_wav_samples,
+                         wav_bytes_to_flac, wav_header_duration)
+from session_archive import SessionArchive
 
 
 ROBOT_IP = "robot_ip"  
-ROBOT_PORT = robot_port
+ROBOT_PORT = 9559
 NAO_PASSWORD = "nao_password"
-managerProxy = ALProxy("ALBehaviorManager", ROBOT_IP, ROBOT_PORT)
+# ALBehaviorManager proxy, created by main() once the broker is up (for --pip)
+managerProxy = None
 
 SCENARIO_SERVER_HOST = "scenario_server_hsot"
-SCENARIO_SERVER_PORT = scenario_server_port
+SCENARIO_SERVER_PORT = 5000
 
 LOCAL_TEMP_DIR = "local_temp_dir"
 PEPPER_TEMP_DIR = "pepper_temp_dir"
@@ -45,64 +96,81 @@ IDLE_MESSAGES = [
     u"Merak etme bekliyorum."
 ]
 
+# Scripted lines of the scenario (pre-synthesized and pre-loaded at startup)
+GREETING_TEXT = u"Merhaba!"
+INTRODUCTION_TEXT = u"Benim adım Deniz. Bugün yaratıcı fikirler üretmeye çalışacağız. Hazır mısın?"
+LETS_START_TEXT = u"Süper! O zaman başlayalım!"
+INSTRUCTION_TEMPLATE = u"Şimdi {} nesnesi. 3 dakikan var. Ne yapabiliriz?"
+TIME_UP_TEMPLATE = u"Zaman doldu. {} için yeterince fikir ürettik!"
+FINAL_TEXT = u"Teşekkür ederim! Görevi tamamladık. Çok yaratıcı fikirler bulduk!"
+
+OBJECTS = [u"kalem", u"plastik şişe"]
+
+# "stream": ALAudioDevice subscriber with endpointing, "file": record + SFTP pull
+CAPTURE_MODE = "stream"
+# Microphones and format of the capture, see CaptureProfile:
+# "all", "front", "best", "front-ogg", "best-ogg"
+CAPTURE_PROFILE = "all"
+# ALAudioRecorder channel mask order
+MIC_CHANNELS = ["left", "right", "front", "rear"]
+# "best" leaves the front mic only for a channel with at least this much more SNR
+BEST_MIC_MARGIN_DB = 1.0
+# ... and decides only on a capture where some channel has this much SNR
+BEST_MIC_MIN_SNR_DB = 10.0
+# Use /listenUserStream and start playing the first sentence while the rest is generated
+STREAM_REPLIES = True
+# Seconds without reply audio before a filler phrase + thinking gesture start
+FILLER_DELAY = 2.0
+RECORD_SECONDS = 3
+MAX_UTTERANCE_SECONDS = 12.0
+TRAILING_SILENCE_SECONDS = 0.8
+IDLE_TIMEOUT = 15.0
+# Time per object (3 minutes)
+OBJECT_SECONDS = 180.0
+VAD_CALIBRATION_SECONDS = 2
+
+PRELOAD_MANIFEST = "preload_manifest.json"
+PRELOAD_WORKERS = 4
+
+TURN_TRACE_FILE = "turn_trace.jsonl"
+
+# (connect, read) timeouts per server endpoint, in seconds. For streamed
+# replies the read timeout bounds the gap between two messages.
+HTTP_TIMEOUTS = {
+    "/startScenario": (2.0, 10.0),
+    "/ttsBytes": (2.0, 10.0),
+    "/ttsBatch": (2.0, 30.0),
+    "/listenUser": (2.0, 30.0),
+    "/listenUserStream": (2.0, 30.0),
+    "/ready": (1.0, 2.0),
+}
+# How long to wait for the server's /ready probe at startup, and how often to poll
+READY_TIMEOUT = 60.0
+READY_POLL_INTERVAL = 0.5
+# Keep-alive connections to the server (listen request + filler/idle prompts)
+HTTP_POOL_SIZE = 4
+# /ttsBytes is idempotent: retried on connection errors and 5xx
+TTS_RETRIES = 2
+TTS_RETRY_BACKOFF = 0.3
+
+# Also write every capture and reply segment to LOCAL_TEMP_DIR (--keep-audio);
+# the audio path itself never touches the disk
+KEEP_AUDIO = False
+
+
+def scripted_lines(objects):
+    """
+    Every fixed line main() can say, in the order it first says them.
+    """
+    lines = [GREETING_TEXT, INTRODUCTION_TEXT, LETS_START_TEXT]
+    for obj_name in objects:
+        lines.append(INSTRUCTION_TEMPLATE.format(obj_name))
+        lines.append(TIME_UP_TEMPLATE.format(obj_name))
+    lines.extend(IDLE_MESSAGES)
+    lines.extend(FILLER_PHRASES)
+    lines.append(FINAL_TEXT)
+    return lines
 
-# -------------------------------------------------------------------------------
-# Utility function to mix (sum) a multichannel WAV down to mono
-# -------------------------------------------------------------------------------
-
-def sum_to_mono(in_wav_file, out_wav_file):
-    import wave, struct
-
-    w_in = None
-    w_out = None
-    try:
-        w_in = wave.open(in_wav_file, 'rb')
-        params = w_in.getparams()  # (nchannels, sampwidth, framerate, nframes, ...)
-        n_channels, sampwidth, framerate, n_frames = params[0], params[1], params[2], params[3]
-
-        if sampwidth != 2:
-            raise ValueError("Only 16-bit PCM supported by sum_to_mono() in this example.")
-
-        frames = w_in.readframes(n_frames)
-        # Close the input file early (it's fully read)
-        w_in.close()
-        w_in = None
-
-        samples = struct.unpack("<{}h".format(n_frames * n_channels), frames)
-
-        # Average across channels
-        mono_samples = []
-        for i in range(0, len(samples), n_channels):
-            frame_channels = samples[i : i + n_channels]
-            avg = sum(frame_channels) // n_channels
-            mono_samples.append(avg)
-
-        mono_data = struct.pack("<{}h".format(len(mono_samples)), *mono_samples)
-
-        w_out = wave.open(out_wav_file, 'wb')
-        w_out.setnchannels(1)
-        w_out.setsampwidth(sampwidth)
-        w_out.setframerate(framerate)
-        w_out.writeframes(mono_data)
-        w_out.close()
-        w_out = None
-
-        print("[sum_to_mono] Successfully wrote mono WAV:", out_wav_file)
-
-    except Exception as e:
-        print("[sum_to_mono] Error mixing to mono:", e)
-    finally:
-        # In case of an error above, close files if still open
-        if w_in:
-            try:
-                w_in.close()
-            except:
-                pass
-        if w_out:
-            try:
-                w_out.close()
-            except:
-                pass
 
 # Gestures for speaking
 SPEAKING_GESTURES = [
@@ -134,73 +202,418 @@ def wave_hand(posture_proxy, motion_proxy, hand="right", speed=2):
     except Exception as e:
         print("[wave_hand] Error waving {} hand: {}".format(hand, e))
 
-def launch_random_gestures(managerProxy, gestures, duration):
+def get_wav_duration(wav_data):
     """
-    Launch random gestures with an 8-second wait between them.
-    If there isn't enough time left to complete another gesture, skip launching it.
+    Duration of in-memory WAV bytes, parsed from the header.
     """
-    start_time = time.time()
-    current_gesture = None
-    gesture_duration = 8.0
+    try:
+        return wav_header_duration(wav_data)
+    except Exception as e:
+        print("[get_wav_duration] Error reading WAV data: {}".format(e))
+        return 0
+
 
+def archive_audio(name, wav_data):
+    """
+    Write 'wav_data' to LOCAL_TEMP_DIR/name when KEEP_AUDIO is set.
+    """
+    if not KEEP_AUDIO or not wav_data:
+        return
     try:
-        while time.time() - start_time < duration:
-            remaining_time = duration - (time.time() - start_time)
-            if remaining_time < gesture_duration:
-                print("[Speaking] Not enough time for another gesture. Stopping gestures.")
-                break
+        with open(os.path.join(LOCAL_TEMP_DIR, name), "wb") as f:
+            f.write(wav_data)
+    except Exception as e:
+        print("[archive_audio] Could not write {}: {}".format(name, e))
 
-            if current_gesture:
-                managerProxy.stopBehavior(current_gesture)
+# -------------------------------------------------------------------------------
+# Turn tracing
+# -------------------------------------------------------------------------------
+class TurnTrace(object):
+    """
+    Timing spans of the current turn. end() appends the turn as one compact
+    JSON line ({turn_id, ts, total_ms, spans: [{stage, at_ms, ms}],
+    counts: {...}, ...}) to 'path'. Spans come from any thread; spans recorded while no turn is open
+    are dropped.
 
-            current_gesture = random.choice(gestures)
-            print("[Speaking] Launching gesture: {}".format(current_gesture))
-            managerProxy.post.runBehavior(current_gesture)
+    With an 'archive' (SessionArchive), end() also appends the turn there,
+    together with the texts given to note() and the audio given to attach().
+    """
 
-            time.sleep(gesture_duration)
-    except Exception as e:
-        print("[Speaking] Error managing gestures: {}".format(e))
-    finally:
-        if current_gesture:
+    def __init__(self, path, archive=None):
+        self.path = path
+        self.archive = archive
+        self.turn_id = None
+        self._start = None
+        self._spans = []
+        self._counts = {}
+        self._fields = {}
+        self._marks = {}
+        self._record = {}
+        self._blobs = {}
+        self._lock = threading.Lock()
+
+    def begin(self, **fields):
+        with self._lock:
+            self.turn_id = uuid.uuid4().hex[:12]
+            self._start = time.time()
+            self._spans = []
+            self._counts = {}
+            self._fields = fields
+            self._marks = {}
+            self._record = {}
+            self._blobs = {}
+        return self.turn_id
+
+    def note(self, **fields):
+        """
+        Archive-only fields of this turn (e.g. transcript, reply).
+        """
+        with self._lock:
+            if self.archive is not None and self.turn_id is not None:
+                self._record.update(fields)
+
+    def attach(self, name, data):
+        """
+        Archive-only audio of this turn (e.g. "capture", "reply_0").
+        """
+        with self._lock:
+            if self.archive is not None and self.turn_id is not None and data:
+                self._blobs[name] = data
+
+    def mark(self, name, when=None):
+        """
+        Remember a point in time of this turn (e.g. "speech_end") and return it.
+        """
+        if when is None:
+            when = time.time()
+        with self._lock:
+            self._marks[name] = when
+        return when
+
+    def record_since(self, stage, mark):
+        """
+        Record a span from mark 'mark' until now (if the mark was set).
+        """
+        start_t = self._marks.get(mark)
+        if start_t is not None:
+            self.record(stage, start_t)
+
+    def record(self, stage, start_t, end_t=None):
+        if end_t is None:
+            end_t = time.time()
+        with self._lock:
+            if self.turn_id is None:
+                return
+            self._spans.append({
+                "stage": stage,
+                "at_ms": int((start_t - self._start) * 1000),
+                "ms": int((end_t - start_t) * 1000)
+            })
+
+    def count(self, name, n=1):
+        """
+        Add 'n' to a per-turn counter (e.g. "http_new_connections").
+        """
+        with self._lock:
+            if self.turn_id is not None:
+                self._counts[name] = self._counts.get(name, 0) + n
+
+    @contextlib.contextmanager
+    def span(self, stage):
+        start_t = time.time()
+        try:
+            yield
+        finally:
+            self.record(stage, start_t)
+
+    def discard(self):
+        with self._lock:
+            self.turn_id = None
+
+    def end(self, **fields):
+        with self._lock:
+            if self.turn_id is None:
+                return
+            entry = {
+                "turn_id": self.turn_id,
+                "ts": round(self._start, 3),
+                "total_ms": int((time.time() - self._start) * 1000),
+                "spans": self._spans
+            }
+            if self._counts:
+                entry["counts"] = self._counts
+            entry.update(self._fields)
+            entry.update(fields)
+            record, blobs = dict(entry, **self._record), self._blobs
+            self.turn_id = None
+        try:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        except Exception as e:
+            print("[TurnTrace] Could not write trace:", e)
+        if self.archive is not None:
             try:
-                managerProxy.stopBehavior(current_gesture)
-                print("[Speaking] Stopped gesture: {}".format(current_gesture))
+                self.archive.append(record, blobs)
             except Exception as e:
-                print("[Speaking] Error stopping final gesture: {}".format(e))
+                print("[TurnTrace] Could not archive turn:", e)
+
+
+turn_trace = TurnTrace(os.path.join(LOCAL_TEMP_DIR, TURN_TRACE_FILE))
 
-def get_wav_duration(filepath):
-    try:
-        wav_file = wave.open(filepath, 'r')
-        frames = wav_file.getnframes()
-        rate = wav_file.getframerate()
-        wav_file.close()
-        duration = frames / float(rate)
-        return duration
-    except Exception as e:
-        print("[get_wav_duration] Error reading WAV file: {}".format(e))
-        return 0
+
+def trace_headers():
+    """
+    Headers linking a request to the current turn on the server side.
+    """
+    return {"X-Turn-Id": turn_trace.turn_id} if turn_trace.turn_id else {}
+
+# -------------------------------------------------------------------------------
+# Pooled HTTP client for the scenario server
+# -------------------------------------------------------------------------------
+class ScenarioClient(object):
+    """
+    One keep-alive requests.Session shared by every call to the scenario
+    server, so turns and filler/idle prompts reuse open TCP connections
+    instead of paying connection setup each time.
+
+    Counts requests, opened connections and retries (stats()); requests
+    and retries are also counted per turn ("http_requests", "http_retries"),
+    main() adds the connections a turn had to open ("http_new_connections").
+    """
+
+    def __init__(self, pool_size=HTTP_POOL_SIZE):
+        self.pool_size = pool_size
+        self._session = None
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.retries = 0
+
+    def url(self, path):
+        return "http://{}:{}{}".format(SCENARIO_SERVER_HOST, SCENARIO_SERVER_PORT, path)
+
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                self._session = session
+            return self._session
+
+    def opened_connections(self):
+        """
+        Connections opened so far by the session's pools (urllib3 counters).
+        """
+        try:
+            pools = self.session().get_adapter(self.url("/")).poolmanager.pools
+            return sum(pools[key].num_connections for key in pools.keys())
+        except Exception:
+            return 0
+
+    def request(self, method, path, **kwargs):
+        """
+        requests.Session.request() on the shared session, with the
+        endpoint's (connect, read) timeout unless one is given.
+        """
+        kwargs.setdefault("timeout", HTTP_TIMEOUTS.get(path, (2.0, 30.0)))
+        with self._lock:
+            self.requests += 1
+        turn_trace.count("http_requests")
+        return self.session().request(method, self.url(path), **kwargs)
+
+    def get_with_retries(self, path, retries, backoff, **kwargs):
+        """
+        GET an idempotent endpoint, retrying connection errors, timeouts
+        and 5xx replies with exponential backoff.
+        """
+        import requests
+        for attempt in range(retries + 1):
+            if attempt:
+                time.sleep(backoff * (2 ** (attempt - 1)))
+                with self._lock:
+                    self.retries += 1
+                turn_trace.count("http_retries")
+            try:
+                r = self.request("GET", path, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == retries:
+                    raise
+                print("[ScenarioClient] GET {} failed ({}), retrying...".format(path, e))
+                continue
+            if r.status_code < 500 or attempt == retries:
+                return r
+            print("[ScenarioClient] GET {} returned {}, retrying...".format(path, r.status_code))
+
+    def stats(self):
+        return {"requests": self.requests, "new_connections": self.opened_connections(),
+                "retries": self.retries}
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+http_client = ScenarioClient()
 
 # -------------------------------------------------------------------------------
 # Helper: Minimal HTTP POST to /listenUser
 # -------------------------------------------------------------------------------
-def post_audio_for_stt(audio_path, current_instruction=""):
+# Ask the server for raw WAV bodies / binary frames; it falls back to base64 JSON
+ACCEPT_BINARY_AUDIO = "audio/wav, application/json;q=0.5"
+ACCEPT_BINARY_FRAMES = "application/x-naochat-frames, application/x-ndjson;q=0.5"
+
+
+# Conversation session on the scenario server and its TTS voice settings
+# (set by start_scenario_session)
+scenario_session_id = None
+server_tts_voice = None
+
+
+def wait_for_server_ready(timeout=READY_TIMEOUT, interval=READY_POLL_INTERVAL):
+    """
+    Poll GET /ready until the server has warmed up its backend clients, or
+    'timeout' seconds have passed. Servers without /ready count as ready.
+    Returns True if the server is ready.
     """
-    POST the audio file to scenario_logic.py: /listenUser
-    Expecting JSON with { recognized_text, chatgpt_response, wav_base64 }
+    deadline = time.time() + timeout
+    while True:
+        try:
+            r = http_client.request("GET", "/ready")
+            if r.status_code == 200:
+                status = r.json()
+                print("[wait_for_server_ready] Server ready ({} ms after its start): {}".format(
+                    status.get("startup", {}).get("ready_ms"),
+                    ", ".join("{}={}".format(name, b.get("state"))
+                              for name, b in sorted(status.get("backends", {}).items()))))
+                return True
+            if r.status_code != 503:
+                return True
+        except Exception as e:
+            print("[wait_for_server_ready] Server not reachable yet:", e)
+        if time.time() >= deadline:
+            print("[wait_for_server_ready] Server not ready after {:.0f}s, starting anyway.".format(timeout))
+            return False
+        time.sleep(interval)
+
+
+# Start-up phases of the bridge, in ms since the process started
+startup_timings = collections.OrderedDict()
+
+
+def mark_startup(phase):
+    startup_timings[phase + "_ms"] = int((time.time() - PROCESS_START) * 1000)
+
+
+def start_scenario_session():
+    """
+    GET /startScenario and remember the session id it returns; every later
+    /listenUser* request sends it back in X-Session-Id.
+    """
+    global scenario_session_id, server_tts_voice
+    try:
+        r = http_client.request("GET", "/startScenario")
+        js = r.json()
+        scenario_session_id = js.get("session_id")
+        server_tts_voice = js.get("tts_voice")
+        print("[start_scenario_session] Session:", scenario_session_id)
+    except Exception as e:
+        print("[start_scenario_session] Exception:", e)
+
+
+def header_text(r, name):
+    """
+    Decode a percent-encoded UTF-8 metadata header (e.g. X-Recognized-Text).
+    """
+    text = unquote(r.headers.get(name, ""))
+    return text.decode("utf-8") if isinstance(text, bytes) else text
+
+
+def upload_request_args(audio, current_instruction):
+    """
+    requests keyword arguments carrying the user audio: a LiveUpload is
+    streamed as a raw chunked body (instruction in a header), anything else
+    is sent as a multipart file.
+    """
+    headers = trace_headers()
+    if scenario_session_id:
+        headers["X-Session-Id"] = scenario_session_id
+    if isinstance(audio, LiveUpload):
+        headers["Content-Type"] = LiveUpload.content_type
+        headers["X-Current-Instruction"] = quote(current_instruction.encode("utf-8"))
+        return {"data": iter(audio), "headers": headers}
+    # The 'current_instruction' will be appended to user text on the server side
+    return {
+        "files": {"file": upload_part(audio)},
+        "data": {"current_instruction": current_instruction},
+        "headers": headers
+    }
+
+
+def upload_part(audio):
+    """
+    Multipart 'file' entry for an upload: Ogg captures as they are, WAV as
+    FLAC when the optional soundfile package is installed (Google STT takes
+    it directly), plain WAV otherwise.
+    """
+    f = audio if hasattr(audio, "read") else open(audio, "rb")
+    try:
+        wav_bytes = f.read()
+    finally:
+        f.close()
+    if audio_format(wav_bytes) == "ogg":
+        # Already compressed on the robot ("-ogg" capture profiles)
+        return ("capture.ogg", wav_bytes, "audio/ogg")
+    try:
+        flac_bytes = wav_bytes_to_flac(wav_bytes)
+    except Exception as e:
+        print("[upload_part] FLAC encoding failed, sending WAV:", e)
+        flac_bytes = None
+    if flac_bytes is not None:
+        return ("capture.flac", flac_bytes, "audio/flac")
+    return ("capture.wav", wav_bytes, "audio/wav")
+
+
+def parse_listen_response(r):
+    """
+    (recognized_text, chatgpt_response, wav_bytes) from a /listenUser reply,
+    whether it came back as a raw WAV body or as base64 JSON.
+    """
+    if r.headers.get("Content-Type", "").startswith("audio/"):
+        return (header_text(r, "X-Recognized-Text"),
+                header_text(r, "X-Chatgpt-Response"),
+                r.content)
+    js = r.json()
+    wav_b64 = js.get("wav_base64")
+    return (js.get("recognized_text", ""),
+            js.get("chatgpt_response", ""),
+            base64.b64decode(wav_b64) if wav_b64 else None)
+
+
+def post_audio_for_stt(audio, current_instruction=""):
+    """
+    POST the audio to scenario_logic.py: /listenUser
+    Expecting a raw WAV body with X-Recognized-Text / X-Chatgpt-Response
+    headers (or JSON with { recognized_text, chatgpt_response, wav_base64 }
+    from older servers); see parse_listen_response().
+
+    'audio' is a file-like object holding WAV data (or a WAV file path),
+    or a LiveUpload streamed to the server while the user is still talking.
 
     'current_instruction' is appended to the ChatGPT prompt,
     ensuring lines like "Şimdi kalem nesnesi..." are part of the conversation context.
     """
-    import requests
     try:
-        with open(audio_path, "rb") as f:
-            files = {"file": f}
-            # The 'current_instruction' will be appended to user text on the server side
-            data = {"current_instruction": current_instruction}
-            url = "http://{}:{}/listenUser".format(SCENARIO_SERVER_HOST, SCENARIO_SERVER_PORT)
-            start_t = time.time()
-            r = requests.post(url, files=files, data=data, timeout=60)
-            delay = time.time() - start_t
+        kwargs = upload_request_args(audio, current_instruction)
+        kwargs["headers"]["Accept"] = ACCEPT_BINARY_AUDIO
+        start_t = time.time()
+        r = http_client.request("POST", "/listenUser", **kwargs)
+        delay = time.time() - start_t
+        turn_trace.record("listen_user", start_t)
 
         if r.status_code == 200:
             return r, delay
@@ -211,58 +624,625 @@ def post_audio_for_stt(audio_path, current_instruction=""):
         print("[post_audio_for_stt] Exception:", e)
         return None, 0
 
-def download_tts_to_file(prompt, local_path):
-    import requests
-    import base64
-    
-    # Build the URL with query params rather than POST
-    tts_url = "http://{}:{}/ttsBytes".format(SCENARIO_SERVER_HOST, SCENARIO_SERVER_PORT)
+
+def _read_exact(raw, n):
+    buf = b""
+    while len(buf) < n:
+        chunk = raw.read(n - len(buf))
+        if not chunk:
+            raise EOFError("stream ended inside a frame")
+        buf += chunk
+    return buf
+
+
+def iter_frames(raw):
+    """
+    Decode length-prefixed binary frames (JSON header + raw WAV) from a
+    streamed response body.
+    """
+    while True:
+        prefix = raw.read(4)
+        if not prefix:
+            return
+        if len(prefix) < 4:
+            prefix += _read_exact(raw, 4 - len(prefix))
+        header = json.loads(_read_exact(raw, struct.unpack(">I", prefix)[0]).decode("utf-8"))
+        audio_len = struct.unpack(">I", _read_exact(raw, 4))[0]
+        if audio_len:
+            header["wav_data"] = _read_exact(raw, audio_len)
+        yield header
+
+
+def stream_listen_user(audio, current_instruction=""):
+    """
+    POST the audio to scenario_logic.py: /listenUserStream and yield the
+    messages as they arrive: { recognized_text }, then
+    { index, text, wav_data } per sentence, then { done, chatgpt_response }.
+    Binary frames are preferred; NDJSON with base64 audio is still understood.
+    """
+    try:
+        kwargs = upload_request_args(audio, current_instruction)
+        kwargs["headers"]["Accept"] = ACCEPT_BINARY_FRAMES
+        start_t = time.time()
+        r = http_client.request("POST", "/listenUserStream", stream=True, **kwargs)
+        turn_trace.record("response_headers", start_t)
+    except Exception as e:
+        print("[stream_listen_user] Exception:", e)
+        return
+
+    if r.status_code != 200:
+        print("[stream_listen_user] HTTP error:", r.status_code, r.text)
+        return
+    try:
+        if r.headers.get("Content-Type", "").startswith("application/x-naochat-frames"):
+            for msg in iter_frames(r.raw):
+                yield msg
+        else:
+            for line in r.iter_lines():
+                if line:
+                    msg = json.loads(line)
+                    if "wav_base64" in msg:
+                        msg["wav_data"] = base64.b64decode(msg.pop("wav_base64"))
+                    yield msg
+    except Exception as e:
+        print("[stream_listen_user] Stream error:", e)
+    finally:
+        r.close()
+
+
+class SegmentPlayer(object):
+    """
+    Plays uploaded reply segments on Pepper one after another on a
+    background thread, so segment N plays while segment N+1 is still being
+    generated, downloaded and uploaded. The gesture scheduler is told when
+    speech starts, how long the segments queued so far will talk, and when
+    the whole reply has been played (finish()); short gaps between segments
+    do not count as the end of speech.
+    """
+
+    def __init__(self, audio_player, gestures=None):
+        self.audio_player = audio_player
+        self.gestures = gestures
+        self._queue = Queue.Queue()
+        self._lock = threading.Lock()
+        self._speaking = False
+        self._queued_seconds = 0.0  # queued before speech started
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        first = True
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            remote_path, duration = item
+            if first:
+                # Time from the end of the user's speech to the robot's reply
+                turn_trace.record_since("first_audio", "speech_end")
+                first = False
+            if self.gestures is not None and not self._speaking:
+                with self._lock:
+                    self._speaking = True
+                    queued, self._queued_seconds = self._queued_seconds, 0.0
+                self.gestures.start_speaking(queued or None)
+            try:
+                with turn_trace.span("play"):
+                    self.audio_player.playFile(remote_path)
+            except Exception as e:
+                print("[SegmentPlayer] play error:", e)
+        if self.gestures is not None and self._speaking:
+            self.gestures.stop_speaking()
+
+    def enqueue(self, remote_path, duration=None):
+        if self.gestures is not None and duration:
+            # The expected end of speech grows as soon as a segment is known
+            with self._lock:
+                if self._speaking:
+                    self.gestures.extend_speaking(duration)
+                else:
+                    self._queued_seconds += duration
+        self._queue.put((remote_path, duration))
+
+    def finish(self):
+        """
+        Wait until every queued segment has been played.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+def download_tts(prompt):
+    """
+    GET /ttsBytes for 'prompt' and return the WAV bytes (None on failure).
+    Failed attempts are retried with backoff (the call is idempotent).
+    """
     # If your server only recognizes ?prompt=... for text:
     params = {"prompt": prompt}
 
     try:
-        r = requests.get(tts_url, params=params, timeout=10)
+        headers = trace_headers()
+        headers["Accept"] = ACCEPT_BINARY_AUDIO
+        r = http_client.get_with_retries("/ttsBytes", TTS_RETRIES, TTS_RETRY_BACKOFF,
+                                         params=params, headers=headers)
         if r.status_code != 200:
-            print("[download_tts_to_file] Error:", r.text)
-            return False
+            print("[download_tts] Error:", r.text)
+            return None
 
-        js = r.json()
-        if "wav_base64" not in js:
-            print("[download_tts_to_file] 'wav_base64' not found in response")
-            return False
+        if r.headers.get("Content-Type", "").startswith("audio/"):
+            wav_data = r.content
+        else:
+            js = r.json()
+            if "wav_base64" not in js:
+                print("[download_tts] 'wav_base64' not found in response")
+                return None
+            wav_data = base64.b64decode(js["wav_base64"])
+        return wav_data
+    except Exception as e:
+        print("[download_tts] exception:", e)
+        return None
 
-        wav_data = base64.b64decode(js["wav_base64"])
-        with open(local_path, "wb") as f:
-            f.write(wav_data)
 
-        return True
+def download_tts_batch(texts):
+    """
+    POST /ttsBatch for all 'texts' and yield (text, wav_bytes) for each line
+    as soon as the server has synthesized it. Lines that failed are not
+    yielded; neither is anything if the server has no /ttsBatch.
+    """
+    headers = trace_headers()
+    headers["Accept"] = ACCEPT_BINARY_FRAMES
+    try:
+        r = http_client.request("POST", "/ttsBatch", json={"texts": list(texts)}, headers=headers, stream=True)
     except Exception as e:
-        print("[download_tts_to_file] exception:", e)
-        return False
+        print("[download_tts_batch] Exception:", e)
+        return
+
+    try:
+        if r.status_code != 200:
+            print("[download_tts_batch] HTTP error:", r.status_code)
+            return
+        if r.headers.get("Content-Type", "").startswith("application/x-naochat-frames"):
+            for msg in iter_frames(r.raw):
+                if "wav_data" in msg:
+                    yield texts[msg["index"]], msg["wav_data"]
+                elif "error" in msg:
+                    print(u"[download_tts_batch] {}: {}".format(msg["error"], texts[msg["index"]]))
+        else:
+            for result in r.json().get("results", []):
+                if "wav_base64" in result:
+                    yield texts[result["index"]], base64.b64decode(result["wav_base64"])
+    except Exception as e:
+        print("[download_tts_batch] Stream error:", e)
+    finally:
+        r.close()
 
 
-def scp_and_play(local_path, remote_filename, audio_player):
+def upload_and_play(wav_data, remote_filename, audio_player, sftp_pool):
     try:
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(ROBOT_IP, username="nao", password=NAO_PASSWORD)
-        sftp = ssh.open_sftp()
         remote_path = os.path.join(PEPPER_TEMP_DIR, remote_filename)
-        sftp.put(local_path, remote_path)
-        sftp.close()
-        ssh.close()
-        audio_player.playFile(remote_path)
+        sftp_pool.putfo(wav_data, remote_path)
+        with turn_trace.span("play"):
+            audio_player.playFile(remote_path)
     except Exception as e:
-        print("[scp_and_play] error:", e)
+        print("[upload_and_play] error:", e)
+
+# -------------------------------------------------------------------------------
+# Persistent SSH/SFTP session to the robot
+# -------------------------------------------------------------------------------
+class SFTPSessionPool(object):
+    """
+    Long-lived, thread-safe SFTP access to Pepper.
+
+    One SSH transport is opened once and kept alive; up to 'max_channels'
+    SFTP channels are multiplexed over it so concurrent transfers do not
+    queue behind each other. A transfer that fails closes only its own
+    channel and is retried once; the transport is reconnected (lazily)
+    only when the link itself has dropped.
+    """
+
+    def __init__(self, host, username, password, max_channels=3, keepalive=15):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.keepalive = keepalive
+
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(max_channels)
+        self._ssh = None
+        self._idle_channels = []
+
+        self.connects = 0
+        self.transfers = 0
+        self.last_transfer_ms = 0.0
+
+    def _is_connected(self):
+        if self._ssh is None:
+            return False
+        transport = self._ssh.get_transport()
+        return transport is not None and transport.is_active()
+
+    def _close_locked(self):
+        for sftp in self._idle_channels:
+            try:
+                sftp.close()
+            except Exception:
+                pass
+        self._idle_channels = []
+        if self._ssh is not None:
+            try:
+                self._ssh.close()
+            except Exception:
+                pass
+        self._ssh = None
+
+    def connect(self):
+        """
+        Open the SSH transport if it is not already up.
+        """
+        with self._lock:
+            if self._is_connected():
+                return
+            self._close_locked()
+            start_t = time.time()
+            ssh = paramiko.SSHClient()
+            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            ssh.connect(self.host, username=self.username, password=self.password)
+            ssh.get_transport().set_keepalive(self.keepalive)
+            self._ssh = ssh
+            self.connects += 1
+            print("[SFTPSessionPool] Connected to {} in {:.0f} ms".format(
+                self.host, (time.time() - start_t) * 1000.0))
+
+    def close(self):
+        with self._lock:
+            self._close_locked()
+
+    def _acquire_channel(self):
+        self.connect()
+        with self._lock:
+            if self._idle_channels:
+                return self._idle_channels.pop()
+            return self._ssh.open_sftp()
+
+    def _release_channel(self, sftp, broken):
+        with self._lock:
+            if broken or not self._is_connected():
+                try:
+                    sftp.close()
+                except Exception:
+                    pass
+            else:
+                self._idle_channels.append(sftp)
+
+    def _transfer(self, label, fn):
+        """
+        Run 'fn(sftp)' on a pooled channel, reconnecting and retrying once
+        if the connection turned out to be dead. Traced as "sftp_<op>".
+        """
+        self._slots.acquire()
+        try:
+            for attempt in (1, 2):
+                sftp = None
+                start_t = time.time()
+                try:
+                    sftp = self._acquire_channel()
+                    result = fn(sftp)
+                except (paramiko.SSHException, socket.error, EOFError) as e:
+                    if sftp is not None:
+                        self._release_channel(sftp, broken=True)
+                    # Other transfers may still be using the transport: only
+                    # tear it down (and reconnect) when it is dead itself
+                    with self._lock:
+                        if not self._is_connected():
+                            self._close_locked()
+                    if attempt == 2:
+                        raise
+                    print("[SFTPSessionPool] {} failed ({}), reconnecting...".format(label, e))
+                    continue
+                except Exception:
+                    if sftp is not None:
+                        self._release_channel(sftp, broken=False)
+                    raise
+
+                self._release_channel(sftp, broken=False)
+                self.transfers += 1
+                self.last_transfer_ms = (time.time() - start_t) * 1000.0
+                turn_trace.record("sftp_" + label.split(" ", 1)[0], start_t)
+                print("[SFTPSessionPool] {} took {:.0f} ms".format(label, self.last_transfer_ms))
+                return result
+        finally:
+            self._slots.release()
+
+    def stat(self, remote_path):
+        return self._transfer("stat {}".format(remote_path),
+                              lambda sftp: sftp.stat(remote_path))
+
+    def putfo(self, data, remote_path):
+        """
+        Upload in-memory bytes (no local file).
+        """
+        return self._transfer("put {}".format(remote_path),
+                              lambda sftp: sftp.putfo(io.BytesIO(data), remote_path))
+
+    def getfo(self, remote_path):
+        """
+        Download a remote file into memory and return its bytes.
+        """
+        def fetch(sftp):
+            buf = io.BytesIO()
+            sftp.getfo(remote_path, buf)
+            return buf.getvalue()
+        return self._transfer("get {}".format(remote_path), fetch)
+
+# -------------------------------------------------------------------------------
+# Scripted audio: synthesized, uploaded and loaded on Pepper once at startup
+# -------------------------------------------------------------------------------
+def run_parallel(fn, items, workers):
+    """
+    Call fn(item) for every item on up to 'workers' threads and wait for all.
+    """
+    pending = list(items)
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                item = pending.pop(0)
+            try:
+                fn(item)
+            except Exception as e:
+                print("[run_parallel] error:", e)
+
+    threads = [threading.Thread(target=worker) for _ in range(min(workers, len(pending)))]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    for t in threads:
+        t.join()
+
+
+class ScriptedAudio(object):
+    """
+    Keeps every scripted line ready to play on the robot.
+
+    preload() fetches every line that is not on the robot yet (per the
+    manifest) in one /ttsBatch request, uploads each to PEPPER_TEMP_DIR as
+    soon as it arrives and registers them with ALAudioPlayer.loadFile, so
+    playing a scripted line is just ALAudioPlayer.play(id).
+
+    Lines are keyed by their text and the server's TTS 'voice' settings, so
+    a change of voice, pitch or rate on the server synthesizes them anew.
+    """
+
+    def __init__(self, audio_player, sftp_pool, manifest_path, voice=None):
+        self.audio_player = audio_player
+        self.sftp_pool = sftp_pool
+        self.manifest_path = manifest_path
+        self.voice = json.dumps(voice, sort_keys=True)
+        self.manifest = {}
+        self.file_ids = {}
+        self._lock = threading.Lock()
+
+        if os.path.exists(manifest_path):
+            try:
+                with open(manifest_path, "r") as f:
+                    self.manifest = json.load(f)
+            except Exception as e:
+                print("[ScriptedAudio] Could not read manifest:", e)
+
+    def text_key(self, text):
+        return hashlib.sha1(u"{}\x1f{}".format(self.voice, text).encode("utf-8")).hexdigest()[:16]
+
+    def _on_robot(self, key):
+        """
+        True if the manifest lists the file and it is still on the robot.
+        """
+        entry = self.manifest.get(key)
+        if not entry:
+            return False
+        try:
+            return self.sftp_pool.stat(entry["remote_path"]).st_size == entry["size"]
+        except Exception:
+            return False
+
+    def _store(self, text, wav_data):
+        """
+        Upload one synthesized line to the robot and add it to the manifest.
+        """
+        key = self.text_key(text)
+        remote_filename = "scripted_{}.wav".format(key)
+        remote_path = os.path.join(PEPPER_TEMP_DIR, remote_filename)
+        self.sftp_pool.putfo(wav_data, remote_path)
+        archive_audio(remote_filename, wav_data)
+        with self._lock:
+            self.manifest[key] = {
+                "text": text,
+                "remote_path": remote_path,
+                "size": len(wav_data)
+            }
+
+    def _fetch_one(self, text):
+        wav_data = download_tts(text)
+        if wav_data is None:
+            print(u"[ScriptedAudio] TTS failed for: {}".format(text))
+            return
+        self._store(text, wav_data)
+
+    def _load(self, text):
+        key = self.text_key(text)
+        entry = self.manifest.get(key)
+        if entry is None:
+            return
+        file_id = self.audio_player.loadFile(entry["remote_path"])
+        with self._lock:
+            self.file_ids[key] = file_id
+
+    def preload(self, texts):
+        start_t = time.time()
+        unique_texts = []
+        for text in texts:
+            if text not in unique_texts:
+                unique_texts.append(text)
+
+        missing = []
+
+        def check(text):
+            if not self._on_robot(self.text_key(text)):
+                with self._lock:
+                    missing.append(text)
+        run_parallel(check, unique_texts, PRELOAD_WORKERS)
+
+        # Everything missing in one round trip; lines are uploaded while
+        # the server is still synthesizing the rest
+        fetched = set()
+        if missing:
+            for text, wav_data in download_tts_batch(missing):
+                try:
+                    self._store(text, wav_data)
+                    fetched.add(text)
+                except Exception as e:
+                    print(u"[ScriptedAudio] Upload failed for {}: {}".format(text, e))
+        # One /ttsBytes per line the batch did not deliver (older server, errors)
+        run_parallel(self._fetch_one, [text for text in missing if text not in fetched], PRELOAD_WORKERS)
+
+        run_parallel(self._load, unique_texts, PRELOAD_WORKERS)
+
+        try:
+            with open(self.manifest_path, "w") as f:
+                json.dump(self.manifest, f)
+        except Exception as e:
+            print("[ScriptedAudio] Could not write manifest:", e)
+
+        print("[ScriptedAudio] {} of {} lines ready in {:.2f}s".format(
+            len(self.file_ids), len(unique_texts), time.time() - start_t))
+
+    def play(self, text):
+        """
+        Play a scripted line and wait for it to finish. Lines that were not
+        preloaded fall back to download + upload + playFile.
+        """
+        file_id = self.file_ids.get(self.text_key(text))
+        if file_id is not None:
+            try:
+                self.audio_player.play(file_id)
+                return True
+            except Exception as e:
+                print("[ScriptedAudio] play error:", e)
+
+        wav_data = download_tts(text)
+        if wav_data is not None:
+            upload_and_play(wav_data, "scripted_fallback.wav", self.audio_player, self.sftp_pool)
+            return True
+        return False
+
+    def play_async(self, text):
+        """
+        Start a preloaded line without waiting for it. Returns the
+        ALAudioPlayer task id, or None if the line is not preloaded.
+        """
+        file_id = self.file_ids.get(self.text_key(text))
+        if file_id is None:
+            print(u"[ScriptedAudio] Not preloaded: {}".format(text))
+            return None
+        try:
+            return self.audio_player.post.play(file_id)
+        except Exception as e:
+            print("[ScriptedAudio] play error:", e)
+            return None
+
+    def unload(self):
+        try:
+            self.audio_player.unloadAllFiles()
+        except Exception as e:
+            print("[ScriptedAudio] unload error:", e)
+        self.file_ids = {}
 
 # -------------------------------------------------------------------------------
 # Module
 # -------------------------------------------------------------------------------
+class CaptureProfile(object):
+    """
+    Which microphones PepperBridge.record_audio() records, and in which
+    format. Profile names are "<mics>" or "<mics>-ogg":
+     - mics "all": the four channels, mixed to mono here (4x the bytes)
+            "front": the front microphone only
+            "best": the channel with the best signal-to-noise ratio. The
+            noise floor of every mic is measured during VAD calibration;
+            the first captures are recorded from all four mics until one
+            of them clearly holds speech, and the channel whose speech
+            stands out most from its noise floor is kept from then on
+            (front until then, and on near-ties).
+     - "-ogg": compressed on the robot (ALAudioRecorder writes Ogg/Vorbis)
+       and uploaded as-is; the server decodes it for STT. Single channel
+       only, so there is no "all-ogg".
+    Only file capture uses the profile: streaming capture always gets the
+    front microphone, ALAudioDevice's one channel at 16 kHz.
+    """
+
+    NAMES = ["all", "front", "best", "front-ogg", "best-ogg"]
+
+    def __init__(self, name):
+        if name not in self.NAMES:
+            raise ValueError("Unknown capture profile: {}".format(name))
+        self.name = name
+        self.mics, _, fmt = name.partition("-")
+        self.fmt = fmt or "wav"
+        self.channel = None if self.mics == "all" else "front"
+        self.measuring = self.mics == "best"
+        self.noise_db = None
+
+    def channel_mask(self):
+        """
+        ALAudioRecorder channel mask of the next capture.
+        """
+        if self.channel is None or self.measuring:
+            return [1, 1, 1, 1]
+        return [1 if mic == self.channel else 0 for mic in MIC_CHANNELS]
+
+    def record_format(self):
+        """
+        Format of the next capture (four channels are always WAV).
+        """
+        return "wav" if self.measuring else self.fmt
+
+    def set_noise(self, levels_db):
+        """
+        Noise floor of every mic in MIC_CHANNELS order (dBFS).
+        """
+        self.noise_db = list(levels_db)
+
+    def choose(self, speech_db):
+        """
+        While measuring, pick the channel whose speech level ('speech_db',
+        dBFS per mic) is highest above its noise floor. A capture without
+        clear speech on any mic leaves the choice for the next one.
+        """
+        if not self.measuring:
+            return
+        noise_db = self.noise_db or [-60.0] * len(MIC_CHANNELS)
+        snr = [speech - noise for speech, noise in zip(speech_db, noise_db)]
+        best = int(np.argmax(snr))
+        if snr[best] < BEST_MIC_MIN_SNR_DB:
+            return
+        front = MIC_CHANNELS.index("front")
+        if snr[best] < snr[front] + BEST_MIC_MARGIN_DB:
+            best = front
+        self.channel = MIC_CHANNELS[best]
+        self.measuring = False
+        print("[CaptureProfile] SNR per mic: {}; using {}".format(
+            ", ".join("{} {:.1f} dB".format(mic, level) for mic, level in zip(MIC_CHANNELS, snr)),
+            self.channel))
+
+
 class PepperBridge(ALModule):
-    def __init__(self, name, pip, pport):
+    def __init__(self, name, pip, pport, capture=None):
         ALModule.__init__(self, name)
+        self.capture = capture or CaptureProfile(CAPTURE_PROFILE)
         self.audio_recorder = None
         self.audio_player = None
+        self.sftp_pool = SFTPSessionPool(pip, "nao", NAO_PASSWORD)
 
         print("[PepperBridge] Connecting to Pepper proxies...")
         try:
@@ -273,14 +1253,17 @@ class PepperBridge(ALModule):
             sys.exit(1)
         print("[PepperBridge] Connected to Pepper audio modules.")
 
-    def record_audio(self, filepath, duration=3):
+        # Pay the SSH handshake once at startup instead of on every turn
+        try:
+            self.sftp_pool.connect()
+        except Exception as e:
+            print("[PepperBridge] SFTP connect failed, will retry lazily:", e)
+
+    def _record(self, duration, fmt, channels):
         """
-        Record from Pepper's mic for 'duration' seconds (4-ch),
-        SCP to local 'filepath', then mix to mono.
+        Record 'duration' seconds on Pepper and pull the file into memory.
         """
-        remote_pepper_record_path = "/home/nao/recordings/capture.wav"
-        # Record from all 4 mics
-        channels = [1, 1, 1, 1]
+        remote_pepper_record_path = "/home/nao/recordings/capture." + fmt
         sampleRate = 16000
 
         try:
@@ -288,36 +1271,315 @@ class PepperBridge(ALModule):
         except RuntimeError:
             pass  # Not recording currently
 
-        try:
-            # 1) Record multi-channel WAV on Pepper
+        # 1) Record on Pepper
+        with turn_trace.span("record_audio"):
             self.audio_recorder.startMicrophonesRecording(
-                remote_pepper_record_path, "wav", sampleRate, channels
+                remote_pepper_record_path, fmt, sampleRate, channels
             )
             time.sleep(duration)
             self.audio_recorder.stopMicrophonesRecording()
 
-            # 2) SCP from Pepper to local
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            ssh.connect(ROBOT_IP, username="nao", password=NAO_PASSWORD)
-            sftp = ssh.open_sftp()
-            sftp.get(remote_pepper_record_path, filepath)
-            sftp.close()
-            ssh.close()
+        # 2) Pull the recording over the persistent SFTP session
+        data = self.sftp_pool.getfo(remote_pepper_record_path)
+        turn_trace.count("capture_bytes", len(data))
+        return data
 
-            # 3) Convert to single-channel
-            sum_to_mono(filepath, filepath)
+    def record_audio(self, duration=3):
+        """
+        Record from Pepper's mics for 'duration' seconds as set by the
+        capture profile and return the recording in memory: mono WAV bytes,
+        or the robot's Ogg file for "-ogg" profiles (None on failure).
+        """
+        try:
+            measuring = self.capture.measuring
+            fmt = self.capture.record_format()
+            data = self._record(duration, fmt, self.capture.channel_mask())
+            if fmt != "wav":
+                return data
+
+            # 3) Convert to single-channel (vectorized, in memory)
+            with turn_trace.span("mix_mono"):
+                if measuring:
+                    return self._pick_channel(data)
+                return mix_wav_bytes_to_mono(data)
 
         except Exception as e:
             print("[record_audio] error:", e)
+            return None
+
+    def _pick_channel(self, wav_data):
+        """
+        Let a measuring "best" profile compare the speech level of the four
+        channels of 'wav_data', and return its current channel as mono WAV.
+        """
+        samples, rate, n_channels = read_wav_samples(io.BytesIO(wav_data))
+        self.capture.choose(channel_speech_db(samples, n_channels, rate))
+        return pcm_to_wav_bytes(samples[MIC_CHANNELS.index(self.capture.channel)::n_channels], rate)
+
+    def calibrate_capture(self, duration):
+        """
+        Record 'duration' seconds of the quiet room from all four mics, give
+        the capture profile their noise floors, and return (mono samples,
+        rate) of what the profile records, for VAD calibration.
+        """
+        samples, rate, n_channels = read_wav_samples(io.BytesIO(self._record(duration, "wav", [1, 1, 1, 1])))
+        self.capture.set_noise(channel_levels_db(samples, n_channels))
+        if self.capture.channel is None:
+            return mix_to_mono(samples, n_channels), rate
+        return samples[MIC_CHANNELS.index(self.capture.channel)::n_channels], rate
+
+# -------------------------------------------------------------------------------
+# Streaming capture: ALAudioDevice -> ring buffer -> endpointed utterances
+# -------------------------------------------------------------------------------
+class StreamingCapture(ALModule):
+    """
+    Receives microphone buffers from ALAudioDevice (processRemote) into a
+    bounded ring buffer and cuts them into utterances: an utterance starts
+    at the first voiced chunk and ends after 'trailing_silence' seconds
+    without voice or at 'max_seconds'. The audio never touches the robot's
+    disk and nothing is pulled over SFTP.
+    """
+
+    def __init__(self, name, pip, pport, sample_rate=16000, buffer_seconds=30):
+        ALModule.__init__(self, name)
+        self.module_name = name
+        self.sample_rate = sample_rate
+        self.audio_device = ALProxy("ALAudioDevice", pip, pport)
+
+        # ALAudioDevice delivers ~170 ms buffers; keep 'buffer_seconds' of them
+        self._chunks = collections.deque(maxlen=int(buffer_seconds / 0.17) + 1)
+        self._cond = threading.Condition()
+        self._subscribed = False
+
+    def start(self):
+        # 16 kHz is only delivered as one channel; take the front microphone
+        self.audio_device.setClientPreferences(self.module_name, self.sample_rate, 3, 0)
+        self.audio_device.subscribe(self.module_name)
+        self._subscribed = True
+        print("[StreamingCapture] Subscribed to ALAudioDevice.")
+
+    def stop(self):
+        if self._subscribed:
+            try:
+                self.audio_device.unsubscribe(self.module_name)
+            except Exception as e:
+                print("[StreamingCapture] unsubscribe error:", e)
+            self._subscribed = False
+
+    def processRemote(self, nbOfChannels, nbOfSamplesByChannel, timeStamp, inputBuffer):
+        """
+        Called by ALAudioDevice for every microphone buffer.
+        """
+        mono = mix_to_mono(inputBuffer, nbOfChannels)
+        with self._cond:
+            self._chunks.append(mono)
+            self._cond.notify()
+
+    def clear(self):
+        """
+        Drop buffered audio (e.g. the robot's own voice while it was speaking).
+        """
+        with self._cond:
+            self._chunks.clear()
+
+    def _next_chunk(self, timeout):
+        with self._cond:
+            if not self._chunks:
+                self._cond.wait(timeout)
+            if not self._chunks:
+                return None
+            return self._chunks.popleft()
+
+    def read_seconds(self, seconds):
+        """
+        Collect 'seconds' of raw audio (used for VAD calibration).
+        """
+        self.clear()
+        collected = []
+        n_samples = 0
+        deadline = time.time() + seconds + 1.0
+        while n_samples < seconds * self.sample_rate and time.time() < deadline:
+            chunk = self._next_chunk(0.5)
+            if chunk is not None:
+                collected.append(chunk)
+                n_samples += len(chunk)
+        return np.concatenate(collected) if collected else np.zeros(0, dtype=np.int16)
+
+    def iter_utterance(self, vad, start_timeout=3.0, trailing_silence=0.8,
+                       max_seconds=12.0, pre_roll=0.3):
+        """
+        Wait up to 'start_timeout' seconds for speech, then yield int16 mono
+        chunks live (starting with the 'pre_roll' seconds before) once the
+        VAD has heard 'min_speech_ms' of voice within them, until
+        'trailing_silence' seconds of silence or 'max_seconds'. Yields
+        nothing if nobody spoke.
+        """
+        self.clear()
+        pre_roll_chunks = collections.deque()
+        pre_roll_samples = 0
+        started = False
+        utterance_samples = 0
+        silence = 0.0
+        wait_start = time.time()
+
+        while True:
+            chunk = self._next_chunk(0.5)
+            if chunk is None:
+                if not started and time.time() - wait_start >= start_timeout:
+                    return
+                continue
+
+            chunk_seconds = len(chunk) / float(self.sample_rate)
+            voiced_ms, levels = vad.speech_ms(chunk, self.sample_rate)
+            voiced = voiced_ms >= min(vad.min_speech_ms, chunk_seconds * 500)
+
+            if not started:
+                # Start only once the pre-roll and this chunk hold
+                # 'min_speech_ms' of voice together: a click or a door slam
+                # alone does not open an upload
+                if voiced_ms + sum(v for _, v in pre_roll_chunks) >= vad.min_speech_ms:
+                    started = True
+                    utterance_samples = pre_roll_samples
+                    for pre, _ in pre_roll_chunks:
+                        yield pre
+                else:
+                    if not voiced:
+                        vad.adapt(levels)
+                    pre_roll_chunks.append((chunk, voiced_ms))
+                    pre_roll_samples += len(chunk)
+                    while pre_roll_samples - len(pre_roll_chunks[0][0]) >= pre_roll * self.sample_rate:
+                        pre_roll_samples -= len(pre_roll_chunks.popleft()[0])
+                    if time.time() - wait_start >= start_timeout:
+                        return
+                    continue
+
+            yield chunk
+            utterance_samples += len(chunk)
+            silence = 0.0 if voiced else silence + chunk_seconds
+
+            if silence >= trailing_silence or utterance_samples >= max_seconds * self.sample_rate:
+                return
+
+
+class LiveUpload(object):
+    """
+    Request body that streams PCM chunks to the server while they are still
+    being captured (sent with chunked transfer encoding). 'finished' is set
+    once the last chunk has gone out. With 'archive_name', the sent audio is
+    also kept and handed to archive_audio() at the end.
+    """
+
+    content_type = "audio/l16; rate=16000"
+    sample_rate = 16000
+
+    def __init__(self, chunks, archive_name=None):
+        self.chunks = chunks
+        self.archive_name = archive_name
+        self.finished = threading.Event()
+        self.finished_at = None
+
+    def __iter__(self):
+        start_t = time.time()
+        keep = self.archive_name or turn_trace.archive is not None
+        sent = []
+        try:
+            for chunk in self.chunks:
+                if keep:
+                    sent.append(chunk)
+                yield chunk.tobytes()
+        finally:
+            self.finished_at = time.time()
+            self.finished.set()
+            turn_trace.record("upload", start_t)
+            if sent:
+                wav_data = pcm_to_wav_bytes(np.concatenate(sent), self.sample_rate)
+                archive_audio(self.archive_name, wav_data)
+                turn_trace.attach("capture", wav_data)
 
 # ------------------------------------------------------------------------------
 # Behavior management
 # ------------------------------------------------------------------------------
+class BehaviorIndex(object):
+    """
+    Local view of the robot's behaviors, loaded once at startup so that
+    launching or stopping a gesture needs no isBehaviorInstalled /
+    isBehaviorRunning round trips.
+
+    Durations are measured by GestureScheduler whenever a gesture runs to
+    completion and persisted to 'durations_path', so later runs start with
+    the real lengths. A behavior we launched counts as running until its
+    known duration has elapsed or we stop it.
+    """
+
+    def __init__(self, durations_path, default_duration=8.0):
+        self.durations_path = durations_path
+        self.default_duration = default_duration
+        self.installed = None  # None until load() -> trust the caller
+        self.durations = {}
+        self._running = {}     # name -> expected end time
+        self._lock = threading.Lock()
+
+    def load(self, manager):
+        start_t = time.time()
+        try:
+            self.installed = set(manager.getInstalledBehaviors())
+        except Exception as e:
+            print("[BehaviorIndex] Could not list behaviors:", e)
+        if os.path.exists(self.durations_path):
+            try:
+                with open(self.durations_path, "r") as f:
+                    self.durations = json.load(f)
+            except Exception as e:
+                print("[BehaviorIndex] Could not read durations:", e)
+        print("[BehaviorIndex] {} behaviors indexed in {:.2f}s".format(
+            len(self.installed or ()), time.time() - start_t))
+
+    def is_installed(self, name):
+        return self.installed is None or name in self.installed
+
+    def duration(self, name):
+        return self.durations.get(name, self.default_duration)
+
+    def record_duration(self, name, seconds):
+        with self._lock:
+            previous = self.durations.get(name)
+            self.durations[name] = seconds if previous is None else 0.7 * previous + 0.3 * seconds
+            try:
+                with open(self.durations_path, "w") as f:
+                    json.dump(self.durations, f)
+            except Exception as e:
+                print("[BehaviorIndex] Could not write durations:", e)
+
+    def is_running(self, name):
+        with self._lock:
+            return self._running.get(name, 0) > time.time()
+
+    def was_launched(self, name):
+        """
+        True from mark_running() until mark_stopped(), even when the
+        behavior outlasts its duration estimate.
+        """
+        with self._lock:
+            return name in self._running
+
+    def mark_running(self, name):
+        with self._lock:
+            self._running[name] = time.time() + self.duration(name)
+
+    def mark_stopped(self, name):
+        with self._lock:
+            self._running.pop(name, None)
+
+
+# Filled in by main() once the robot is reachable
+behavior_index = BehaviorIndex(os.path.join(LOCAL_TEMP_DIR, "behavior_durations.json"))
+
+
 def launchAndStopBehavior(managerProxy, behaviorName):
-    if managerProxy.isBehaviorInstalled(behaviorName):
-        if not managerProxy.isBehaviorRunning(behaviorName):
+    if behavior_index.is_installed(behaviorName):
+        if not behavior_index.is_running(behaviorName):
             managerProxy.post.runBehavior(behaviorName)
+            behavior_index.mark_running(behaviorName)
         else:
             print("Behavior is already running.")
     else:
@@ -325,11 +1587,264 @@ def launchAndStopBehavior(managerProxy, behaviorName):
         return
 
 def stopBehavior(managerProxy, behaviorName):
-    if managerProxy.isBehaviorRunning(behaviorName):
-        managerProxy.stopBehavior(behaviorName)
+    # A behavior may run past its estimated duration: stop whatever we
+    # launched and have not stopped yet
+    if behavior_index.was_launched(behaviorName):
+        try:
+            managerProxy.stopBehavior(behaviorName)
+        except Exception as e:
+            print("[stopBehavior] error:", e)
+        behavior_index.mark_stopped(behaviorName)
     else:
         print("Behavior is already stopped.")
 
+
+class GestureScheduler(object):
+    """
+    Background thread that keeps random speaking gestures going while the
+    robot talks. Playback calls start_speaking() / stop_speaking(); the
+    gesture calls happen on this thread and never delay a turn.
+    """
+
+    def __init__(self, manager, index, gestures, poll_ms=200):
+        self.manager = manager
+        self.index = index
+        self.gestures = [g for g in gestures if index.is_installed(g)]
+        self.poll_ms = poll_ms
+        self._speaking = threading.Event()
+        self._stopped = False
+        self._speech_end = None
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def start_speaking(self, expected_duration=None):
+        """
+        Speech started; 'expected_duration' (seconds) lets the scheduler
+        prefer gestures that can finish before the speech ends.
+        """
+        self._speech_end = time.time() + expected_duration if expected_duration else None
+        self._speaking.set()
+
+    def extend_speaking(self, extra_duration):
+        if self._speech_end is not None:
+            self._speech_end = max(self._speech_end, time.time()) + extra_duration
+
+    def stop_speaking(self):
+        self._speaking.clear()
+
+    def shutdown(self):
+        self._stopped = True
+        self._speaking.set()
+        self._thread.join()
+
+    def _run(self):
+        last = None
+        while not self._stopped:
+            self._speaking.wait()
+            if self._stopped or not self.gestures:
+                return
+            candidates = [g for g in self.gestures if g != last] or self.gestures
+            if self._speech_end is not None:
+                # Prefer gestures that fit in the speech left; any other one
+                # is stopped by _play() when the speech ends
+                remaining = self._speech_end - time.time()
+                candidates = [g for g in candidates if self.index.duration(g) <= remaining] or candidates
+            gesture = random.choice(candidates)
+            last = gesture
+            self._play(gesture)
+
+    def _play(self, gesture):
+        try:
+            start_t = time.time()
+            task_id = self.manager.post.runBehavior(gesture)
+            self.index.mark_running(gesture)
+            print("[Speaking] Launching gesture: {}".format(gesture))
+            while not self.manager.wait(task_id, self.poll_ms):
+                if not self._speaking.is_set() or self._stopped:
+                    self.manager.stopBehavior(gesture)
+                    self.index.mark_stopped(gesture)
+                    turn_trace.record("gesture", start_t)
+                    print("[Speaking] Stopped gesture: {}".format(gesture))
+                    return
+            self.index.mark_stopped(gesture)
+            self.index.record_duration(gesture, time.time() - start_t)
+            turn_trace.record("gesture", start_t)
+        except Exception as e:
+            print("[Speaking] Error managing gestures: {}".format(e))
+            time.sleep(self.poll_ms / 1000.0)
+
+def listen_user_messages(audio, current_instruction=""):
+    """
+    Blocking /listenUser turn, presented as the same messages
+    stream_listen_user() yields (one segment holding the whole reply).
+    """
+    r, net_delay = post_audio_for_stt(audio, current_instruction=current_instruction)
+    if r is None:
+        print("[main] STT request failed. Skipping.")
+        return
+    recognized_text, chat_response, wav_data = parse_listen_response(r)
+    yield {"recognized_text": recognized_text}
+    if wav_data:
+        yield {"index": 0, "text": chat_response, "wav_data": wav_data}
+    yield {"done": True, "chatgpt_response": chat_response}
+
+
+def fetch_async(produce):
+    """
+    Run 'produce()' (a message generator, i.e. the HTTP request) on a worker
+    thread and return a queue receiving its messages, then None at the end.
+    """
+    messages = Queue.Queue()
+
+    def worker():
+        try:
+            for msg in produce():
+                messages.put(msg)
+        except Exception as e:
+            print("[fetch_async] error:", e)
+        finally:
+            messages.put(None)
+
+    t = threading.Thread(target=worker)
+    t.daemon = True
+    t.start()
+    return messages
+
+
+THINKING_BEHAVIORS = [
+    "animations/Stand/Waiting/ScratchHead_1",
+    "animations/Stand/Gestures/Thinking_5",
+    "animations/Stand/Gestures/Thinking_6"
+]
+
+
+class LatencyFiller(object):
+    """
+    Pre-loaded filler phrase + thinking gesture, started while a request is
+    still in flight and finished cleanly once the answer is ready.
+    """
+
+    def __init__(self, scripted, behavior_manager, finish_timeout=2.0):
+        self.scripted = scripted
+        self.behavior_manager = behavior_manager
+        self.finish_timeout = finish_timeout
+        self._task_id = None
+        self._behavior = None
+
+    def start(self):
+        self._behavior = random.choice(THINKING_BEHAVIORS)
+        try:
+            self.behavior_manager.post.runBehavior(self._behavior)
+            print("[Filler] Running behavior: {}".format(self._behavior))
+        except Exception as e:
+            print("[Filler] Error running behavior: {}".format(e))
+        self._task_id = self.scripted.play_async(random.choice(FILLER_PHRASES))
+
+    def finish(self):
+        """
+        Let the (short) filler phrase end, cutting it after 'finish_timeout',
+        and stop the thinking gesture.
+        """
+        if self._task_id is not None:
+            try:
+                audio_player = self.scripted.audio_player
+                if not audio_player.wait(self._task_id, int(self.finish_timeout * 1000)):
+                    audio_player.stop(self._task_id)
+            except Exception as e:
+                print("[Filler] Error finishing filler: {}".format(e))
+            self._task_id = None
+        if self._behavior is not None:
+            try:
+                self.behavior_manager.stopBehavior(self._behavior)
+                print("[Filler] Stopped behavior: {}".format(self._behavior))
+            except Exception as e:
+                print("[Filler] Error stopping behavior: {}".format(e))
+            self._behavior = None
+
+
+def with_latency_filler(messages, filler, threshold, upload=None):
+    """
+    Yield messages from the 'messages' queue. If no reply audio has arrived
+    'threshold' seconds after the request went out (after a LiveUpload has
+    finished sending, when there is one), start the filler; it is finished
+    before the first reply segment is handed on.
+    """
+    # End of the user's speech: first_reply / first_audio are traced from here
+    speech_end = None if upload is not None else turn_trace.mark("speech_end")
+    deadline = None if upload is not None else speech_end + threshold
+    filler_running = False
+    got_audio = False
+    try:
+        while True:
+            if deadline is None:
+                # The user is still talking into a live upload
+                if upload.finished.is_set():
+                    speech_end = turn_trace.mark("speech_end", upload.finished_at)
+                    deadline = speech_end + threshold
+                try:
+                    msg = messages.get(timeout=0.1)
+                except Queue.Empty:
+                    continue
+            elif got_audio or filler_running:
+                msg = messages.get()
+            else:
+                try:
+                    msg = messages.get(timeout=max(0.0, deadline - time.time()))
+                except Queue.Empty:
+                    filler.start()
+                    filler_running = True
+                    filler_start = time.time()
+                    continue
+            if msg is None:
+                return
+            if "wav_data" in msg and not got_audio:
+                got_audio = True
+                turn_trace.record("first_reply", speech_end)
+                if filler_running:
+                    filler.finish()
+                    filler_running = False
+                    turn_trace.record("filler", filler_start)
+            yield msg
+    finally:
+        if filler_running:
+            filler.finish()
+            turn_trace.record("filler", filler_start)
+
+
+def play_reply(messages, idx, bridge, gestures):
+    """
+    Play one reply: every segment is uploaded as soon as it arrives and
+    queued for playback; the gesture scheduler moves the robot while it talks.
+    Returns True if the server recognized something or replied.
+    """
+    player = SegmentPlayer(bridge.audio_player, gestures)
+    sentences = []
+    heard = False
+    try:
+        for msg in messages:
+            if "recognized_text" in msg:
+                print("[main] User said: {}".format(msg["recognized_text"].encode('utf-8')))
+                turn_trace.note(transcript=msg["recognized_text"])
+                heard = heard or bool(msg["recognized_text"])
+            elif "done" in msg:
+                turn_trace.note(reply=msg.get("chatgpt_response", ""), sentences=sentences)
+                heard = heard or bool(msg.get("chatgpt_response"))
+            elif "wav_data" in msg:
+                segment_name = "response_{}_{}.wav".format(idx, msg["index"])
+                duration = get_wav_duration(msg["wav_data"])
+                print("[main] Segment {} duration: {:.2f} seconds".format(msg["index"], duration))
+                remote_path = os.path.join(PEPPER_TEMP_DIR, segment_name)
+                bridge.sftp_pool.putfo(msg["wav_data"], remote_path)
+                player.enqueue(remote_path, duration)
+                archive_audio("{}_{}".format(turn_trace.turn_id, segment_name), msg["wav_data"])
+                turn_trace.attach("reply_{}".format(len(sentences)), msg["wav_data"])
+                sentences.append(msg.get("text", ""))
+                heard = True
+    finally:
+        player.finish()
+    return heard
+
 def start_face_tracking(tracker, face_detection):
     try:
         face_detection.subscribe("FaceTracking")
@@ -343,17 +1858,49 @@ def start_face_tracking(tracker, face_detection):
 
 
 def main():
+    global KEEP_AUDIO
     parser = OptionParser()
     parser.add_option("--pip", dest="pip", default=ROBOT_IP)
     parser.add_option("--pport", dest="pport", type="int", default=ROBOT_PORT)
+    parser.add_option("--capture", dest="capture", choices=["stream", "file"], default=CAPTURE_MODE)
+    parser.add_option("--capture-profile", dest="capture_profile", choices=CaptureProfile.NAMES,
+                      default=CAPTURE_PROFILE, help="microphones and format of the capture (see CaptureProfile)")
+    parser.add_option("--no-stream", dest="stream_replies", action="store_false", default=STREAM_REPLIES)
+    parser.add_option("--filler-delay", dest="filler_delay", type="float", default=FILLER_DELAY)
+    parser.add_option("--keep-audio", dest="keep_audio", action="store_true", default=KEEP_AUDIO,
+                      help="also write captures and replies to LOCAL_TEMP_DIR")
+    parser.add_option("--archive", dest="archive", default=None,
+                      help="append every turn (audio, texts, trace) to this session archive directory")
     (opts, args_) = parser.parse_args()
+    KEEP_AUDIO = opts.keep_audio
+    if opts.archive:
+        turn_trace.archive = SessionArchive(opts.archive)
+    mark_startup("imported")
 
     if not os.path.exists(LOCAL_TEMP_DIR):
         os.makedirs(LOCAL_TEMP_DIR)
 
+    # The server may still be warming up its backend clients: poll /ready
+    # while the robot side starts up
+    server_ready = threading.Thread(target=wait_for_server_ready)
+    server_ready.daemon = True
+    server_ready.start()
+
     myBroker = ALBroker("myBroker", "0.0.0.0", 0, opts.pip, opts.pport)
+    global managerProxy
+    managerProxy = ALProxy("ALBehaviorManager", opts.pip, opts.pport)
     global bridge
-    bridge = PepperBridge("PepperBridge", opts.pip, opts.pport)
+    bridge = PepperBridge("PepperBridge", opts.pip, opts.pport, CaptureProfile(opts.capture_profile))
+    mark_startup("robot_connected")
+
+    global PepperCapture
+    PepperCapture = None
+    if opts.capture == "stream":
+        PepperCapture = StreamingCapture("PepperCapture", opts.pip, opts.pport)
+        PepperCapture.start()
+        if opts.capture_profile != CAPTURE_PROFILE:
+            print("[main] Streaming capture sends the front mic as raw PCM; "
+                  "--capture-profile only applies to --capture file.")
 
     # Create proxies
     tracker = ALProxy("ALTracker", opts.pip, opts.pport)
@@ -362,161 +1909,175 @@ def main():
     posture_proxy = ALProxy("ALRobotPosture", opts.pip, opts.pport)
     idle = ALProxy("ALAutonomousLife", opts.pip, opts.pport)
 
+    mark_startup("proxies")
+
+    # New conversation on the server (one session per robot/participant)
+    server_ready.join()
+    mark_startup("server_ready")
+    start_scenario_session()
+
+    # Warm-up: synthesize, upload and load every scripted line once
+    scripted = ScriptedAudio(bridge.audio_player, bridge.sftp_pool,
+                             os.path.join(LOCAL_TEMP_DIR, PRELOAD_MANIFEST), server_tts_voice)
+    scripted.preload(scripted_lines(OBJECTS))
+    mark_startup("preloaded")
+    filler = LatencyFiller(scripted, managerProxy)
+
+    # Index installed behaviors and their durations once; gestures then run
+    # on a background thread alongside speech
+    behavior_index.load(managerProxy)
+    gestures = GestureScheduler(managerProxy, behavior_index, SPEAKING_GESTURES)
+
+    # Calibrate the VAD noise floor on the quiet room before the robot talks
+    vad = EnergyVAD()
+    try:
+        if PepperCapture is not None:
+            samples, rate = PepperCapture.read_seconds(VAD_CALIBRATION_SECONDS), PepperCapture.sample_rate
+        else:
+            samples, rate = bridge.calibrate_capture(VAD_CALIBRATION_SECONDS)
+        print("[VAD] Noise floor: {:.1f} dBFS".format(vad.calibrate(samples, rate)))
+    except Exception as e:
+        print("[VAD] Calibration failed, using defaults:", e)
+    vad_dropped = 0
+    mark_startup("vad_calibrated")
+
     print("[main] Starting scenario...")
 
     # Start face tracking
     idle.setState("solitary")
     start_face_tracking(tracker, face_detection)
     
+    mark_startup("greeting")
+    print("[startup] " + json.dumps(startup_timings))
+
     # Example usage
-    start_text = u"Merhaba!"
-    local_start_wav = os.path.join(LOCAL_TEMP_DIR, "start_{}.wav")
-    ok = download_tts_to_file(start_text, local_start_wav)
-    if ok:
-        scp_and_play(local_start_wav, "start_{}.wav", bridge.audio_player)
+    scripted.play(GREETING_TEXT)
 
     launchAndStopBehavior(managerProxy, "animations/Stand/BodyTalk/Speaking/BodyTalk_4")
 
-    start_text = u"Benim adım Deniz. Bugün yaratıcı fikirler üretmeye çalışacağız. Hazır mısın?"
-    local_start_wav = os.path.join(LOCAL_TEMP_DIR, "start_{}.wav")
-    ok = download_tts_to_file(start_text, local_start_wav)
-    if ok:
-        scp_and_play(local_start_wav, "start_{}.wav", bridge.audio_player)
+    scripted.play(INTRODUCTION_TEXT)
     stopBehavior(managerProxy, "animations/Stand/BodyTalk/Speaking/BodyTalk_4")
 
     time.sleep(2)
     launchAndStopBehavior(managerProxy, "animations/Stand/Gestures/Yes_1")
 
-    start_text = u"Süper! O zaman başlayalım!"
-    local_start_wav = os.path.join(LOCAL_TEMP_DIR, "start_{}.wav")
-    ok = download_tts_to_file(start_text, local_start_wav)
-    if ok:
-        scp_and_play(local_start_wav, "start_{}.wav", bridge.audio_player)
+    scripted.play(LETS_START_TEXT)
     stopBehavior(managerProxy, "animations/Stand/Gestures/Yes_1")
 
     # Example 2-object scenario
-    objects = [u"kalem", u"plastik şişe"]
-    for idx, obj_name in enumerate(objects):
+    for idx, obj_name in enumerate(OBJECTS):
         print(u"\n--- Starting object #{}: {} ---".format(idx + 1, obj_name))
 
         launchAndStopBehavior(managerProxy, "animations/Stand/BodyTalk/Listening/Listening_2")
-        current_instruction = u"Şimdi {} nesnesi. 3 dakikan var. Ne yapabiliriz?".format(obj_name)
-        local_intro_wav = os.path.join(LOCAL_TEMP_DIR, "intro_{}.wav".format(idx))
-        ok = download_tts_to_file(current_instruction, local_intro_wav)
-        if ok:
-            scp_and_play(local_intro_wav, "intro_{}.wav".format(idx), bridge.audio_player)
+        current_instruction = INSTRUCTION_TEMPLATE.format(obj_name)
+        scripted.play(current_instruction)
         stopBehavior(managerProxy, "animations/Stand/BodyTalk/Listening/Listening_2")
         start_time = time.time()
-        last_speech_time = time.time()
+        # Seconds of consecutive turns without recognized speech
+        silent_seconds = 0.0
 
         while True:
             elapsed = time.time() - start_time
-            if elapsed >= 180.0:  # 3 minutes
+            if elapsed >= OBJECT_SECONDS:
                 # Politely interrupt
                 launchAndStopBehavior(managerProxy, "animations/Stand/Gestures/Enthusiastic_2" )
-                end_text = u"Zaman doldu. {} için yeterince fikir ürettik!".format(obj_name)
-                local_end_wav = os.path.join(LOCAL_TEMP_DIR, "end_{}.wav".format(idx))
-                if download_tts_to_file(end_text, local_end_wav):
-                    scp_and_play(local_end_wav, "end_{}.wav".format(idx), bridge.audio_player)
+                scripted.play(TIME_UP_TEMPLATE.format(obj_name))
                 stopBehavior(managerProxy, "animations/Stand/Gestures/Enthusiastic_2")
                 break
 
             # --- The only line changed:  pick random idle messages ---
-            if (time.time() - last_speech_time) >= 15.0:
+            if silent_seconds >= IDLE_TIMEOUT:
                 # Randomly pick from the 3 idle messages
                 idle_text = random.choice(IDLE_MESSAGES)
-                local_idle_wav = os.path.join(LOCAL_TEMP_DIR, "idle_{}.wav".format(idx))
-                if download_tts_to_file(idle_text, local_idle_wav):
-                    scp_and_play(local_idle_wav, "idle_{}.wav".format(idx), bridge.audio_player)
+                if scripted.play(idle_text):
                     print("[Idle] Played idle message: '%s'" % idle_text)
-                    last_speech_time = time.time()
+                    silent_seconds = 0.0
                 else:
                     print("[Idle] Failed to generate or play idle audio.")
 
-            # Record short audio (3s), then sum to mono
-            local_record_file = os.path.join(LOCAL_TEMP_DIR, "user_{}.wav".format(idx))
-            bridge.record_audio(local_record_file, duration=3)
-
-            # Send to STT
-            response_tuple = post_audio_for_stt(local_record_file, current_instruction=current_instruction)
-            if response_tuple is None:
-                print("[main] No response from STT server. Skipping iteration.")
-                continue
-
-            r, net_delay = response_tuple
-            if r is None:
-                print("[main] STT request failed. Skipping.")
-                continue
-
-            # If STT/LLM/TTS took >3s, insert a filler phrase & gesture
-            if net_delay > 5.0:
-                behaviors = [
-                    "animations/Stand/Waiting/ScratchHead_1",
-                    "animations/Stand/Gestures/Thinking_5",
-                    "animations/Stand/Gestures/Thinking_6"
-                ]
-                selected_behavior = random.choice(behaviors)
-                try:
-                    managerProxy.runBehavior(selected_behavior)
-                    print("[Filler] Running behavior: {}".format(selected_behavior))
-                except Exception as e:
-                    print("[Filler] Error running behavior: {}".format(e))
-
-                filler_idx = int((time.time() * 1000)) % len(FILLER_PHRASES)
-                filler_text = FILLER_PHRASES[filler_idx]
-                local_filler_wav = os.path.join(LOCAL_TEMP_DIR, "filler_{}.wav".format(idx))
-                if download_tts_to_file(filler_text, local_filler_wav):
-                    scp_and_play(local_filler_wav, "filler_{}.wav".format(idx), bridge.audio_player)
-
+            # One trace line per turn; the same id goes to the server in X-Turn-Id
+            turn_trace.begin(object=obj_name, capture=opts.capture, stream=opts.stream_replies)
+            turn_trace.note(session_id=scenario_session_id, instruction=current_instruction,
+                            endpoint="/listenUserStream" if opts.stream_replies else "/listenUser")
+            opened_connections = http_client.opened_connections()
+            turn_start = time.time()
+            upload = None
+            if PepperCapture is not None:
+                # Streaming capture: the utterance is uploaded chunk by chunk
+                # while the user is still talking, and recognized as it arrives
+                wait_start = time.time()
+                chunks = PepperCapture.iter_utterance(
+                    vad, start_timeout=RECORD_SECONDS,
+                    trailing_silence=TRAILING_SILENCE_SECONDS,
+                    max_seconds=MAX_UTTERANCE_SECONDS
+                )
+                first_chunk = next(chunks, None)
+                if first_chunk is None:
+                    vad_dropped += 1
+                    silent_seconds += time.time() - wait_start
+                    turn_trace.discard()
+                    continue
+                audio = upload = LiveUpload(itertools.chain([first_chunk], chunks),
+                                            "{}_user.wav".format(turn_trace.turn_id) if KEEP_AUDIO else None)
+                turn_trace.note(upload="raw", content_type="audio/wav")
+            else:
+                # Record short audio (3s): mono WAV, or Ogg with "-ogg" profiles
+                capture_data = bridge.record_audio(duration=RECORD_SECONDS)
+                if capture_data is None:
+                    silent_seconds += RECORD_SECONDS
+                    turn_trace.discard()
+                    continue
+                # WAV while a "best" profile is still comparing its mics
+                capture_fmt = audio_format(capture_data) or "wav"
+                archive_audio("{}_user.{}".format(turn_trace.turn_id, capture_fmt), capture_data)
+                turn_trace.attach("capture", capture_data)
+                turn_trace.note(upload="multipart", filename="capture." + capture_fmt,
+                                content_type="audio/" + capture_fmt)
+                audio = io.BytesIO(capture_data)
+
+                # Drop silent captures locally instead of paying STT for them
+                # (Ogg needs soundfile to decode; without it the server decides)
                 try:
-                    managerProxy.stopBehavior(selected_behavior)
-                    print("[Filler] Stopped behavior: {}".format(selected_behavior))
+                    decoded = read_audio_samples(capture_data)
+                    has_speech = decoded is None or vad.is_speech(decoded[0], decoded[1])
                 except Exception as e:
-                    print("[Filler] Error stopping behavior: {}".format(e))
-
-            # Check STT result
-            if r.status_code == 200:
-                js = r.json()
-                recognized_text = js.get("recognized_text", "")
-                chat_response = js.get("chatgpt_response", "")
-                wav_b64 = js.get("wav_base64", None)
-
-                if recognized_text.strip():
-                    last_speech_time = time.time()
-                    print("[main] User said: {}".format(recognized_text.encode('utf-8')))
-
-                # If server returns TTS audio
-                if wav_b64:
-                    wav_data = base64.b64decode(wav_b64)
-                    local_response_wav = os.path.join(LOCAL_TEMP_DIR, "response_{}.wav".format(idx))
-                    with open(local_response_wav, "wb") as f:
-                        f.write(wav_data)
-
-                    audio_duration = get_wav_duration(local_response_wav)
-                    print("[main] Audio duration: {:.2f} seconds".format(audio_duration))
-                    launch_random_gestures(managerProxy, SPEAKING_GESTURES, audio_duration)
-                    stopBehavior(managerProxy, "animations/Stand/BodyTalk/Speaking/BodyTalk_8")
-                    stopBehavior(managerProxy, "animations/Stand/BodyTalk/Speaking/BodyTalk_10")
-                    stopBehavior(managerProxy, "animations/Stand/BodyTalk/Speaking/BodyTalk_1")
-                    stopBehavior(managerProxy, "animations/Stand/BodyTalk/Speaking/BodyTalk_14")
-                    stopBehavior(managerProxy, "animations/Stand/BodyTalk/Speaking/BodyTalk_20")
-                    # Play the response
-                    scp_and_play(local_response_wav, "response_{}.wav".format(idx), bridge.audio_player)
-
-                    last_speech_time = time.time()
-                    
+                    print("[VAD] error:", e)
+                    has_speech = True
+                if not has_speech:
+                    vad_dropped += 1
+                    silent_seconds += RECORD_SECONDS
+                    turn_trace.discard()
+                    continue
+
+            # Fire the request on a worker thread; if the reply is late,
+            # a filler phrase and thinking gesture cover the wait
+            if opts.stream_replies:
+                messages = fetch_async(lambda: stream_listen_user(audio, current_instruction))
             else:
-                print("[main] /listenUser error code:", r.status_code, r.text)
-                continue
+                messages = fetch_async(lambda: listen_user_messages(audio, current_instruction))
+            # Only a transcript or a reply counts as the user talking: noise
+            # that passes the VAD but is not recognized stays idle time
+            if play_reply(with_latency_filler(messages, filler, opts.filler_delay, upload), idx, bridge, gestures):
+                silent_seconds = 0.0
+            else:
+                silent_seconds += time.time() - turn_start
+            # 0 when the turn's requests all went over kept-alive connections
+            turn_trace.count("http_new_connections", http_client.opened_connections() - opened_connections)
+            turn_trace.end()
 
     # End scenario
     wave_hand(posture_proxy, motion, hand="right", speed=2)
-    final_text = u"Teşekkür ederim! Görevi tamamladık. Çok yaratıcı fikirler bulduk!"
-    local_final = os.path.join(LOCAL_TEMP_DIR, "final.wav")
-    if download_tts_to_file(final_text, local_final):
-        scp_and_play(local_final, "final.wav", bridge.audio_player)
-
-    print("[main] Exiting scenario.")
+    scripted.play(FINAL_TEXT)
+
+    print("[main] Exiting scenario. VAD dropped {} silent captures.".format(vad_dropped))
+    scripted.unload()
+    gestures.shutdown()
+    if PepperCapture is not None:
+        PepperCapture.stop()
+    bridge.sftp_pool.close()
+    print("[main] HTTP: {requests} requests, {new_connections} new connections, {retries} retries".format(
+        **http_client.stats()))
+    http_client.close()
     myBroker.shutdown()
     sys.exit(0)
 
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+reply_cache.py
+
+Optional cross-session cache of ChatGPT replies for scenario_logic.py.
+
+Every participant does the same task with the same objects, and the first
+ideas are often nearly identical ("yazı yazmak", "su koymak"). Entries are
+keyed by the current object (its scenario instruction), the position of
+the turn in that object's dialogue and the normalized transcript; a lookup
+returns the most similar transcript of the same object and position if it
+is at least 'threshold' alike. Transcripts shorter than 'min_similar_words'
+words only match exactly: in short Turkish answers one suffix can flip the
+meaning ("su koymak" / "su koymamak") while the strings stay alike. For
+the same reason a similar transcript never matches when the two differ in
+their negation markers ("kullanabiliriz" / "kullanamayız"). Each entry keeps
+the synthesized audio of its reply (one or more sentence segments), so a
+hit skips both the LLM and TTS. Entries expire after 'ttl' seconds; least
+recently used entries are evicted beyond 'max_entries' / 'max_bytes'.
+"""
+
+import re
+import time
+import threading
+from collections import OrderedDict
+from difflib import SequenceMatcher
+
+
+# Turkish dotted/dotless I must be lowercased before str.lower()
+TURKISH_LOWER = str.maketrans({"I": "ı", "İ": "i"})
+# Diacritics folded away so "şişe" / "sise" (or STT spelling variants) match
+DIACRITIC_FOLD = str.maketrans("çğıöşüâîû", "cgiosuaiu")
+NON_WORD = re.compile(r"[^\w\s]+")
+SPACES = re.compile(r"\s+")
+# Negation markers of normalized text: the verb suffixes -ma/-me (before
+# a consonant or buffer y: koymamak, yapmadı, kullanamayız), -maz/-mez and
+# -mıyor/-miyor/-muyor, and the words "değil" / "yok"
+NEGATION = re.compile(r"m[ae](?=[bcdfghjklmnprstvyz])|m[iu]yor|\b(?:degil|yok)")
+
+
+def normalize_transcript(text):
+    """
+    Turkish-aware lowercase, diacritics folded, punctuation dropped,
+    whitespace collapsed.
+    """
+    text = text.translate(TURKISH_LOWER).lower().translate(DIACRITIC_FOLD)
+    text = NON_WORD.sub(" ", text)
+    return SPACES.sub(" ", text).strip()
+
+
+def negation_count(text):
+    """
+    Number of negation markers in a normalized transcript. Infinitive
+    -mak/-mek counts too, so only a difference between two transcripts
+    means anything.
+    """
+    return len(NEGATION.findall(text))
+
+
+class CachedReply:
+    """
+    One cached reply: its text and [(sentence, wav_bytes)] audio segments.
+    """
+
+    def __init__(self, reply, segments):
+        self.reply = reply
+        self.segments = list(segments)
+        self.size = sum(len(audio) for _, audio in self.segments)
+        self.created = time.time()
+
+
+class ReplyCache:
+    """
+    TTL + LRU map of (object, position, normalized transcript) -> CachedReply,
+    with similarity lookup inside one (object, position) bucket.
+
+    Only the first 'max_position' turns of each object are cached; later
+    replies depend too much on the conversation so far.
+    """
+
+    def __init__(self, threshold=0.85, ttl=7 * 24 * 3600.0, max_entries=512,
+                 max_bytes=128 * 1024 * 1024, max_position=2, min_similar_words=4):
+        self.threshold = threshold
+        self.min_similar_words = min_similar_words
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_position = max_position
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # (object, position, normalized) -> CachedReply
+        self._bytes = 0
+
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def cacheable(self, position):
+        return position < self.max_position
+
+    @staticmethod
+    def _object_key(obj):
+        return normalize_transcript(obj or "")
+
+    def _drop_locked(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def _expire_locked(self, now):
+        for key in [k for k, e in self._entries.items() if now - e.created >= self.ttl]:
+            self._drop_locked(key)
+
+    def _find_locked(self, key):
+        """
+        The exact key, or the most similar transcript of the same bucket
+        (only for transcripts of at least 'min_similar_words' words, and
+        with as many negation markers).
+        """
+        if key in self._entries:
+            return key, False
+        obj, position, text = key
+        if len(text.split()) < self.min_similar_words:
+            return None, False
+        negations = negation_count(text)
+        matcher = SequenceMatcher(None, "", text)
+        best_key, best_ratio = None, self.threshold
+        for candidate in self._entries:
+            if candidate[0] != obj or candidate[1] != position:
+                continue
+            if negation_count(candidate[2]) != negations:
+                continue
+            matcher.set_seq1(candidate[2])
+            if matcher.real_quick_ratio() < best_ratio or matcher.quick_ratio() < best_ratio:
+                continue
+            ratio = matcher.ratio()
+            if ratio >= best_ratio:
+                best_key, best_ratio = candidate, ratio
+        return best_key, True
+
+    def get(self, obj, position, transcript):
+        """
+        Return the CachedReply for this turn, or None.
+        """
+        text = normalize_transcript(transcript)
+        if not text or not self.cacheable(position):
+            return None
+        with self._lock:
+            self._expire_locked(time.time())
+            key, similar = self._find_locked((self._object_key(obj), position, text))
+            if key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if similar:
+                self.similar_hits += 1
+            return self._entries[key]
+
+    def put(self, obj, position, transcript, reply, segments):
+        """
+        Cache 'reply' and its [(sentence, wav_bytes)] segments for this turn.
+        """
+        text = normalize_transcript(transcript)
+        if not text or not reply or not segments or not self.cacheable(position):
+            return
+        key = (self._object_key(obj), position, text)
+        entry = CachedReply(reply, segments)
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop_locked(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop_locked(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+resilience.py
+
+Deadlines, hedged requests and circuit breaking for the STT / LLM / TTS
+backend calls of scenario_logic.py.
+
+ResilientBackend.call(fn, ...) runs one backend call on a worker pool and
+ - gives up after 'deadline' seconds,
+ - sends one duplicate (hedge) request if the first has not answered within
+   the backend's recent p95 latency; whichever answers first wins,
+ - fails fast while the backend's CircuitBreaker is open (after repeated
+   failures), so callers can switch to a canned or cached reply at once.
+Every outcome is counted in StageMetrics as backend_calls_total.
+"""
+
+import time
+import threading
+from collections import deque
+from concurrent.futures import wait, FIRST_COMPLETED
+
+
+class BackendUnavailable(Exception):
+    """
+    The call missed its deadline, failed, or was short-circuited.
+    """
+
+
+class CircuitBreaker:
+    """
+    closed -> (failure_threshold consecutive failures) -> open
+    open -> (reset_timeout seconds) -> half-open: one trial call
+    half-open -> closed on success, open again on failure
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=20.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.time() - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self.state = "closed"
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    print(f"[CircuitBreaker] Opened after {self._failures} failure(s).")
+                self.state = "open"
+                self._opened_at = time.time()
+
+
+class ResilientBackend:
+    """
+    Deadline + hedging + circuit breaker around one backend.
+
+    Parameters:
+        name (str): Label in metrics ("stt", "llm", "tts").
+        executor: Thread pool the calls (and hedges) run on.
+        metrics (StageMetrics): Receives backend_calls_total{backend, outcome}.
+        deadline (float): Seconds before the call is abandoned.
+        hedge (bool): Send a duplicate request when the first one is slow.
+        hedge_delay (float): Delay before hedging until enough latencies
+            have been observed to use their p95.
+    """
+
+    def __init__(self, name, executor, metrics, deadline, hedge=True, hedge_delay=2.0,
+                 min_hedge_delay=0.25, breaker=None, window=200, min_samples=20):
+        self.name = name
+        self.executor = executor
+        self.metrics = metrics
+        self.deadline = deadline
+        self.hedge = hedge
+        self.initial_hedge_delay = hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def count(self, outcome):
+        self.metrics.inc("backend_calls_total", backend=self.name, outcome=outcome)
+
+    def record_success(self, latency, outcome="ok"):
+        """
+        Report a successful call (also used for calls that cannot go
+        through call(), such as streaming recognition).
+        """
+        with self._lock:
+            self._latencies.append(latency)
+        self.breaker.record_success()
+        self.count(outcome)
+
+    def record_failure(self, outcome="error"):
+        self.breaker.record_failure()
+        self.count(outcome)
+
+    def hedge_delay(self):
+        """
+        p95 of recent successful calls, clamped to [min_hedge_delay, deadline / 2].
+        """
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                delay = self.initial_hedge_delay
+            else:
+                ordered = sorted(self._latencies)
+                delay = ordered[int(0.95 * (len(ordered) - 1))]
+        return min(max(delay, self.min_hedge_delay), self.deadline / 2.0)
+
+    def call(self, fn, *args, discard=None, **kwargs):
+        """
+        Return fn(*args, **kwargs) from the first attempt that succeeds.
+        'discard(result)' is applied to results that lose the race (e.g. to
+        close a stream). Raises BackendUnavailable on timeout, failure or an
+        open circuit.
+        """
+        if not self.breaker.allow():
+            self.count("short_circuit")
+            raise BackendUnavailable(f"{self.name}: circuit open")
+
+        start = time.time()
+        give_up_at = start + self.deadline
+        hedge_at = start + self.hedge_delay() if self.hedge else None
+        pending = [self.executor.submit(fn, *args, **kwargs)]
+        hedge_future = None
+        last_error = None
+
+        while pending:
+            now = time.time()
+            wake_at = give_up_at if hedge_at is None else min(give_up_at, hedge_at)
+            done, _ = wait(pending, timeout=max(0.0, wake_at - now), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                pending.remove(future)
+                if future.exception() is not None:
+                    last_error = future.exception()
+                    continue
+                self.record_success(time.time() - start, "hedge_won" if future is hedge_future else "ok")
+                self._discard_later(pending, discard)
+                return future.result()
+
+            now = time.time()
+            if now >= give_up_at:
+                break
+            if hedge_at is not None and (now >= hedge_at or not pending):
+                # Slow (or already failed) first attempt: race a duplicate
+                hedge_at = None
+                hedge_future = self.executor.submit(fn, *args, **kwargs)
+                pending.append(hedge_future)
+                self.count("hedged")
+
+        self._discard_later(pending, discard)
+        if pending or last_error is None:
+            self.record_failure("timeout")
+            raise BackendUnavailable(f"{self.name}: no answer within {self.deadline:.1f}s")
+        self.record_failure("error")
+        raise BackendUnavailable(f"{self.name}: {last_error}") from last_error
+
+    @staticmethod
+    def _discard_later(futures, discard):
+        if discard is None:
+            return
+
+        def on_done(future):
+            if future.exception() is None:
+                try:
+                    discard(future.result())
+                except Exception:
+                    pass
+
+        for future in futures:
+            future.add_done_callback(on_done)
@@ -6,25 +6,66 @@ scenario_logic.py
 Python 3 Flask server that:
  - /listenUser -> receives an audio file from Pepper for STT (Google Cloud),
    optionally calls ChatGPT for a "novel" response, then does TTS with Google
-   Cloud (Turkish) and returns WAV audio as base64 + recognized text.
+   Cloud (Turkish) and returns WAV audio as base64 + recognized text
+   (or, when the client asks for it, the raw WAV body with the texts in headers).
+   Uploads may be WAV, FLAC or Ogg/Opus.
+ - /listenUserStream -> same pipeline, but streams the reply sentence by sentence
+   (LLM tokens -> sentence TTS -> NDJSON audio segments) as chunked HTTP
  - /ttsBytes -> text-to-speech for any prompt or scenario lines, returns base64 WAV
- - /startScenario -> resets scenario state, if needed
+   (served from a memory + disk TTS cache when the same line was synthesized before)
+ - /ttsBatch -> many lines in one request (e.g. every scripted line of a session),
+   synthesized in parallel and streamed back as each one is ready
+ - /ttsCacheStats -> hit/miss counters of the TTS cache
+ - /metrics -> Prometheus text format: per-stage latency histograms and
+   p50/p95/p99 (stt, llm, tts, encode, ...), request and TTS cache counters.
+   Every request is tagged with the bridge's X-Turn-Id, and its stage spans
+   are logged as one "[turn] {...}" JSON line
+ - STT, LLM and TTS calls have deadlines, are hedged with a duplicate request
+   when slow, and fail fast behind a circuit breaker; the robot then says a
+   canned (pre-synthesized) line instead of going silent
+ - Starts the ChatGPT call speculatively on stable interim transcripts of
+   streamed uploads and keeps that reply when the final transcript matches
+ - Optionally (REPLY_CACHE=1) reuses an earlier participant's reply and its audio
+   when the same object gets a near-identical early answer, skipping LLM and TTS
+ - Optionally (SESSION_ARCHIVE_DIR) appends every turn to a session archive
+   (upload audio, transcripts, prompt, reply text and audio, stage spans)
+   that benchmark/replay.py can play back through these routes
+ - /startScenario -> starts a new conversation session and returns its id;
+   every robot sends that id in X-Session-Id, so one server can drive many
+   robots concurrently
+ - /ready -> readiness probe: the Google / OpenAI client libraries are only
+   imported when their clients are built, which happens in parallel on
+   background threads while the server already listens; /ready answers 200
+   (with per-backend warm state and start-up timings) once that is done
 
 Usage:
   python3 scenario_logic.py
 """
 
+import time
+# Start of the process, for the start-up timings on /ready
+PROCESS_START = time.time()
+
 import os
 import base64
 import uuid
 import json
-from pydantic import BaseModel
-import openai
-from openai import OpenAI
-import requests
-from flask import Flask, request, jsonify
-from google.cloud import texttospeech
-from google.cloud import speech
+import re
+import queue
+import threading
+import struct
+from urllib.parse import quote, unquote
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+from flask import Flask, Response, request, jsonify, g
+from startup import LazyClient, Startup
+from tts_cache import TTSCache, tts_cache_key
+from session_store import SessionStore
+from latency_metrics import StageMetrics, TurnSpans
+from resilience import ResilientBackend
+from reply_cache import ReplyCache
+from speculation import Speculation
+from session_archive import SessionArchive
+from audio_utils import compressed_to_wav, concat_wav_bytes, is_ogg_vorbis
 
 
 # ------------------------------------------------------------------------------
@@ -43,17 +84,125 @@ os.environ["GOOGLE_STT_CREDENTIALS"] = os.getenv(
 )
 
 app = Flask(__name__)
+startup = Startup(PROCESS_START)
+
+
+def new_tts_client():
+    from google.cloud import texttospeech
+    return texttospeech.TextToSpeechClient()
+
+
+def new_speech_client():
+    from google.cloud import speech
+    return speech.SpeechClient()
+
+
+def new_llm_client():
+    from openai import OpenAI
+    return OpenAI(
+        api_key=("api_key"),
+    )
+
+
+def probe_speech_client(client):
+    from google.cloud import speech
+    silence = b"\x00\x00" * 1600  # 100 ms at 16 kHz
+    client.recognize(config=recognition_config(), audio=speech.RecognitionAudio(content=silence))
 
-tts_client = texttospeech.TextToSpeechClient()
 
+# Process-wide clients: one gRPC channel (or HTTP pool) each, reused by every
+# request. They are built, with their libraries imported, by the start-up
+# warm-up (warm_up_clients) or on first use
+tts_client = LazyClient("tts", new_tts_client,
+                        probe=lambda c: c.list_voices(language_code=TTS_LANGUAGE_CODE))
+speech_client = LazyClient("stt", new_speech_client, probe=probe_speech_client)
+llm_client = LazyClient("llm", new_llm_client, probe=lambda c: c.models.list())
 
-client = OpenAI(
-    api_key=("api_key"),  
+# Voice settings used for every synthesis (also part of the TTS cache key)
+TTS_LANGUAGE_CODE = "tr-TR"
+TTS_VOICE_NAME = "tr-TR-Standard-D"
+TTS_PITCH = -4.0
+TTS_SPEAKING_RATE = 1.0
+
+# Two-tier TTS cache: memory LRU + persistent directory
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "tts_cache")
+tts_cache = TTSCache(
+    TTS_CACHE_DIR,
+    max_memory_bytes=int(os.getenv("TTS_CACHE_MEMORY_MB", "32")) * 1024 * 1024,
+    max_disk_bytes=int(os.getenv("TTS_CACHE_DISK_MB", "512")) * 1024 * 1024
 )
 
-session = {
-    'chat_history': []
-}
+# Worker threads that synthesize reply sentences while the LLM keeps generating
+tts_executor = ThreadPoolExecutor(max_workers=int(os.getenv("TTS_WORKERS", "4")))
+# /ttsBatch synthesis runs on its own pool, so a robot preparing its scripted
+# lines does not hold up live replies
+tts_batch_executor = ThreadPoolExecutor(max_workers=int(os.getenv("TTS_BATCH_WORKERS", "4")))
+TTS_BATCH_MAX_TEXTS = 64
+
+
+# Conversation state per robot/participant, keyed by the X-Session-Id header
+sessions = SessionStore(
+    max_sessions=int(os.getenv("MAX_SESSIONS", "64")),
+    idle_timeout=float(os.getenv("SESSION_IDLE_TIMEOUT", "1800")),
+    # Token budget of the verbatim recent-turn window; older turns are summarized
+    history_tokens=int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+)
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-4o-mini")
+# Summaries are written off the request path
+summary_executor = ThreadPoolExecutor(max_workers=2)
+# Requests without a session id (older bridges) share this one
+DEFAULT_SESSION_ID = "default"
+
+# Stage latency histograms and counters, exported on /metrics
+metrics = StageMetrics()
+
+# Deadlines (seconds) of the backend calls; a slow call is hedged with one
+# duplicate request after its recent p95 latency, and repeated failures open
+# the backend's circuit breaker
+STT_DEADLINE = float(os.getenv("STT_DEADLINE", "8"))
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "10"))
+TTS_DEADLINE = float(os.getenv("TTS_DEADLINE", "6"))
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "1") != "0"
+# Streaming STT lasts as long as the user speaks, plus the final result
+STREAMING_STT_DEADLINE = float(os.getenv("STREAMING_STT_DEADLINE", "30"))
+backend_executor = ThreadPoolExecutor(max_workers=int(os.getenv("BACKEND_WORKERS", "32")))
+stt_backend = ResilientBackend("stt", backend_executor, metrics, STT_DEADLINE, hedge=HEDGE_REQUESTS, hedge_delay=2.0)
+llm_backend = ResilientBackend("llm", backend_executor, metrics, LLM_DEADLINE, hedge=HEDGE_REQUESTS, hedge_delay=3.0)
+tts_backend = ResilientBackend("tts", backend_executor, metrics, TTS_DEADLINE, hedge=HEDGE_REQUESTS, hedge_delay=1.5)
+# History summaries are off the request path: no hedging, but a deadline and
+# a breaker of their own, so a hung summary model cannot hold a session's
+# fold (and with it the hard history limit) or the summary workers for long
+SUMMARY_DEADLINE = float(os.getenv("SUMMARY_DEADLINE", "15"))
+summary_backend = ResilientBackend("summary", backend_executor, metrics, SUMMARY_DEADLINE, hedge=False)
+BACKENDS = (stt_backend, llm_backend, tts_backend, summary_backend)
+
+# Said instead of a ChatGPT reply when the LLM is unavailable (synthesized at
+# start-up, so it plays from the TTS cache even when TTS is down as well)
+FALLBACK_REPLY = "Çok güzel bir fikir! Peki bu nesneyi başka nasıl kullanabiliriz?"
+
+# Speculative ChatGPT calls on stable interim transcripts of streamed uploads
+# (SPECULATIVE_LLM=0 turns them off); the reply is kept when the final
+# transcript is at least SPECULATION_MATCH similar to the speculated one
+SPECULATIVE_LLM = os.getenv("SPECULATIVE_LLM", "1") != "0"
+SPECULATION_MIN_STABILITY = float(os.getenv("SPECULATION_MIN_STABILITY", "0.8"))
+SPECULATION_MATCH = float(os.getenv("SPECULATION_MATCH", "0.9"))
+speculation_executor = ThreadPoolExecutor(max_workers=int(os.getenv("SPECULATION_WORKERS", "8")))
+
+# Optional cross-session reply cache: near-identical answers in the first
+# REPLY_CACHE_MAX_POSITION turns of an object reuse an earlier reply + audio
+reply_cache = ReplyCache(
+    threshold=float(os.getenv("REPLY_CACHE_SIMILARITY", "0.85")),
+    ttl=float(os.getenv("REPLY_CACHE_TTL", str(7 * 24 * 3600))),
+    max_entries=int(os.getenv("REPLY_CACHE_MAX_ENTRIES", "512")),
+    max_position=int(os.getenv("REPLY_CACHE_MAX_POSITION", "2")),
+    min_similar_words=int(os.getenv("REPLY_CACHE_MIN_WORDS", "4"))
+) if os.getenv("REPLY_CACHE", "0") == "1" else None
+
+# Optional session archive: every /listenUser(Stream) turn is appended to
+# SESSION_ARCHIVE_DIR (off the request path) for later replay
+SESSION_ARCHIVE_DIR = os.getenv("SESSION_ARCHIVE_DIR")
+session_archive = SessionArchive(SESSION_ARCHIVE_DIR) if SESSION_ARCHIVE_DIR else None
+archive_executor = ThreadPoolExecutor(max_workers=1)
 
 
 # If you have scenario lines, you can store them in a global list or DB
@@ -68,45 +217,60 @@ SCENARIO_LINES = [
 # ------------------------------------------------------------------------------
 # HELPER: Google TTS
 # ------------------------------------------------------------------------------
-def google_tts_turkish(text):
+def google_tts_turkish(text, voice_name=TTS_VOICE_NAME, pitch=TTS_PITCH, speaking_rate=TTS_SPEAKING_RATE):
     """
     Generate TTS using Google Cloud API with specified voice and pitch.
+    Results are served from / stored in the TTS cache, so repeated lines
+    never hit the remote API twice.
 
     Parameters:
         text (str): Text to synthesize.
+        voice_name (str): Google voice name.
+        pitch (float): Pitch in semitones.
+        speaking_rate (float): Speaking rate (1.0 = normal).
 
     Returns:
         bytes: The raw WAV audio content.
     """
+    from google.cloud import texttospeech
+
     if not isinstance(text, str) or not text.strip():
         print(f"[google_tts_turkish] Invalid text input: {text}")
         return None
 
+    cache_key = tts_cache_key(text, voice_name, pitch, speaking_rate)
+    cached = tts_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
     try:
         # Define the input text
         synthesis_input = texttospeech.SynthesisInput(text=text)
         
         # Define the voice parameters
         voice = texttospeech.VoiceSelectionParams(
-            language_code="tr-TR",      # Turkish language
-            name="tr-TR-Standard-D",   # Specific voice name
+            language_code=TTS_LANGUAGE_CODE,  # Turkish language
+            name=voice_name,                  # Specific voice name
             ssml_gender=texttospeech.SsmlVoiceGender.NEUTRAL
         )
         
         # Define the audio configuration
         audio_config = texttospeech.AudioConfig(
             audio_encoding=texttospeech.AudioEncoding.LINEAR16,  # WAV format
-            pitch=-4.0,                                         # Lower pitch by 4 semitones
-            speaking_rate=1.0                                   # Normal speaking speed
+            pitch=pitch,                                        # Lower pitch by 4 semitones (default)
+            speaking_rate=speaking_rate                         # Normal speaking speed (default)
         )
         
-        # Call the TTS API
-        response = tts_client.synthesize_speech(
+        # Call the TTS API (deadline, hedging and circuit breaker)
+        response = tts_backend.call(
+            tts_client.get().synthesize_speech,
             input=synthesis_input,
             voice=voice,
-            audio_config=audio_config
+            audio_config=audio_config,
+            timeout=TTS_DEADLINE
         )
-        
+
+        tts_cache.put(cache_key, response.audio_content)
         return response.audio_content  # Return raw WAV bytes
 
     except Exception as e:
@@ -115,27 +279,34 @@ def google_tts_turkish(text):
 # ------------------------------------------------------------------------------
 # HELPER: Google STT
 # ------------------------------------------------------------------------------
-def google_stt(wav_data):
+def recognition_config(encoding="LINEAR16"):
+    from google.cloud import speech
+    return speech.RecognitionConfig(
+        encoding=getattr(speech.RecognitionConfig.AudioEncoding, encoding),
+        sample_rate_hertz=16000,
+        language_code="tr-TR"  # Turkish language
+    )
+
+
+def google_stt(wav_data, encoding="LINEAR16"):
     """
     Perform STT using Google Cloud Speech-to-Text.
+    'encoding' names the RecognitionConfig.AudioEncoding of the upload
+    (LINEAR16 WAV, FLAC or OGG_OPUS are passed to Google as-is).
     """
+    from google.cloud import speech
+
     if not wav_data or len(wav_data) == 0:
         print("[google_stt] Empty or invalid WAV data.")
         return ""
 
     try:
-        client = speech.SpeechClient()
-
         # Configure audio settings
         audio = speech.RecognitionAudio(content=wav_data)
-        config = speech.RecognitionConfig(
-            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-            sample_rate_hertz=16000,
-            language_code="tr-TR"  # Turkish language
-        )
 
-        # Perform speech recognition
-        response = client.recognize(config=config, audio=audio)
+        # Perform speech recognition (deadline, hedging and circuit breaker)
+        response = stt_backend.call(speech_client.get().recognize, config=recognition_config(encoding), audio=audio,
+                                    timeout=STT_DEADLINE)
 
         # Extract transcription
         for result in response.results:
@@ -146,33 +317,612 @@ def google_stt(wav_data):
         print("[google_stt] Exception:", e)
         return ""
 
+
+def strip_wav_header(chunks):
+    """
+    Drop a leading RIFF/WAVE header from a stream of audio chunks, so only
+    raw PCM reaches streaming LINEAR16 recognition.
+    """
+    head = b""
+    for chunk in chunks:
+        if head is None:
+            yield chunk
+            continue
+        head += chunk
+        if len(head) < 44:
+            continue
+        if head.startswith(b"RIFF"):
+            data_pos = head.find(b"data", 12)
+            if data_pos < 0:
+                continue
+            head = head[data_pos + 8:]
+        if head:
+            yield head
+        head = None
+    if head:
+        yield head
+
+
+def google_stt_streaming(chunks, encoding="LINEAR16", on_interim=None):
+    """
+    Perform STT with streaming_recognize while the audio is still arriving.
+
+    Parameters:
+        chunks (iterable of bytes): Audio as it is received from the bridge.
+        encoding (str): RecognitionConfig.AudioEncoding name.
+        on_interim (callable): Called as on_interim(transcript, stability, is_final)
+            for every interim and final result.
+
+    Returns:
+        str: The final transcript ("" if nothing was recognized).
+
+    The request stream can only be consumed once, so this call is not
+    hedged; it still has a deadline and goes through the STT circuit breaker.
+    """
+    from google.cloud import speech
+
+    if not stt_backend.breaker.allow():
+        stt_backend.count("short_circuit")
+        print("[google_stt_streaming] STT circuit open, skipping recognition.")
+        return ""
+
+    if encoding == "LINEAR16":
+        chunks = strip_wav_header(chunks)
+
+    streaming_config = speech.StreamingRecognitionConfig(
+        config=recognition_config(encoding),
+        interim_results=True
+    )
+    requests_ = (speech.StreamingRecognizeRequest(audio_content=chunk) for chunk in chunks if chunk)
+
+    finals = []
+    start = time.time()
+    try:
+        responses = speech_client.get().streaming_recognize(config=streaming_config, requests=requests_,
+                                                      timeout=STREAMING_STT_DEADLINE)
+        for response in responses:
+            for result in response.results:
+                if not result.alternatives:
+                    continue
+                transcript = result.alternatives[0].transcript
+                if on_interim is not None:
+                    on_interim(transcript, result.stability, result.is_final)
+                if result.is_final:
+                    finals.append(transcript.strip())
+        stt_backend.record_success(time.time() - start)
+        return " ".join(t for t in finals if t)
+    except Exception as e:
+        print("[google_stt_streaming] Exception:", e)
+        stt_backend.record_failure()
+        return ""
+
 # ------------------------------------------------------------------------------
 # HELPER: ChatGPT
 # ------------------------------------------------------------------------------
-def chatgpt_respond(prompt_text):
+SYSTEM_PROMPT = (
+    "Sen Deniz adlı bir NAO insansı robotsun. Katılımcılarla tamamen Türkçe olarak etkileşim kuruyor ve onlara belirtilen bir gündelik nesnenin yaratıcı alternatif kullanımları için fikirler üretmelerine yardımcı oluyorsun. Tanışma faslını bitirdik ve merhabalaştınız. Katılımcıya görevi açıkladık ve nesne için toplamda 3 dakika konuşacağınızı belirttik. Görevin, katılımcıya rehberlik ederek sorular sormak, fikirlerini geliştirmelerine destek olmak ve yaratıcı öneriler sunmaktır. Cevaplarını doğal bir diyalog sürdürebilmek için olabildiğince kısa tut ve doğal bir dil kullan. Öneri vermeye kullanıcı başlayacak, daha sonra sen başka bir öneri sun, sonrasında kullanıcıya başka nasıl kullanılabileceğini sor, böylece bir sen bir kullanıcı bir kullanım önersin. Süre doldu promptu gelene kadar aynı nesne üzerinde duracağız, bu nedenle kullanıcı takılırsa da yapıcı bir şekilde yardımcı ol, böylece belli bir cevaba erişmesini sağla. Farklı bir nesne üzerine düşünmeyi önerme."
+)
+
+
+def build_chat_messages(prompt_text, session):
+    """
+    System prompt + the session's conversation so far + the new user prompt.
+    """
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        *session.chat_history.messages(),
+        {"role": "user", "content": prompt_text}
+    ]
+
+
+def summarize_turns(previous_summary, turns):
+    """
+    Fold 'turns' into the running summary of the conversation (short, Turkish,
+    keeps every idea already proposed so the robot does not repeat them).
+    """
+    transcript = "\n".join(
+        f"{'Kullanıcı' if m['role'] == 'user' else 'Deniz'}: {m['content']}" for m in turns
+    )
+    # No client-side retries: a failed fold is retried by ChatHistory's backoff
+    completion = summary_backend.call(
+        llm_client.get().with_options(max_retries=0).chat.completions.create,
+        model=SUMMARY_MODEL,
+        messages=[
+            {"role": "system", "content": (
+                "Bir robot ile katılımcı arasındaki yaratıcı alternatif kullanım görevinin "
+                "konuşmasını özetliyorsun. Önceki özeti yeni konuşma parçasıyla birleştir. "
+                "Hangi nesne üzerinde çalışıldığını ve şimdiye kadar önerilen tüm kullanım "
+                "fikirlerini koru, en fazla 5 kısa cümle yaz."
+            )},
+            {"role": "user", "content": f"Önceki özet: {previous_summary or '-'}\n\nYeni konuşma:\n{transcript}"}
+        ],
+        temperature=0.2,
+        max_tokens=250,
+        timeout=SUMMARY_DEADLINE
+    )
+    return completion.choices[0].message.content.strip()
+
+
+def remember_turn(session, prompt_text, response):
+    """
+    Store both sides of the turn and, once the recent window exceeds its
+    token budget, fold the oldest turns into the summary in the background.
+    """
+    session.chat_history.add("user", prompt_text)
+    session.chat_history.add("assistant", response)
+    if session.chat_history.needs_fold():
+        summary_executor.submit(session.chat_history.fold, summarize_turns)
+
+
+def chatgpt_reply(prompt_text, session):
+    """
+    ChatGPT's reply to 'prompt_text' in the context of 'session', without
+    touching the history (also used for speculative calls). Raises on failure.
+    """
+    completion = llm_backend.call(
+        llm_client.get().chat.completions.create,
+        model="gpt-4o",
+        messages=build_chat_messages(prompt_text, session),
+        temperature=0.7,
+        timeout=LLM_DEADLINE
+    )
+    return completion.choices[0].message.content.strip()  # Extract text content
+
+
+def chatgpt_respond(prompt_text, session, speculated=None):
     """
-    Generate a creative response using ChatGPT.
+    Generate a creative response using ChatGPT, in the context of 'session'.
+    'speculated' is a reply already generated from the interim transcript.
+    Falls back to FALLBACK_REPLY (not kept in the history) when the LLM fails.
     """
     try:
-        completion = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": (
-                    "Sen Deniz adlı bir NAO insansı robotsun. Katılımcılarla tamamen Türkçe olarak etkileşim kuruyor ve onlara belirtilen bir gündelik nesnenin yaratıcı alternatif kullanımları için fikirler üretmelerine yardımcı oluyorsun. Tanışma faslını bitirdik ve merhabalaştınız. Katılımcıya görevi açıkladık ve nesne için toplamda 3 dakika konuşacağınızı belirttik. Görevin, katılımcıya rehberlik ederek sorular sormak, fikirlerini geliştirmelerine destek olmak ve yaratıcı öneriler sunmaktır. Cevaplarını doğal bir diyalog sürdürebilmek için olabildiğince kısa tut ve doğal bir dil kullan. Öneri vermeye kullanıcı başlayacak, daha sonra sen başka bir öneri sun, sonrasında kullanıcıya başka nasıl kullanılabileceğini sor, böylece bir sen bir kullanıcı bir kullanım önersin. Süre doldu promptu gelene kadar aynı nesne üzerinde duracağız, bu nedenle kullanıcı takılırsa da yapıcı bir şekilde yardımcı ol, böylece belli bir cevaba erişmesini sağla. Farklı bir nesne üzerine düşünmeyi önerme."
-                )},
-                *session["chat_history"],
-                {"role": "user", "content": prompt_text}
-            ],
-            temperature=0.7
-        )
-        response = completion.choices[0].message.content.strip()  # Extract text content
-        session["chat_history"].append({"role": "assistant", "content": response})
+        response = speculated or chatgpt_reply(prompt_text, session)
+        remember_turn(session, prompt_text, response)
         return response
     except Exception as e:
         print("[chatgpt_respond] Error:", e)
-        return "Bir hata oluştu."
+        llm_backend.count("fallback")
+        return FALLBACK_REPLY
+
+
+def close_stream(stream):
+    if hasattr(stream, "close"):
+        stream.close()
+
+
+def chatgpt_respond_stream(prompt_text, session, speculated=None, state=None):
+    """
+    Same as chatgpt_respond, but yields the reply as text deltas while the
+    model is still generating. The full reply is added to the chat history
+    once the stream ends. A 'speculated' reply is yielded at once.
+    'state["complete"]' is set once the whole reply has been yielded (not
+    for the fallback line or a stream that broke off partway).
+    """
+    if state is None:
+        state = {}
+    state["complete"] = False
+    if speculated:
+        remember_turn(session, prompt_text, speculated)
+        yield speculated
+        state["complete"] = True
+        return
+
+    parts = []
+    try:
+        # The deadline and hedging cover the time to the first response;
+        # 'timeout' also bounds every read of the token stream after that
+        stream = llm_backend.call(
+            llm_client.get().chat.completions.create,
+            model="gpt-4o",
+            messages=build_chat_messages(prompt_text, session),
+            temperature=0.7,
+            stream=True,
+            timeout=LLM_DEADLINE,
+            discard=close_stream
+        )
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+        state["complete"] = True
+    except Exception as e:
+        print("[chatgpt_respond_stream] Error:", e)
+        if not parts:
+            llm_backend.count("fallback")
+            yield FALLBACK_REPLY
+            return
+
+    response = "".join(parts).strip()
+    if response:
+        remember_turn(session, prompt_text, response)
+
+
+# A sentence ends at . ! ? or … (possibly repeated) followed by whitespace
+SENTENCE_END = re.compile(r'(?<=[.!?…])["\')]*\s+')
+
+
+def split_sentences(text_stream, min_chars=12):
+    """
+    Regroup a stream of text deltas into complete sentences. Very short
+    fragments ("Evet.") are merged with the following sentence so that
+    every TTS call has enough text to sound natural.
+    """
+    buffer = ""
+    for delta in text_stream:
+        buffer += delta
+        while True:
+            match = None
+            for m in SENTENCE_END.finditer(buffer):
+                if m.start() >= min_chars:
+                    match = m
+                    break
+            if match is None:
+                break
+            sentence, buffer = buffer[:match.start()].strip(), buffer[match.end():]
+            if sentence:
+                yield sentence
+    if buffer.strip():
+        yield buffer.strip()
 
     
+# ------------------------------------------------------------------------------
+# HELPER: audio transport
+# ------------------------------------------------------------------------------
+# Upload content types and the Google STT encoding they map to
+UPLOAD_ENCODINGS = {
+    "audio/wav": "LINEAR16",
+    "audio/x-wav": "LINEAR16",
+    "audio/l16": "LINEAR16",
+    "audio/flac": "FLAC",
+    "audio/x-flac": "FLAC",
+    "audio/ogg": "OGG_OPUS",
+    "audio/opus": "OGG_OPUS",
+}
+UPLOAD_EXTENSIONS = {".wav": "LINEAR16", ".flac": "FLAC", ".ogg": "OGG_OPUS", ".opus": "OGG_OPUS"}
+
+# Length-prefixed binary frames for /listenUserStream:
+#   4-byte big-endian header length, JSON header, 4-byte audio length, audio
+FRAMES_MIMETYPE = "application/x-naochat-frames"
+
+
+def upload_encoding(file_storage):
+    """
+    STT encoding of an uploaded file, from its content type or extension.
+    """
+    encoding = UPLOAD_ENCODINGS.get(file_storage.mimetype)
+    if encoding is None:
+        ext = os.path.splitext(file_storage.filename or "")[1].lower()
+        encoding = UPLOAD_EXTENSIONS.get(ext, "LINEAR16")
+    return encoding
+
+
+def stt_upload(audio, encoding):
+    """
+    (audio, encoding) of an upload as Google STT takes it. Ogg/Opus, FLAC and
+    WAV go through as-is; Ogg/Vorbis (what Pepper's ALAudioRecorder writes
+    for "ogg") is not accepted by Google and is decoded to 16 kHz LINEAR16.
+    """
+    if encoding != "OGG_OPUS" or not is_ogg_vorbis(audio):
+        return audio, encoding
+    try:
+        wav_data = compressed_to_wav(audio, rate=16000)
+    except Exception as e:
+        print("[stt_upload] Ogg/Vorbis decoding failed:", e)
+        wav_data = None
+    if wav_data is None:
+        print("[stt_upload] Cannot decode Ogg/Vorbis (pip install soundfile); passing it to STT as-is.")
+        return audio, encoding
+    return wav_data, "LINEAR16"
+
+
+def wants_binary_audio():
+    """
+    True if the client prefers raw audio/wav over base64 JSON.
+    Clients that send no Accept header (or */*) keep getting JSON.
+    """
+    return request.accept_mimetypes.best_match(["application/json", "audio/wav"]) == "audio/wav"
+
+
+def binary_audio_response(audio_bytes, **metadata):
+    """
+    Raw WAV body; text metadata travels in percent-encoded UTF-8 headers
+    such as X-Recognized-Text.
+    """
+    headers = {}
+    for name, value in metadata.items():
+        header_name = "X-" + "-".join(part.capitalize() for part in name.split("_"))
+        headers[header_name] = quote(value or "")
+    return Response(audio_bytes, mimetype="audio/wav", headers=headers)
+
+
+STREAM_CHUNK_BYTES = 4096
+
+
+def iter_request_body():
+    """
+    Yield the raw request body in chunks as it arrives (chunked uploads are
+    decoded by the WSGI server).
+    """
+    while True:
+        chunk = request.stream.read(STREAM_CHUNK_BYTES)
+        if not chunk:
+            return
+        yield chunk
+
+
+def recorded_body(chunks, record):
+    """
+    Pass a streamed upload through, keeping a copy of it (and how long it
+    took to arrive) in the archive 'record'.
+    """
+    start = time.time()
+    kept = []
+    for chunk in chunks:
+        kept.append(chunk)
+        yield chunk
+    record["upload_ms"] = round((time.time() - start) * 1000, 1)
+    record["blobs"]["capture"] = b"".join(kept)
+
+
+def start_speculation(session, instruction):
+    """
+    A Speculation making chatgpt_reply() calls for this request's interim
+    transcripts (None when speculation is off, or for multipart file
+    uploads: batch recognition has no interim transcripts).
+    """
+    if not SPECULATIVE_LLM or request.mimetype not in UPLOAD_ENCODINGS:
+        return None
+
+    def speculate(transcript):
+        return chatgpt_reply(f"{instruction}\nKullanıcı: {transcript}", session)
+
+    return Speculation(speculation_executor, speculate, metrics,
+                       min_stability=SPECULATION_MIN_STABILITY, match=SPECULATION_MATCH)
+
+
+def take_speculation(speculation, recognized_text, cached):
+    """
+    The speculated reply if it fits the final transcript; the speculation is
+    dropped when there is nothing to use it for.
+    """
+    if speculation is None:
+        return None
+    if cached is not None or not recognized_text:
+        speculation.discard()
+        return None
+    return speculation.take(recognized_text)
+
+
+def lookup_reply(instruction, position, transcript):
+    """
+    The cached reply for this turn (None if caching is off, the turn is too
+    far into the object's dialogue, or nothing similar was cached).
+    """
+    if reply_cache is None or not reply_cache.cacheable(position):
+        return None
+    cached = reply_cache.get(instruction, position, transcript)
+    metrics.inc("reply_cache_lookups_total", result="hit" if cached is not None else "miss")
+    return cached
+
+
+def store_reply(instruction, position, transcript, reply, segments):
+    """
+    Cache a freshly generated reply with its [(sentence, wav_bytes)] audio
+    (canned fallback replies are never cached).
+    """
+    if reply_cache is not None and reply and reply != FALLBACK_REPLY:
+        reply_cache.put(instruction, position, transcript, reply, segments)
+
+
+def completed_future(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def request_session():
+    """
+    The ConversationSession named by the X-Session-Id header (the shared
+    default session when the header is missing). Unknown or expired ids get
+    a fresh session so the robot can carry on.
+    """
+    session_id = request.headers.get("X-Session-Id") or DEFAULT_SESSION_ID
+    return sessions.get_or_create(session_id)
+
+
+def request_instruction():
+    """
+    Scenario instruction of a raw-body upload (X-Current-Instruction header).
+    """
+    return unquote(request.headers.get("X-Current-Instruction", ""))
+
+
+def recognize_request_audio(on_interim=None, record=None):
+    """
+    STT for the audio of the current request.
+    - multipart upload ("file"): batch recognition of the complete file
+    - raw audio body (audio/l16, audio/wav, audio/flac, ...): streaming
+      recognition, fed chunk by chunk while the bridge is still sending;
+      interim results also go to 'on_interim(transcript, stability, is_final)'
+    The upload and the interim results are kept in the archive 'record'.
+
+    Returns:
+        (recognized_text, current_instruction), or (None, None) if the
+        request carries no audio.
+    """
+    if "file" in request.files:
+        file_ = request.files["file"]
+        current_instruction = request.form.get("current_instruction", "")
+        wav_data = file_.read()
+        if record is not None:
+            record.update(upload="multipart", filename=file_.filename, content_type=file_.mimetype)
+            record["blobs"]["capture"] = wav_data
+        return google_stt(*stt_upload(wav_data, upload_encoding(file_))), current_instruction
+
+    encoding = UPLOAD_ENCODINGS.get(request.mimetype)
+    if encoding is None:
+        return None, None
+    current_instruction = request_instruction()
+    body = iter_request_body()
+    stt_start = time.time()
+    if record is not None:
+        record.update(upload="raw", content_type=request.content_type)
+        body = recorded_body(body, record)
+
+    def log_interim(transcript, stability, is_final):
+        if not is_final:
+            print(f"[recognize_request_audio] interim ({stability:.2f}): {transcript}")
+        if record is not None:
+            record["interim"].append([round((time.time() - stt_start) * 1000, 1), transcript,
+                                      round(stability, 3), is_final])
+        if on_interim is not None:
+            on_interim(transcript, stability, is_final)
+
+    return google_stt_streaming(body, encoding, on_interim=log_interim), current_instruction
+
+
+def encode_frame(header, audio=b""):
+    header_bytes = json.dumps(header).encode("utf-8")
+    return struct.pack(">I", len(header_bytes)) + header_bytes + struct.pack(">I", len(audio)) + audio
+
+
+def timed_tts(turn, text, **voice):
+    """
+    google_tts_turkish, recorded as a "tts" span of 'turn' (runs on TTS workers).
+    'voice' may override voice_name / pitch / speaking_rate.
+    """
+    with turn.span("tts"):
+        return google_tts_turkish(text, **voice)
+
+
+def tts_batch_items(body):
+    """
+    [(text, voice_name, pitch, speaking_rate)] of a /ttsBatch request body.
+    Raises ValueError on a malformed body.
+    """
+    if not isinstance(body, dict) or not isinstance(body.get("texts"), list):
+        raise ValueError("Expected a JSON object with a 'texts' list")
+    if len(body["texts"]) > TTS_BATCH_MAX_TEXTS:
+        raise ValueError(f"At most {TTS_BATCH_MAX_TEXTS} texts per batch")
+
+    items = []
+    for entry in body["texts"]:
+        if isinstance(entry, str):
+            entry = {"text": entry}
+        if not isinstance(entry, dict) or not isinstance(entry.get("text"), str) or not entry["text"].strip():
+            raise ValueError(f"Invalid entry: {entry!r}")
+        items.append((
+            entry["text"],
+            str(entry.get("voice_name", body.get("voice_name", TTS_VOICE_NAME))),
+            float(entry.get("pitch", body.get("pitch", TTS_PITCH))),
+            float(entry.get("speaking_rate", body.get("speaking_rate", TTS_SPEAKING_RATE)))
+        ))
+    return items
+
+
+def fallback_audio():
+    """
+    The pre-synthesized FALLBACK_REPLY from the TTS cache (None if missing).
+    """
+    return tts_cache.get(tts_cache_key(FALLBACK_REPLY, TTS_VOICE_NAME, TTS_PITCH, TTS_SPEAKING_RATE))
+
+
+def start_recording():
+    """
+    Archive record of the current turn, filled in while it runs (None when
+    there is no session archive).
+    """
+    if session_archive is None:
+        return None
+    return {
+        "session_id": request.headers.get("X-Session-Id") or DEFAULT_SESSION_ID,
+        "ts": round(g.turn.start, 3),
+        "interim": [],
+        "blobs": {}
+    }
+
+
+def note(record, **fields):
+    if record is not None:
+        record.update(fields)
+
+
+def write_archive(entry, blobs):
+    try:
+        session_archive.append(entry, blobs)
+    except Exception as e:
+        print("[write_archive] Could not archive turn:", e)
+
+
+def archive_turn(record, turn, **fields):
+    """
+    Queue a finished turn (record + the turn's spans) for the session archive.
+    """
+    if record is None:
+        return
+    blobs = record.pop("blobs")
+    archive_executor.submit(write_archive, turn.entry(**dict(record, **fields)), blobs)
+
+
+def request_start_time(header):
+    """
+    Unix time of an X-Request-Start header ("t=1700000000.123"; seconds,
+    milliseconds or microseconds as set by common proxies), or None.
+    """
+    if not header:
+        return None
+    try:
+        value = float(header.strip().lstrip("t="))
+    except ValueError:
+        return None
+    if value > 1e14:
+        value /= 1e6
+    elif value > 1e11:
+        value /= 1e3
+    return value
+
+
+def request_endpoint():
+    """
+    Route of the current request for metric names and labels; unknown paths
+    (404s, scanners) all count as "other" so /metrics stays bounded.
+    """
+    return request.url_rule.rule if request.url_rule is not None else "other"
+
+
+@app.before_request
+def start_turn():
+    # The bridge generates one id per turn and sends it with every request of that turn
+    turn_id = request.headers.get("X-Turn-Id") or uuid.uuid4().hex[:12]
+    g.turn = TurnSpans(metrics, turn_id, request_endpoint())
+
+    # Time the request waited for a worker thread, when the client or a
+    # proxy stamps it with "X-Request-Start: t=<unix seconds>"
+    request_start = request_start_time(request.headers.get("X-Request-Start"))
+    if request_start is not None:
+        g.turn.record("queue", max(0.0, g.turn.start - request_start), offset=request_start)
+
+
+@app.after_request
+def finish_turn(response):
+    turn = g.get("turn")
+    if turn is None:
+        return response
+    response.headers["X-Turn-Id"] = turn.turn_id
+    metrics.inc("requests_total", endpoint=request_endpoint(), status=response.status_code)
+    # Streamed replies record their total and log once the last message is sent
+    # (Flask also hands back error pages of unknown paths as iterators)
+    streamed = response.is_streamed and request.url_rule is not None
+    if not streamed and request.path not in ("/metrics", "/ready"):
+        turn.record(turn.request_stage, time.time() - turn.start, offset=turn.start)
+        turn.log(status=response.status_code)
+        archive_turn(g.get("record"), turn, status=response.status_code)
+    return response
+
+
 # ------------------------------------------------------------------------------
 # ROUTES
 # ------------------------------------------------------------------------------
@@ -180,29 +930,161 @@ def chatgpt_respond(prompt_text):
 @app.route("/startScenario", methods=["GET"])
 def start_scenario():
     """
-    Resets scenario or sets flags, if needed.
+    Starts a fresh scenario and returns its session id, which the bridge
+    sends back in the X-Session-Id header of every later request. A request
+    that names a session in X-Session-Id restarts that one instead. The
+    server's TTS voice comes along, so the bridge knows when audio it
+    preloaded earlier was made with another voice.
     """
-    # Reset scenario state
-    session['chat_history'] = []
-    return jsonify({"message": "Scenario started."})
+    session_id = request.headers.get("X-Session-Id")
+    if session_id is None:
+        # Clients without session ids (older bridges, or one whose
+        # /startScenario reply got lost) talk in the shared default session:
+        # start it over so the next participant gets an empty history
+        sessions.create(DEFAULT_SESSION_ID)
+    session = sessions.create(session_id)
+    return jsonify({"message": "Scenario started.", "session_id": session.session_id,
+                    "tts_voice": {"voice_name": TTS_VOICE_NAME, "pitch": TTS_PITCH,
+                                  "speaking_rate": TTS_SPEAKING_RATE}})
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    """
+    Readiness probe: 200 once the start-up warm-up has finished (503 until
+    then), with the warm state of every backend client and the start-up
+    timings (ms since the process started).
+    """
+    status = startup.status()
+    return jsonify(status), 200 if status["ready"] else 503
 
 @app.route("/ttsBytes", methods=["GET"])
 def tts_bytes():
     """
-    TTS any text. Return JSON with base64 WAV data: { "wav_base64": "..." }
+    TTS any text. Return JSON with base64 WAV data: { "wav_base64": "..." },
+    or the raw WAV body if the client sends "Accept: audio/wav".
     Usage: /ttsBytes?prompt=Merhaba%20Dunya
     """
     prompt = request.args.get("prompt")
     if not prompt:
         return jsonify({"error": "No prompt provided"}), 400
 
-    wav_data = google_tts_turkish(prompt)
+    wav_data = timed_tts(g.turn, prompt)
     if wav_data is None:
         return jsonify({"error": "TTS failed"}), 500
 
-    b64_data = base64.b64encode(wav_data).decode("utf-8")
+    if wants_binary_audio():
+        return binary_audio_response(wav_data)
+
+    with g.turn.span("encode"):
+        b64_data = base64.b64encode(wav_data).decode("utf-8")
     return jsonify({"wav_base64": b64_data})
 
+@app.route("/ttsBatch", methods=["POST"])
+def tts_batch():
+    """
+    TTS many texts in one request. JSON body:
+        {"texts": ["...", {"text": "...", "pitch": -2.0}, ...],
+         "voice_name": ..., "pitch": ..., "speaking_rate": ...}
+    (per-text settings override the request-wide ones, which default to the
+    server's voice). Identical entries are synthesized once; up to
+    TTS_BATCH_WORKERS run concurrently.
+
+    With "Accept: application/x-naochat-frames" every line is sent as soon
+    as it is ready, as a binary frame {"index", "text"} + raw WAV (or
+    {"index", "text", "error"} without audio), in completion order, then
+    {"done": true, "count": n}. Otherwise the reply is one JSON object
+    {"results": [{"index", "text", "wav_base64"}, ...]} in request order.
+    """
+    try:
+        items = tts_batch_items(request.get_json(silent=True))
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    turn = g.turn
+    indices = {}
+    for index, item in enumerate(items):
+        indices.setdefault(item, []).append(index)
+    futures = dict(
+        (tts_batch_executor.submit(timed_tts, turn, text, voice_name=voice_name, pitch=pitch,
+                                   speaking_rate=speaking_rate), (text, voice_name, pitch, speaking_rate))
+        for text, voice_name, pitch, speaking_rate in indices
+    )
+
+    if request.accept_mimetypes.best_match(["application/json", FRAMES_MIMETYPE]) != FRAMES_MIMETYPE:
+        results = [None] * len(items)
+        for future, item in futures.items():
+            audio_bytes = future.result()
+            for index in indices[item]:
+                result = {"index": index, "text": item[0]}
+                if audio_bytes is None:
+                    result["error"] = "TTS failed"
+                else:
+                    result["wav_base64"] = base64.b64encode(audio_bytes).decode("utf-8")
+                results[index] = result
+        return jsonify({"results": results})
+
+    def generate():
+        for future in as_completed(futures):
+            item = futures[future]
+            audio_bytes = future.result()
+            for index in indices[item]:
+                with turn.span("encode"):
+                    if audio_bytes is None:
+                        yield encode_frame({"index": index, "text": item[0], "error": "TTS failed"})
+                    else:
+                        yield encode_frame({"index": index, "text": item[0]}, audio_bytes)
+        yield encode_frame({"done": True, "count": len(items)})
+        turn.record(turn.request_stage, time.time() - turn.start, offset=turn.start)
+        turn.log(texts=len(items), unique=len(futures))
+
+    return Response(generate(), mimetype=FRAMES_MIMETYPE)
+
+@app.route("/ttsCacheStats", methods=["GET"])
+def tts_cache_stats():
+    """
+    Hit/miss/eviction counters of the TTS cache.
+    """
+    return jsonify(tts_cache.stats())
+
+# Cache stats that only ever grow; exported as counters so rate() works
+CACHE_COUNTERS = {"hits", "memory_hits", "disk_hits", "similar_hits", "misses", "evictions"}
+
+
+def render_cache_stats(cache_name, stats):
+    """
+    Prometheus lines for a cache's stats(): counters as <name>_total, the
+    current entries / bytes as gauges.
+    """
+    lines = []
+    for name, value in sorted(stats.items()):
+        if name in CACHE_COUNTERS:
+            metric, kind = f"{metrics.prefix}_{cache_name}_{name}_total", "counter"
+        else:
+            metric, kind = f"{metrics.prefix}_{cache_name}_{name}", "gauge"
+        lines.append(f"# TYPE {metric} {kind}\n{metric} {value}\n")
+    return lines
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """
+    Prometheus scrape endpoint: stage latency histograms and quantiles
+    (including "queue" for stamped requests), request and backend call
+    counters (ok / hedged / hedge_won / timeout / error / short_circuit /
+    fallback), speculative LLM outcomes, circuit breaker states, the number
+    of live sessions and the TTS (and, when enabled, reply) cache counters.
+    """
+    lines = [metrics.render_prometheus()]
+    lines.append(f"# TYPE {metrics.prefix}_sessions gauge\n{metrics.prefix}_sessions {len(sessions)}\n")
+    lines.append(f"# TYPE {metrics.prefix}_backend_circuit_open gauge\n")
+    for backend in BACKENDS:
+        is_open = int(backend.breaker.state != "closed")
+        lines.append(f'{metrics.prefix}_backend_circuit_open{{backend="{backend.name}"}} {is_open}\n')
+    lines.extend(render_cache_stats("tts_cache", tts_cache.stats()))
+    if reply_cache is not None:
+        lines.extend(render_cache_stats("reply_cache", reply_cache.stats()))
+    return Response("".join(lines), mimetype="text/plain; version=0.0.4")
+
 @app.route("/listenUser", methods=["POST"])
 def listen_user():
     """
@@ -210,34 +1092,75 @@ def listen_user():
     - Perform STT
     - Generate a ChatGPT response
     - Convert ChatGPT response to TTS
-    - Return JSON with recognized text, ChatGPT response, and TTS audio
+    - Return JSON with recognized text, ChatGPT response, and TTS audio,
+      or (with "Accept: audio/wav") the raw WAV body with the texts in
+      X-Recognized-Text / X-Chatgpt-Response headers
+    The upload may be a multipart WAV/FLAC/Ogg-Opus file, or a raw (chunked)
+    audio body that is recognized while it streams in; in that case the
+    instruction comes in the X-Current-Instruction header.
     """
-    if "file" not in request.files:
-        return jsonify({"error": "No file provided"}), 400
-    file_ = request.files["file"]
-    wav_data = file_.read()
-
-    # Get current instruction from the request
-    current_instruction = request.form.get("current_instruction", "")
+    turn = g.turn
+    session = request_session()
+    speculation = start_speculation(session, request_instruction())
+    record = g.record = start_recording()
 
-    # Speech-to-Text (STT)
-    recognized_text = google_stt(wav_data)
+    # Speech-to-Text (STT); stable interim transcripts start ChatGPT early
+    with turn.span("stt"):
+        recognized_text, current_instruction = recognize_request_audio(
+            speculation.feed if speculation is not None else None, record)
+    note(record, instruction=current_instruction, transcript=recognized_text)
+    if not recognized_text and speculation is not None:
+        speculation.discard()
+    if recognized_text is None:
+        return jsonify({"error": "No file provided"}), 400
     if not recognized_text:
         return jsonify({"error": "STT failed", "recognized_text": ""}), 500
 
     # Generate ChatGPT response including the current instruction
+    # (turns of the same session are serialized, other sessions run in parallel)
     prompt_text = f"{current_instruction}\nKullanıcı: {recognized_text}"
-    chatgpt_res = chatgpt_respond(prompt_text)
+    with session.lock:
+        position = session.dialogue_position(current_instruction)
+        cached = lookup_reply(current_instruction, position, recognized_text)
+        if cached is not None:
+            take_speculation(speculation, recognized_text, cached)
+            chatgpt_res = cached.reply
+            remember_turn(session, prompt_text, chatgpt_res)
+        else:
+            with turn.span("llm"):
+                speculated = take_speculation(speculation, recognized_text, cached)
+                chatgpt_res = chatgpt_respond(prompt_text, session, speculated)
+            note(record, speculated=speculated is not None)
+        session.advance_dialogue(current_instruction)
+    note(record, position=position, prompt=prompt_text, reply_cache_hit=cached is not None)
     if not chatgpt_res:
         return jsonify({"error": "ChatGPT failed", "recognized_text": recognized_text}), 500
 
-    # Convert ChatGPT response to TTS
-    audio_bytes = google_tts_turkish(chatgpt_res)
+    if cached is not None:
+        # Cache hit: no LLM and no TTS
+        audio_bytes = concat_wav_bytes([audio for _, audio in cached.segments])
+    else:
+        # Convert ChatGPT response to TTS (or say the canned line if TTS is down)
+        audio_bytes = timed_tts(turn, chatgpt_res)
+        if audio_bytes is not None:
+            store_reply(current_instruction, position, recognized_text, chatgpt_res, [(chatgpt_res, audio_bytes)])
+        else:
+            audio_bytes = fallback_audio()
+            if audio_bytes is not None:
+                tts_backend.count("fallback")
+                chatgpt_res = FALLBACK_REPLY
+    note(record, reply=chatgpt_res, sentences=[chatgpt_res])
     if audio_bytes is None:
         return jsonify({"error": "TTS failed", "recognized_text": recognized_text, "chatgpt_response": chatgpt_res}), 500
+    if record is not None:
+        record["blobs"]["reply_0"] = audio_bytes
+
+    if wants_binary_audio():
+        return binary_audio_response(audio_bytes, recognized_text=recognized_text, chatgpt_response=chatgpt_res)
 
     # Return JSON response
-    b64_data = base64.b64encode(audio_bytes).decode("utf-8")
+    with turn.span("encode"):
+        b64_data = base64.b64encode(audio_bytes).decode("utf-8")
     return jsonify({
         "recognized_text": recognized_text,
         "chatgpt_response": chatgpt_res,
@@ -245,5 +1168,168 @@ def listen_user():
     })
 
 
+@app.route("/listenUserStream", methods=["POST"])
+def listen_user_stream():
+    """
+    Streaming variant of /listenUser:
+    - Perform STT
+    - Stream the ChatGPT reply token by token and cut it into sentences
+    - Synthesize every sentence as soon as it is complete
+    - Send newline-delimited JSON as chunked HTTP:
+        {"recognized_text": "..."}
+        {"index": 0, "text": "...", "wav_base64": "..."}   (one per sentence)
+        {"done": true, "chatgpt_response": "..."}
+      or, with "Accept: application/x-naochat-frames", the same messages as
+      binary frames carrying raw WAV instead of base64.
+    Accepts the same uploads as /listenUser. Replies served from the reply
+    cache arrive the same way, with their cached sentence audio.
+    """
+    binary_frames = request.accept_mimetypes.best_match(["application/x-ndjson", FRAMES_MIMETYPE]) == FRAMES_MIMETYPE
+
+    turn = g.turn
+    session = request_session()
+    speculation = start_speculation(session, request_instruction())
+    record = g.record = start_recording()
+    with turn.span("stt"):
+        recognized_text, current_instruction = recognize_request_audio(
+            speculation.feed if speculation is not None else None, record)
+    note(record, instruction=current_instruction, transcript=recognized_text)
+    if not recognized_text and speculation is not None:
+        speculation.discard()
+    if recognized_text is None:
+        return jsonify({"error": "No file provided"}), 400
+    if not recognized_text:
+        return jsonify({"error": "STT failed", "recognized_text": ""}), 500
+
+    prompt_text = f"{current_instruction}\nKullanıcı: {recognized_text}"
+
+    # Dialogue position, reply cache hit and whether the LLM stream
+    # completed, set by produce()
+    reply_state = {}
+
+    def produce(segments):
+        # LLM stream -> sentences -> TTS futures, handed over in reply order
+        # (or the cached sentences and their audio)
+        try:
+            with session.lock:
+                position = session.dialogue_position(current_instruction)
+                cached = lookup_reply(current_instruction, position, recognized_text)
+                reply_state.update(position=position, cached=cached is not None)
+                if cached is not None:
+                    take_speculation(speculation, recognized_text, cached)
+                    remember_turn(session, prompt_text, cached.reply)
+                    for sentence, audio_bytes in cached.segments:
+                        segments.put((sentence, completed_future(audio_bytes)))
+                else:
+                    llm_start = time.time()
+                    speculated = take_speculation(speculation, recognized_text, cached)
+                    reply_state.update(speculated=speculated is not None)
+                    first = True
+                    deltas = chatgpt_respond_stream(prompt_text, session, speculated, reply_state)
+                    for sentence in split_sentences(deltas):
+                        if first:
+                            turn.record("llm_first_sentence", time.time() - llm_start, offset=llm_start)
+                            first = False
+                        segments.put((sentence, tts_executor.submit(timed_tts, turn, sentence)))
+                    turn.record("llm", time.time() - llm_start, offset=llm_start)
+                session.advance_dialogue(current_instruction)
+        finally:
+            segments.put(None)
+
+    def message(header, audio=None):
+        with turn.span("encode"):
+            if binary_frames:
+                return encode_frame(header, audio or b"")
+            if audio is not None:
+                header = dict(header, wav_base64=base64.b64encode(audio).decode("utf-8"))
+            return json.dumps(header) + "\n"
+
+    def emit(sentences, sentence, audio_bytes):
+        if not sentences:
+            # Time to first audio, measured from the start of the request
+            turn.record("first_audio", time.time() - turn.start, offset=turn.start)
+        yield message({"index": len(sentences), "text": sentence}, audio_bytes)
+        sentences.append(sentence)
+
+    def generate():
+        yield message({"recognized_text": recognized_text})
+
+        segments = queue.Queue()
+        threading.Thread(target=produce, args=(segments,), daemon=True).start()
+
+        sentences = []
+        synthesized = []
+        tts_failed = False
+        while True:
+            item = segments.get()
+            if item is None:
+                break
+            sentence, future = item
+            audio_bytes = future.result()
+            if audio_bytes is None:
+                print(f"[listen_user_stream] TTS failed for: {sentence}")
+                tts_failed = True
+                continue
+            synthesized.append((sentence, audio_bytes))
+            yield from emit(sentences, sentence, audio_bytes)
+
+        # Only whole replies are cached: not a hit again, nor a stream cut short
+        if sentences and not tts_failed and reply_state.get("complete"):
+            store_reply(current_instruction, reply_state.get("position", 0), recognized_text,
+                        " ".join(sentences), synthesized)
+
+        if not sentences:
+            # Nothing could be synthesized: say the canned line rather than nothing
+            audio_bytes = fallback_audio()
+            if audio_bytes is not None:
+                tts_backend.count("fallback")
+                synthesized.append((FALLBACK_REPLY, audio_bytes))
+                yield from emit(sentences, FALLBACK_REPLY, audio_bytes)
+
+        yield message({"done": True, "chatgpt_response": " ".join(sentences)})
+        turn.record(turn.request_stage, time.time() - turn.start, offset=turn.start)
+        turn.log(sentences=len(sentences), reply_cache_hit=bool(reply_state.get("cached")))
+        if record is not None:
+            for index, (_, audio_bytes) in enumerate(synthesized):
+                record["blobs"][f"reply_{index}"] = audio_bytes
+            archive_turn(record, turn, status=200, position=reply_state.get("position", 0), prompt=prompt_text,
+                         reply=" ".join(sentences), sentences=sentences,
+                         reply_cache_hit=bool(reply_state.get("cached")),
+                         speculated=bool(reply_state.get("speculated")))
+
+    return Response(generate(), mimetype=FRAMES_MIMETYPE if binary_frames else "application/x-ndjson")
+
+
+def cache_fallback_reply():
+    if google_tts_turkish(FALLBACK_REPLY) is not None:
+        print("[warm_up_clients] Fallback reply cached.")
+
+
+def warm_up_clients():
+    """
+    Build the TTS, STT and LLM clients and open their connections (TLS +
+    credentials) in parallel, then pre-synthesize the fallback reply; runs
+    in the background, /ready reports when it is done.
+    """
+    startup.warm_up((tts_client, speech_client, llm_client), then=cache_fallback_reply)
+
+
+def run_server(host="0.0.0.0", port=5000):
+    """
+    Serve with werkzeug's threaded server (one thread per connection). It
+    hands the chunked /listenUserStream body to the app as it arrives, so
+    streaming recognition and the interim-transcript speculation overlap
+    with the upload; servers that buffer the whole body first (waitress)
+    would hold the turn until the robot stops sending. The client warm-up
+    starts first and runs while the server already accepts requests.
+    """
+    from werkzeug.serving import make_server
+    warm_up_clients()
+    make_server(host, port, app, threaded=True).serve_forever()
+
+
+startup.mark("imported")
+
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    run_server()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+session_archive.py
+
+Append-only archive of conversation turns, shared by pepper_bridge.py
+(Python 2.7) and scenario_logic.py (Python 3), and read back by
+benchmark/replay.py.
+
+An archive is a directory holding two files that are only ever appended to:
+ - blobs.bin: raw bytes (captured audio, reply audio) back to back
+ - index.jsonl: one JSON line per turn with its texts, timings and
+   "blobs": {name: [offset, length]} pointing into blobs.bin
+A blob is written before the index line that refers to it, so a crash can
+at worst leave unreferenced bytes behind; readers only trust the index.
+Each process writes its own archive (appends are serialized per process).
+"""
+import io
+import os
+import json
+import threading
+
+INDEX_FILE = "index.jsonl"
+BLOBS_FILE = "blobs.bin"
+
+
+class SessionArchive(object):
+    """
+    Writer and reader of one archive directory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = os.path.join(path, INDEX_FILE)
+        self.blobs_path = os.path.join(path, BLOBS_FILE)
+        self._lock = threading.Lock()
+
+    def append(self, record, blobs=None):
+        """
+        Append one turn: 'record' (JSON-serializable dict) and its named
+        binary 'blobs' ({name: bytes}; empty ones are skipped).
+        """
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        record = dict(record)
+        refs = {}
+        with self._lock:
+            if blobs:
+                with open(self.blobs_path, "ab") as f:
+                    f.seek(0, os.SEEK_END)
+                    for name in sorted(blobs):
+                        data = blobs[name]
+                        if not data:
+                            continue
+                        refs[name] = [f.tell(), len(data)]
+                        f.write(data)
+            record["blobs"] = refs
+            line = json.dumps(record, separators=(",", ":"), sort_keys=True)
+            with open(self.index_path, "ab") as f:
+                f.write(line.encode("ascii") + b"\n")
+
+    def records(self):
+        """
+        Yield every complete record of the index, oldest first.
+        """
+        if not os.path.exists(self.index_path):
+            return
+        with io.open(self.index_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Partly written last line (the writer is still busy or crashed)
+                    break
+                yield json.loads(line.decode("ascii"))
+
+    def blob(self, record, name):
+        """
+        The bytes of blob 'name' of 'record', or None.
+        """
+        ref = record.get("blobs", {}).get(name)
+        if ref is None:
+            return None
+        offset, length = ref
+        with open(self.blobs_path, "rb") as f:
+            f.seek(offset)
+            data = f.read(length)
+        if len(data) != length:
+            raise IOError("truncated blob {!r} in {}".format(name, self.blobs_path))
+        return data
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+session_store.py
+
+Per-robot conversation state for scenario_logic.py.
+
+Every /startScenario call creates a ConversationSession with its own chat
+history and lock; requests name their session in the X-Session-Id header.
+The store is bounded (least recently used sessions are dropped first) and
+sessions that have been idle for longer than 'idle_timeout' expire.
+"""
+
+import time
+import uuid
+import threading
+from collections import OrderedDict
+
+from chat_history import ChatHistory
+
+
+class ConversationSession:
+    """
+    Dialogue state of one robot / participant. 'lock' serializes turns of
+    this session only; other sessions proceed in parallel.
+    """
+
+    def __init__(self, session_id, history_tokens=1500):
+        self.session_id = session_id
+        self.chat_history = ChatHistory(max_tokens=history_tokens)
+        self.lock = threading.Lock()
+        self.created = time.time()
+        self.last_used = self.created
+        # Scenario instruction (current object) and the turns spent on it
+        self.instruction = None
+        self.instruction_turns = 0
+
+    def dialogue_position(self, instruction):
+        """
+        Number of turns already taken under 'instruction' (0 for the first
+        answer about a new object).
+        """
+        return self.instruction_turns if instruction == self.instruction else 0
+
+    def advance_dialogue(self, instruction):
+        if instruction != self.instruction:
+            self.instruction = instruction
+            self.instruction_turns = 0
+        self.instruction_turns += 1
+
+
+class SessionStore:
+    """
+    Bounded, idle-expiring map of session id -> ConversationSession.
+    """
+
+    def __init__(self, max_sessions=64, idle_timeout=30 * 60, history_tokens=1500):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.history_tokens = history_tokens
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire_locked(self, now):
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_used < self.idle_timeout:
+                break
+            del self._sessions[session_id]
+            print(f"[SessionStore] Session {session_id} expired.")
+
+    def create(self, session_id=None):
+        """
+        Start a new session (replacing any session with the same id).
+        """
+        now = time.time()
+        session = ConversationSession(session_id or uuid.uuid4().hex, self.history_tokens)
+        with self._lock:
+            self._expire_locked(now)
+            self._sessions.pop(session.session_id, None)
+            self._sessions[session.session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                evicted_id, _ = self._sessions.popitem(last=False)
+                print(f"[SessionStore] Session {evicted_id} evicted.")
+        return session
+
+    def get(self, session_id):
+        """
+        Return the live session for 'session_id' and mark it as used,
+        or None if it is unknown or expired.
+        """
+        now = time.time()
+        with self._lock:
+            self._expire_locked(now)
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_used = now
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def get_or_create(self, session_id):
+        session = self.get(session_id)
+        if session is None:
+            session = self.create(session_id)
+        return session
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
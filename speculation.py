@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+speculation.py
+
+Speculative execution of the LLM call on interim STT transcripts, for
+scenario_logic.py.
+
+While the user is still talking, streaming recognition keeps revising an
+interim transcript. Speculation.feed() (the on_interim callback) starts the
+call as soon as an interim transcript is stable enough, and starts it again
+when a later one differs materially. Once the final transcript is known,
+take() hands back the speculative result if it was made for a transcript
+that matches the final one closely enough; otherwise the caller makes the
+call itself. Outcomes are counted as speculation_total{outcome}:
+ won        the speculative result was used
+ lost       the final transcript differed; the call was made again
+ restarted  an attempt was superseded by a newer interim transcript
+ failed     the speculative call raised
+ unused     the turn did not need it (e.g. reply cache hit, no transcript)
+ none       no interim transcript was stable enough to speculate on
+"""
+
+import threading
+from difflib import SequenceMatcher
+
+from reply_cache import normalize_transcript
+
+
+def transcript_similarity(a, b):
+    return SequenceMatcher(None, normalize_transcript(a), normalize_transcript(b)).ratio()
+
+
+class Speculation:
+    """
+    One turn's speculative fn(transcript) calls, run on 'executor'.
+
+    An attempt that is already running cannot be stopped; when it is
+    superseded or loses, its result is simply dropped.
+    """
+
+    def __init__(self, executor, fn, metrics, min_stability=0.8, min_words=2, match=0.9, max_attempts=3):
+        self.executor = executor
+        self.fn = fn
+        self.metrics = metrics
+        self.min_stability = min_stability
+        self.min_words = min_words
+        self.match = match
+        self.max_attempts = max_attempts
+
+        self._lock = threading.Lock()
+        self._text = None
+        self._future = None
+        self._attempts = 0
+        self._closed = False
+
+    def _count(self, outcome):
+        self.metrics.inc("speculation_total", outcome=outcome)
+
+    def feed(self, transcript, stability, is_final):
+        """
+        on_interim callback of google_stt_streaming.
+        """
+        if is_final or stability < self.min_stability or len(transcript.split()) < self.min_words:
+            return
+        with self._lock:
+            if self._closed or self._attempts >= self.max_attempts:
+                return
+            if self._text is not None and transcript_similarity(transcript, self._text) >= self.match:
+                return
+            if self._future is not None:
+                self._future.cancel()
+                self._count("restarted")
+            self._text = transcript
+            self._future = self.executor.submit(self.fn, transcript)
+            self._attempts += 1
+
+    def _close(self):
+        with self._lock:
+            text, future = self._text, self._future
+            self._closed = True
+            self._future = None
+            return text, future
+
+    def take(self, final_transcript):
+        """
+        The speculative result for 'final_transcript' (waiting for it if it
+        is still running), or None if there is no matching one.
+        """
+        text, future = self._close()
+        if future is None:
+            self._count("none")
+            return None
+        if transcript_similarity(final_transcript, text) < self.match:
+            future.cancel()
+            self._count("lost")
+            return None
+        try:
+            result = future.result()
+        except Exception as e:
+            print("[Speculation] Speculative call failed:", e)
+            self._count("failed")
+            return None
+        self._count("won")
+        return result
+
+    def discard(self):
+        """
+        Drop the speculation without using it.
+        """
+        text, future = self._close()
+        if future is not None:
+            future.cancel()
+            self._count("unused")
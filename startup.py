@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+startup.py
+
+Fast start-up for scenario_logic.py.
+
+ - LazyClient builds a backend client (importing its library) on first use
+   instead of at import time.
+ - Startup warms all clients up in parallel on background threads while
+   the server already accepts requests, and keeps the timings of every
+   step; /ready reports them and only answers 200 once the warm-up is done.
+"""
+
+import time
+import threading
+
+
+class LazyClient:
+    """
+    A backend client made by 'factory()' on first get() (or by warm_up()).
+    'probe(client)' is an optional cheap call that opens the connection
+    (TLS, credentials) during warm-up.
+
+    state: cold -> warming -> warm | failed
+    """
+
+    def __init__(self, name, factory, probe=None):
+        self.name = name
+        self.factory = factory
+        self.probe = probe
+        self.state = "cold"
+        self.error = None
+        self.timings = {}
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._client is None:
+                start = time.time()
+                self._client = self.factory()
+                self.timings["build_ms"] = round((time.time() - start) * 1000, 1)
+            return self._client
+
+    def set(self, client):
+        """
+        Use 'client' instead of building one (e.g. replay / mock backends).
+        """
+        with self._lock:
+            self._client = client
+
+    def warm_up(self):
+        self.state = "warming"
+        try:
+            client = self.get()
+            if self.probe is not None:
+                start = time.time()
+                self.probe(client)
+                self.timings["probe_ms"] = round((time.time() - start) * 1000, 1)
+            self.state = "warm"
+        except Exception as e:
+            print(f"[LazyClient] {self.name} warm-up failed:", e)
+            self.state = "failed"
+            self.error = str(e)
+
+    def status(self):
+        status = dict(state=self.state, **self.timings)
+        if self.error:
+            status["error"] = self.error
+        return status
+
+
+class Startup:
+    """
+    Start-up phases of the process, in ms since 'started_at'.
+    """
+
+    def __init__(self, started_at):
+        self.started_at = started_at
+        self.timings = {}
+        self.clients = []
+        self.warming = False
+        self.ready = threading.Event()
+
+    def mark(self, phase):
+        self.timings[f"{phase}_ms"] = round((time.time() - self.started_at) * 1000, 1)
+
+    def warm_up(self, clients, then=None):
+        """
+        Warm 'clients' up in parallel, then run 'then()' (e.g. pre-synthesize
+        canned audio) and set 'ready'. Returns at once; does nothing when a
+        warm-up already started.
+        """
+        if self.warming:
+            return
+        self.warming = True
+        self.clients = list(clients)
+        self.mark("warm_up_start")
+
+        def run():
+            threads = [threading.Thread(target=c.warm_up, daemon=True) for c in self.clients]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            if then is not None:
+                try:
+                    then()
+                except Exception as e:
+                    print("[Startup] Warm-up step failed:", e)
+            self.mark("ready")
+            self.ready.set()
+            print(f"[Startup] Ready after {self.timings['ready_ms']:.0f} ms: "
+                  + ", ".join(f"{c.name}={c.state}" for c in self.clients))
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def status(self):
+        return {
+            "ready": self.ready.is_set(),
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "startup": dict(self.timings),
+            "backends": {c.name: c.status() for c in self.clients},
+        }
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+from chat_history import ChatHistory, message_tokens
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def add_pairs(history, n, words=20, first=0):
+    for i in range(first, first + n):
+        history.add("user", "soru {} ".format(i) + "kelime " * words)
+        history.add("assistant", "cevap {} ".format(i) + "kelime " * words)
+
+
+def failing_summarize(previous, turns):
+    raise IOError("summary model down")
+
+
+def test_fold_summarizes_oldest_turns():
+    history = ChatHistory(max_tokens=200)
+    add_pairs(history, 5)
+    assert history.needs_fold()
+    history.fold(lambda previous, turns: "özet {}".format(len(turns)))
+    assert history.summary.startswith("özet")
+    assert sum(message_tokens(m) for m in history.messages()[1:]) <= 200 * history.target_ratio + 100
+    assert not history.needs_fold()
+
+
+def test_failed_fold_backs_off():
+    clock = FakeClock()
+    history = ChatHistory(max_tokens=200, retry_delay=5.0, hard_limit_ratio=100, clock=clock)
+    add_pairs(history, 5)
+    history.fold(failing_summarize)
+    assert history.summary == ""
+    assert not history.needs_fold()
+    clock.advance(5.0)
+    assert history.needs_fold()
+    history.fold(failing_summarize)
+    # The second failure waits twice as long
+    clock.advance(9.9)
+    assert not history.needs_fold()
+    clock.advance(0.1)
+    assert history.needs_fold()
+
+
+def test_backoff_is_capped():
+    clock = FakeClock()
+    history = ChatHistory(max_tokens=200, retry_delay=5.0, max_retry_delay=30.0,
+                          hard_limit_ratio=100, clock=clock)
+    add_pairs(history, 5)
+    for _ in range(10):
+        history.fold(failing_summarize)
+        clock.advance(30.0)
+        assert history.needs_fold()
+
+
+def test_successful_fold_resets_backoff():
+    clock = FakeClock()
+    history = ChatHistory(max_tokens=200, retry_delay=5.0, clock=clock)
+    add_pairs(history, 5)
+    history.fold(failing_summarize)
+    history.fold(failing_summarize)  # still backing off: nothing happens
+    assert history.summary == ""
+    clock.advance(5.0)
+    history.fold(lambda previous, turns: "özet")
+    assert history.summary == "özet"
+    add_pairs(history, 5, first=5)
+    assert history.needs_fold()
+
+
+def test_hard_limit_drops_oldest_turns_while_summaries_fail():
+    history = ChatHistory(max_tokens=200, retry_delay=60.0, hard_limit_ratio=2.0, clock=FakeClock())
+    for i in range(20):
+        add_pairs(history, 1, first=i)
+        if history.needs_fold():
+            history.fold(failing_summarize)
+        assert history.token_count() <= 200 * 2.0
+    messages = history.messages()
+    # Whole pairs were dropped from the front; the latest turns are kept
+    assert messages[0]["role"] == "user" and not messages[0]["content"].startswith("soru 0 ")
+    assert messages[-1]["content"].startswith("cevap 19 ")
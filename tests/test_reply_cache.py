@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+import time
+from difflib import SequenceMatcher
+
+from reply_cache import ReplyCache, negation_count, normalize_transcript
+
+OBJECT = "Şimdi kalem nesnesi. 3 dakikan var. Ne yapabiliriz?"
+LONG = "kalemi kırıp iki parça cetvel yaparız"
+
+
+def segments(n_bytes=10):
+    return [("Harika fikir!", b"\0" * n_bytes)]
+
+
+# ------------------------------------------------------------------------------
+# normalize_transcript
+# ------------------------------------------------------------------------------
+def test_normalize_folds_turkish_dotted_and_dotless_i():
+    assert normalize_transcript("İSTANBUL") == "istanbul"
+    assert normalize_transcript("IŞIK") == "isik"
+    assert normalize_transcript("ışık") == "isik"
+
+
+def test_normalize_folds_diacritics_punctuation_and_spaces():
+    assert normalize_transcript("  Şişe, ÇÖP  kutusu!! ") == "sise cop kutusu"
+    assert normalize_transcript("Güneş...") == "gunes"
+
+
+# ------------------------------------------------------------------------------
+# Lookup
+# ------------------------------------------------------------------------------
+def test_exact_hit_after_normalization():
+    cache = ReplyCache()
+    cache.put(OBJECT, 0, "Su koymak.", "Güzel!", segments())
+    entry = cache.get(OBJECT, 0, "su KOYMAK")
+    assert entry is not None and entry.reply == "Güzel!"
+    assert cache.stats()["hits"] == 1 and cache.stats()["similar_hits"] == 0
+
+
+def test_similar_long_transcript_hits():
+    cache = ReplyCache()
+    cache.put(OBJECT, 0, LONG, "Cetvel olur!", segments())
+    entry = cache.get(OBJECT, 0, LONG + " bence")
+    assert entry is not None and entry.reply == "Cetvel olur!"
+    assert cache.stats()["similar_hits"] == 1
+
+
+def test_dissimilar_transcript_misses():
+    cache = ReplyCache()
+    cache.put(OBJECT, 0, LONG, "Cetvel olur!", segments())
+    assert cache.get(OBJECT, 0, "plastik şişeden saksı yapıp çiçek ekeriz") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_short_negated_answer_does_not_match():
+    # Alike as strings, opposite in meaning
+    assert SequenceMatcher(None, "su koymak", "su koymamak").ratio() >= 0.85
+    cache = ReplyCache()
+    cache.put(OBJECT, 0, "su koymak", "Su koymak güzel fikir!", segments())
+    assert cache.get(OBJECT, 0, "su koymamak") is None
+
+
+def test_long_negated_answer_does_not_match():
+    affirmative = "şişeye su koymak için kullanabiliriz"
+    negated = "şişeye su koymak için kullanamayız"
+    assert SequenceMatcher(None, normalize_transcript(affirmative),
+                           normalize_transcript(negated)).ratio() >= 0.85
+    cache = ReplyCache()
+    cache.put(OBJECT, 0, affirmative, "Harika, su kabı olur!", segments())
+    assert cache.get(OBJECT, 0, negated) is None
+    assert cache.stats()["similar_hits"] == 0
+
+
+def test_negation_count_sees_turkish_negation_markers():
+    pairs = [
+        ("kalemle resim yapıyoruz", "kalemle resim yapmıyoruz"),
+        ("kalemle yazı yazarız", "kalemle yazı yazmazsın"),
+        ("kalemle yazı yazarız", "kalemle yazı yazmayız"),
+        ("bunu kullanmak mümkün", "bunu kullanmak mümkün değil"),
+        ("başka fikrim var", "başka fikrim yok"),
+    ]
+    for affirmative, negated in pairs:
+        assert (negation_count(normalize_transcript(affirmative))
+                != negation_count(normalize_transcript(negated))), negated
+
+
+def test_lookup_stays_within_object_and_position():
+    cache = ReplyCache()
+    cache.put(OBJECT, 0, LONG, "Cetvel olur!", segments())
+    assert cache.get(OBJECT, 1, LONG) is None
+    assert cache.get("Şimdi plastik şişe nesnesi.", 0, LONG) is None
+
+
+def test_empty_transcript_is_neither_cached_nor_found():
+    cache = ReplyCache()
+    cache.put(OBJECT, 0, "...", "Hmm", segments())
+    assert cache.stats()["entries"] == 0
+    assert cache.get(OBJECT, 0, "") is None
+
+
+# ------------------------------------------------------------------------------
+# max_position, TTL and LRU eviction
+# ------------------------------------------------------------------------------
+def test_only_first_positions_are_cached():
+    cache = ReplyCache(max_position=2)
+    assert cache.cacheable(1) and not cache.cacheable(2)
+    cache.put(OBJECT, 2, LONG, "Cetvel olur!", segments())
+    assert cache.stats()["entries"] == 0
+    cache.put(OBJECT, 1, LONG, "Cetvel olur!", segments())
+    assert cache.get(OBJECT, 2, LONG) is None
+    assert cache.get(OBJECT, 1, LONG) is not None
+
+
+def test_entries_expire_after_ttl():
+    cache = ReplyCache(ttl=0.05)
+    cache.put(OBJECT, 0, LONG, "Cetvel olur!", segments())
+    assert cache.get(OBJECT, 0, LONG) is not None
+    time.sleep(0.06)
+    assert cache.get(OBJECT, 0, LONG) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ReplyCache(max_entries=2)
+    cache.put(OBJECT, 0, "birinci fikir", "1", segments())
+    cache.put(OBJECT, 0, "ikinci fikir", "2", segments())
+    assert cache.get(OBJECT, 0, "birinci fikir") is not None
+    cache.put(OBJECT, 0, "üçüncü fikir", "3", segments())
+    assert cache.get(OBJECT, 0, "ikinci fikir") is None
+    assert cache.get(OBJECT, 0, "birinci fikir") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_byte_budget_evicts_and_skips_oversized_replies():
+    cache = ReplyCache(max_bytes=100)
+    cache.put(OBJECT, 0, "birinci fikir", "1", segments(60))
+    cache.put(OBJECT, 0, "ikinci fikir", "2", segments(60))
+    assert cache.stats()["entries"] == 1 and cache.stats()["bytes"] == 60
+    cache.put(OBJECT, 0, "dev fikir", "3", segments(101))
+    assert cache.get(OBJECT, 0, "dev fikir") is None
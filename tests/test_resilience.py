@@ -0,0 +1,178 @@
+import time
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from resilience import BackendUnavailable, CircuitBreaker, ResilientBackend
+
+
+class RecordingMetrics:
+    def __init__(self):
+        self.outcomes = Counter()
+
+    def inc(self, name, amount=1, **labels):
+        self.outcomes[labels.get("outcome")] += amount
+
+
+@pytest.fixture
+def executor():
+    pool = ThreadPoolExecutor(max_workers=4)
+    yield pool
+    pool.shutdown(wait=True)
+
+
+def make_backend(executor, **kwargs):
+    kwargs.setdefault("deadline", 2.0)
+    kwargs.setdefault("hedge_delay", 0.05)
+    kwargs.setdefault("min_hedge_delay", 0.01)
+    return ResilientBackend("llm", executor, RecordingMetrics(), **kwargs)
+
+
+# ------------------------------------------------------------------------------
+# CircuitBreaker
+# ------------------------------------------------------------------------------
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60.0)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_breaker_success_resets_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60.0)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_breaker_half_open_allows_one_trial_then_closes():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    # Only one trial call at a time
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_breaker_half_open_failure_reopens():
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=0.05)
+    for _ in range(5):
+        breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+# ------------------------------------------------------------------------------
+# ResilientBackend.call
+# ------------------------------------------------------------------------------
+def test_call_returns_result(executor):
+    backend = make_backend(executor)
+    assert backend.call(lambda x: x * 2, 21) == 42
+    assert backend.metrics.outcomes["ok"] == 1
+    assert backend.metrics.outcomes["hedged"] == 0
+
+
+def test_hedge_wins_and_loser_is_discarded(executor):
+    backend = make_backend(executor)
+    release = threading.Event()
+    discarded = []
+    calls = []
+
+    def fn():
+        calls.append(None)
+        if len(calls) == 1:
+            # First attempt hangs until the hedge has won
+            release.wait(2.0)
+            return "slow"
+        return "fast"
+
+    def discard(result):
+        discarded.append(result)
+
+    assert backend.call(fn, discard=discard) == "fast"
+    assert backend.metrics.outcomes["hedged"] == 1
+    assert backend.metrics.outcomes["hedge_won"] == 1
+    assert discarded == []
+
+    release.set()
+    deadline = time.time() + 2.0
+    while not discarded and time.time() < deadline:
+        time.sleep(0.01)
+    assert discarded == ["slow"]
+
+
+def test_failed_first_attempt_is_hedged_at_once(executor):
+    backend = make_backend(executor, hedge_delay=1.0)
+    calls = []
+
+    def fn():
+        calls.append(None)
+        if len(calls) == 1:
+            raise IOError("reset")
+        return "ok"
+
+    start = time.time()
+    assert backend.call(fn) == "ok"
+    assert time.time() - start < 0.5
+    assert backend.metrics.outcomes["hedge_won"] == 1
+
+
+def test_deadline_raises_and_discards_late_results(executor):
+    backend = make_backend(executor, deadline=0.1, hedge=False)
+    discarded = []
+
+    def fn():
+        time.sleep(0.3)
+        return "late"
+
+    with pytest.raises(BackendUnavailable):
+        backend.call(fn, discard=discarded.append)
+    assert backend.metrics.outcomes["timeout"] == 1
+    time.sleep(0.4)
+    assert discarded == ["late"]
+
+
+def test_all_attempts_failing_raises_error(executor):
+    backend = make_backend(executor)
+
+    def fn():
+        raise ValueError("bad request")
+
+    with pytest.raises(BackendUnavailable) as excinfo:
+        backend.call(fn)
+    assert isinstance(excinfo.value.__cause__, ValueError)
+    assert backend.metrics.outcomes["error"] == 1
+
+
+def test_open_circuit_short_circuits(executor):
+    backend = make_backend(executor, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=60.0))
+    calls = []
+    backend.record_failure()
+
+    with pytest.raises(BackendUnavailable):
+        backend.call(lambda: calls.append(None))
+    assert calls == []
+    assert backend.metrics.outcomes["short_circuit"] == 1
+
+
+def test_hedge_delay_follows_recent_p95(executor):
+    backend = make_backend(executor, deadline=10.0, hedge_delay=2.0, min_samples=20)
+    assert backend.hedge_delay() == 2.0
+    for i in range(100):
+        backend.record_success(0.01 * (i + 1))
+    assert backend.hedge_delay() == pytest.approx(0.95)
+    backend.deadline = 1.0
+    assert backend.hedge_delay() == 0.5
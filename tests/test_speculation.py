@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from speculation import Speculation, transcript_similarity
+
+
+class RecordingMetrics:
+    def __init__(self):
+        self.outcomes = Counter()
+
+    def inc(self, name, amount=1, **labels):
+        self.outcomes[labels.get("outcome")] += amount
+
+
+@pytest.fixture
+def executor():
+    pool = ThreadPoolExecutor(max_workers=2)
+    yield pool
+    pool.shutdown(wait=True)
+
+
+def make_speculation(executor, fn=None, **kwargs):
+    calls = []
+
+    def reply(transcript):
+        calls.append(transcript)
+        return fn(transcript) if fn is not None else "reply to " + transcript
+
+    return Speculation(executor, reply, RecordingMetrics(), **kwargs), calls
+
+
+def test_transcript_similarity_ignores_case_and_punctuation():
+    assert transcript_similarity("Su koymak.", "su KOYMAK") == 1.0
+    assert transcript_similarity("su koymak", "kalem açmak") < 0.9
+
+
+# ------------------------------------------------------------------------------
+# feed()
+# ------------------------------------------------------------------------------
+def test_unstable_short_or_final_interims_do_not_start_a_call(executor):
+    speculation, calls = make_speculation(executor, min_stability=0.8, min_words=2)
+    speculation.feed("su koymak", 0.5, False)
+    speculation.feed("su", 0.9, False)
+    speculation.feed("su koymak", 0.9, True)
+    assert speculation.take("su koymak") is None
+    assert calls == []
+    assert speculation.metrics.outcomes == Counter(none=1)
+
+
+def test_similar_interim_keeps_the_running_attempt(executor):
+    speculation, calls = make_speculation(executor)
+    speculation.feed("kalemle yazı yazmak", 0.9, False)
+    speculation.feed("kalemle yazı yazmak.", 0.9, False)
+    assert speculation.take("kalemle yazı yazmak") == "reply to kalemle yazı yazmak"
+    assert calls == ["kalemle yazı yazmak"]
+
+
+def test_different_interim_restarts_up_to_max_attempts(executor):
+    speculation, calls = make_speculation(executor, max_attempts=2)
+    speculation.feed("kalemle yazı", 0.9, False)
+    speculation.feed("şişeye su koymak", 0.9, False)
+    speculation.feed("çiçek sulamak için", 0.9, False)
+    assert speculation.take("şişeye su koymak") == "reply to şişeye su koymak"
+    assert len(calls) <= 2
+    assert speculation.metrics.outcomes["restarted"] == 1
+
+
+# ------------------------------------------------------------------------------
+# take() / discard() outcomes
+# ------------------------------------------------------------------------------
+def test_matching_final_transcript_wins(executor):
+    speculation, _ = make_speculation(executor)
+    speculation.feed("şişeye su koymak", 0.9, False)
+    assert speculation.take("Şişeye su koymak.") == "reply to şişeye su koymak"
+    assert speculation.metrics.outcomes == Counter(won=1)
+
+
+def test_take_waits_for_a_running_attempt(executor):
+    release = threading.Event()
+
+    def slow(transcript):
+        assert release.wait(5)
+        return "slow reply"
+
+    speculation, _ = make_speculation(executor, fn=slow)
+    speculation.feed("şişeye su koymak", 0.9, False)
+    threading.Timer(0.05, release.set).start()
+    assert speculation.take("şişeye su koymak") == "slow reply"
+
+
+def test_different_final_transcript_is_discarded(executor):
+    speculation, _ = make_speculation(executor)
+    speculation.feed("şişeye su koymak", 0.9, False)
+    assert speculation.take("kalemle resim çizmek") is None
+    assert speculation.metrics.outcomes == Counter(lost=1)
+
+
+def test_failed_attempt_returns_none(executor):
+    def boom(transcript):
+        raise RuntimeError("LLM down")
+
+    speculation, _ = make_speculation(executor, fn=boom)
+    speculation.feed("şişeye su koymak", 0.9, False)
+    assert speculation.take("şişeye su koymak") is None
+    assert speculation.metrics.outcomes == Counter(failed=1)
+
+
+def test_no_stable_interim_counts_none(executor):
+    speculation, calls = make_speculation(executor)
+    assert speculation.take("şişeye su koymak") is None
+    assert calls == []
+    assert speculation.metrics.outcomes == Counter(none=1)
+
+
+def test_discard_counts_unused_and_closes(executor):
+    speculation, calls = make_speculation(executor)
+    speculation.feed("şişeye su koymak", 0.9, False)
+    speculation.discard()
+    speculation.feed("kalemle resim çizmek", 0.9, False)
+    assert len(calls) <= 1
+    assert speculation.metrics.outcomes == Counter(unused=1)
+
+
+def test_discard_without_attempt_counts_nothing(executor):
+    speculation, _ = make_speculation(executor)
+    speculation.discard()
+    assert speculation.metrics.outcomes == Counter()
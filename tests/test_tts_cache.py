@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import os
+import threading
+
+from tts_cache import TTSCache, tts_cache_key
+
+
+def audio(n_bytes, fill=b"\1"):
+    return fill * n_bytes
+
+
+def test_key_covers_text_and_every_voice_parameter():
+    key = tts_cache_key(u"Merhaba", "tr-TR-Wavenet-D", 0.0, 1.0)
+    assert key == tts_cache_key(u"Merhaba", "tr-TR-Wavenet-D", 0, 1)
+    assert key != tts_cache_key(u"Merhaba!", "tr-TR-Wavenet-D", 0.0, 1.0)
+    assert key != tts_cache_key(u"Merhaba", "tr-TR-Wavenet-E", 0.0, 1.0)
+    assert key != tts_cache_key(u"Merhaba", "tr-TR-Wavenet-D", 2.0, 1.0)
+    assert key != tts_cache_key(u"Merhaba", "tr-TR-Wavenet-D", 0.0, 1.1)
+
+
+# ------------------------------------------------------------------------------
+# Memory tier
+# ------------------------------------------------------------------------------
+def test_memory_hits_and_misses_are_counted():
+    cache = TTSCache(None)
+    assert cache.get("a") is None
+    cache.put("a", audio(10))
+    assert cache.get("a") == audio(10)
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["disk_hits"], stats["misses"]) == (1, 0, 1)
+
+
+def test_memory_lru_stays_within_its_byte_budget():
+    cache = TTSCache(None, max_memory_bytes=100)
+    cache.put("a", audio(40))
+    cache.put("b", audio(40))
+    assert cache.get("a") is not None
+    cache.put("c", audio(40))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    stats = cache.stats()
+    assert stats["memory_bytes"] == 80 and stats["memory_entries"] == 2
+    assert stats["evictions"] == 1
+
+
+def test_oversized_entry_skips_memory():
+    cache = TTSCache(None, max_memory_bytes=100)
+    cache.put("big", audio(101))
+    assert cache.stats()["memory_entries"] == 0
+
+
+def test_empty_audio_is_not_cached(tmp_path):
+    cache = TTSCache(str(tmp_path))
+    cache.put("a", b"")
+    assert cache.stats()["memory_entries"] == 0 and os.listdir(str(tmp_path)) == []
+
+
+# ------------------------------------------------------------------------------
+# Disk tier
+# ------------------------------------------------------------------------------
+def test_disk_entries_survive_a_restart(tmp_path):
+    TTSCache(str(tmp_path)).put("a", audio(10))
+    cache = TTSCache(str(tmp_path))
+    assert cache.stats()["disk_entries"] == 1 and cache.stats()["memory_entries"] == 0
+    assert cache.get("a") == audio(10)
+    assert cache.get("a") == audio(10)
+    stats = cache.stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 0)
+
+
+def test_disk_store_evicts_least_recently_used_files(tmp_path):
+    cache = TTSCache(str(tmp_path), max_memory_bytes=10, max_disk_bytes=100)
+    cache.put("a", audio(40))
+    cache.put("b", audio(40))
+    assert cache.get("a") is not None
+    cache.put("c", audio(40))
+    assert sorted(os.listdir(str(tmp_path))) == ["a.wav", "c.wav"]
+    assert cache.stats()["disk_bytes"] == 80
+
+
+def test_reload_trims_the_disk_store_to_its_budget(tmp_path):
+    big = TTSCache(str(tmp_path))
+    for key in ("a", "b", "c"):
+        big.put(key, audio(40))
+    cache = TTSCache(str(tmp_path), max_disk_bytes=100)
+    assert cache.stats()["disk_entries"] == 2
+    assert len(os.listdir(str(tmp_path))) == 2
+
+
+def test_vanished_file_counts_as_a_miss(tmp_path):
+    cache = TTSCache(str(tmp_path), max_memory_bytes=10)
+    cache.put("a", audio(40))
+    os.remove(os.path.join(str(tmp_path), "a.wav"))
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert stats["misses"] == 1 and stats["disk_entries"] == 0 and stats["disk_bytes"] == 0
+
+
+def test_concurrent_puts_and_gets_keep_the_books_straight(tmp_path):
+    cache = TTSCache(str(tmp_path), max_memory_bytes=400, max_disk_bytes=1000)
+
+    def worker(n):
+        for i in range(50):
+            key = "k{}".format((n * 7 + i) % 30)
+            if cache.get(key) is None:
+                cache.put(key, audio(50))
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats = cache.stats()
+    assert stats["memory_bytes"] <= 400 and stats["disk_bytes"] <= 1000
+    assert stats["disk_bytes"] == 50 * stats["disk_entries"]
+    assert stats["memory_hits"] + stats["disk_hits"] + stats["misses"] == 200
+    assert not [name for name in os.listdir(str(tmp_path)) if name.endswith(".tmp")]
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tts_cache.py
+
+Two-tier cache for synthesized speech used by scenario_logic.py:
+ - an in-memory LRU (bounded by total bytes)
+ - a persistent on-disk store (bounded by total bytes, least recently used
+   files are evicted first)
+
+Entries are content-addressed: the key is a SHA-256 over the text and every
+synthesis parameter (voice name, pitch, speaking rate), so changing the voice
+never serves stale audio.
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def tts_cache_key(text, voice_name, pitch, speaking_rate):
+    """
+    Build the content address for one synthesis request.
+    """
+    raw = u"\x1f".join([
+        text,
+        voice_name,
+        "{:.3f}".format(float(pitch)),
+        "{:.3f}".format(float(speaking_rate)),
+    ])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """
+    In-memory LRU in front of an on-disk store.
+
+    get() looks in memory first, then on disk (promoting disk hits back into
+    memory). put() writes to both tiers. Both tiers evict least recently used
+    entries once their byte budget is exceeded. One lock guards the indexes;
+    files are read, written and removed outside it.
+    """
+
+    def __init__(self, cache_dir, max_memory_bytes=32 * 1024 * 1024,
+                 max_disk_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()   # key -> bytes
+        self._memory_bytes = 0
+        self._disk = OrderedDict()     # key -> size in bytes
+        self._disk_bytes = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._load_disk_index()
+
+    # --------------------------------------------------------------------------
+    # Disk tier
+    # --------------------------------------------------------------------------
+    def _path_for(self, key):
+        return os.path.join(self.cache_dir, key + ".wav")
+
+    def _load_disk_index(self):
+        """
+        Rebuild the disk index from the files already present, oldest access first.
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".wav"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_atime, name[:-4], st.st_size))
+
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._remove_files(self._evict_disk_locked())
+
+    def _read_disk(self, key):
+        try:
+            with open(self._path_for(key), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_disk(self, key, data):
+        """
+        Write the file for 'key' (temp file + rename, so readers never see a
+        partial file). Called without the lock; returns False on failure.
+        """
+        path = self._path_for(key)
+        tmp_path = "{}.{}.tmp".format(path, threading.get_ident())
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print("[TTSCache] Error writing cache file:", e)
+            return False
+        return True
+
+    def _index_disk_locked(self, key, size):
+        """
+        Record a written file and return the keys evicted to stay in budget.
+        """
+        self._disk_bytes -= self._disk.pop(key, 0)
+        self._disk[key] = size
+        self._disk_bytes += size
+        return self._evict_disk_locked()
+
+    def _forget_disk_locked(self, key):
+        self._disk_bytes -= self._disk.pop(key, 0)
+
+    def _evict_disk_locked(self):
+        evicted = []
+        while self._disk_bytes > self.max_disk_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self.evictions += 1
+            evicted.append(key)
+        return evicted
+
+    def _remove_files(self, keys):
+        for key in keys:
+            try:
+                os.remove(self._path_for(key))
+            except OSError:
+                pass
+
+    # --------------------------------------------------------------------------
+    # Memory tier
+    # --------------------------------------------------------------------------
+    def _put_memory(self, key, data):
+        if len(data) > self.max_memory_bytes:
+            return
+        self._memory_bytes -= len(self._memory.pop(key, b""))
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_memory_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.evictions += 1
+
+    # --------------------------------------------------------------------------
+    # Public API
+    # --------------------------------------------------------------------------
+    def get(self, key):
+        """
+        Return cached audio bytes for 'key', or None on a miss.
+        """
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return data
+            on_disk = self.cache_dir and key in self._disk
+            if not on_disk:
+                self.misses += 1
+                return None
+
+        # File I/O happens outside the lock, so memory hits never wait on it
+        data = self._read_disk(key)
+        with self._lock:
+            if data is None:
+                # File vanished underneath us; forget it.
+                self._forget_disk_locked(key)
+                self.misses += 1
+                return None
+            if key in self._disk:
+                self._disk.move_to_end(key)
+            self._put_memory(key, data)
+            self.disk_hits += 1
+            return data
+
+    def put(self, key, data):
+        """
+        Store audio bytes under 'key' in both tiers.
+        """
+        if not data:
+            return
+        with self._lock:
+            self._put_memory(key, data)
+        if not self.cache_dir or not self._write_disk(key, data):
+            return
+        with self._lock:
+            evicted = self._index_disk_locked(key, len(data))
+        self._remove_files(evicted)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+            }